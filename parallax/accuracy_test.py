@@ -15,6 +15,7 @@ from . import get_image_file, data_dir
 from .toggle_switch import ToggleSwitch
 from .stage_dropdown import StageDropdown
 from .helper import FONT_BOLD
+from . import waypoints
 
 
 class AccuracyTestTool(QWidget):
@@ -149,8 +150,9 @@ class AccuracyTestAnalyzeTab(QWidget):
         self.cal_label = QLabel('Calibration:')
         self.cal_label.setAlignment(Qt.AlignCenter)
         self.cal_dropdown = QComboBox()
-        for cal in self.model.calibrations.keys():
-            self.cal_dropdown.addItem(cal)
+        for name, cal in self.model.calibrations.items():
+            if hasattr(cal, 'match_stereo'):
+                self.cal_dropdown.addItem(name)
         self.cal_dropdown.activated.connect(self.handle_cal_selected)
 
         self.transform_label = QLabel('Transform:')
@@ -283,16 +285,12 @@ class AccuracyTestAnalyzeTab(QWidget):
     def update_plots(self):
         if (self.data is not None) and (self.cal is not None):
             # calculate deltas
-            npts = self.data.shape[0]
             coords_stage = self.data[:,:3]
             lipts = self.data[:,3:5]
             ripts = self.data[:,5:]
-            coords_recon = np.zeros((npts,3))
-            for i in range(npts):
-                coords = self.cal.triangulate(lipts[i,:], ripts[i,:])
-                if self.transform is not None:
-                    coords = self.transform.map(coords)
-                coords_recon[i,:] = coords
+            coords_recon = self.cal.triangulate_many(lipts, ripts)
+            if self.transform is not None:
+                coords_recon = np.array([self.transform.map(c) for c in coords_recon])
             delta = coords_recon - coords_stage
             dx = delta[:,0]
             dy = delta[:,1]
@@ -318,13 +316,22 @@ class AccuracyTestWorker(QObject):
         self.extent_um = params['extent_um']
         self.origin = [7500., 7500., 7500.] # hard-wired for now
         self.origin = params['origin']
+        self.telemetry = params.get('telemetry')
 
         self.results = []
 
         self.ready_to_go = False
 
-    def register_corr_points(self, lcorr, rcorr):
-        pos = self.stage.get_position()
+    def register_corr_points(self, lcorr, rcorr, times=None):
+        # times: frame capture times, to look up the stage position in the telemetry
+        pos = None
+        if (self.telemetry is not None) and (times is not None) and (None not in times):
+            pos, moving = self.telemetry.register(times)
+            if moving:
+                self.msg_posted.emit('Warning: stage was moving when the registered frames '
+                                        'were captured.')
+        if pos is None:
+            pos = self.stage.get_position()
         self.results.append(list(pos) + list(lcorr) + list(rcorr))
 
     def carry_on(self):
@@ -339,8 +346,12 @@ class AccuracyTestWorker(QObject):
     def run(self):
         self.ts = time.time()
         self.results = []
+        points = np.array([self.get_random_point(self.origin, self.extent_um) \
+                            for i in range(self.npoints)])
+        points = points[waypoints.plan_order(points, self.stage.get_position(),
+                                                waypoints.get_speeds(self.stage))]
         for i in range(self.npoints):
-            x,y,z = self.get_random_point(self.origin, self.extent_um)
+            x,y,z = points[i]
             self.stage.move_absolute_3d(x,y,z)
             self.point_reached.emit(i,self.npoints)
             self.ready_to_go = False
@@ -0,0 +1,339 @@
+import numpy as np
+import scipy.sparse as sparse
+
+
+NINTR = 9           # fx, fy, cx, cy, k1, k2, p1, p2, k3
+SIGMA_POINTS = 10.  # um, prior on object point corrections
+SIGMA_PIXELS = 1.   # pixels, image point noise (weights the prior)
+MAX_ITER = 100      # Levenberg-Marquardt iterations
+FTOL = 1e-8         # relative cost reduction at convergence
+LAMBDA0 = 1e-8      # initial damping (relative to the diagonal): start near Gauss-Newton
+FD_STEP = np.sqrt(np.finfo(np.float64).eps)     # relative finite-difference step
+
+# robust losses (as in scipy.optimize.least_squares, f_scale = 1): rho(z) and
+# its derivative, for z the squared residual
+LOSSES = {
+    'linear': (lambda z: z, lambda z: np.ones_like(z)),
+    'soft_l1': (lambda z: 2 * (np.sqrt(1 + z) - 1), lambda z: 1 / np.sqrt(1 + z)),
+    'huber': (lambda z: np.where(z <= 1, z, 2 * np.sqrt(z) - 1),
+                lambda z: np.where(z <= 1, 1., 1 / np.sqrt(np.maximum(z, 1.)))),
+    'cauchy': (lambda z: np.log1p(z), lambda z: 1 / (1 + z)),
+    'arctan': (lambda z: np.arctan(z), lambda z: 1 / (1 + z**2)),
+}
+
+
+def rodrigues(rvecs):
+    # rotation vectors (K,3) -> rotation matrices (K,3,3)
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape((-1,3))
+    theta = np.linalg.norm(rvecs, axis=1)
+    k = rvecs / np.where(theta > 0, theta, 1.)[:,None]
+    K = np.zeros((len(rvecs),3,3))
+    K[:,0,1], K[:,0,2] = -k[:,2], k[:,1]
+    K[:,1,0], K[:,1,2] = k[:,2], -k[:,0]
+    K[:,2,0], K[:,2,1] = -k[:,1], k[:,0]
+    s = np.sin(theta)[:,None,None]
+    c = np.cos(theta)[:,None,None]
+    return np.eye(3) + s*K + (1-c) * (K @ K)
+
+def rotation_vectors(R):
+    # rotation matrices (K,3,3) -> rotation vectors (K,3). The antisymmetric
+    # part of R gives sin(theta) times the axis, which vanishes at theta = pi,
+    # so for theta > pi/2 the axis comes from the symmetric part instead
+    R = np.asarray(R, dtype=np.float64).reshape((-1,3,3))
+    w = np.stack((R[:,2,1] - R[:,1,2], R[:,0,2] - R[:,2,0], R[:,1,0] - R[:,0,1]), axis=1)
+    sin = np.linalg.norm(w, axis=1) / 2.
+    cos = (np.trace(R, axis1=1, axis2=2) - 1.) / 2.
+    theta = np.arctan2(sin, cos)
+    scale = np.where(sin > 1e-300, theta / (2*np.where(sin > 1e-300, sin, 1.)), 0.5)
+    rvecs = w * scale[:,None]
+    for i in np.flatnonzero(cos < 0):
+        # (R + R^T)/2 = cos I + (1 - cos) k k^T; use k's largest component
+        kk = ((R[i] + R[i].T) / 2. - cos[i] * np.eye(3)) / (1. - cos[i])
+        j = np.argmax(np.diag(kk))
+        k = kk[:,j] / np.sqrt(kk[j,j])
+        if np.dot(k, w[i]) < 0:
+            k = -k
+        rvecs[i] = theta[i] * k
+    return rvecs
+
+def intrinsics_vector(mtx, dist):
+    d = np.asarray(dist, dtype=np.float64).ravel()[:5]
+    return np.array([mtx[0,0], mtx[1,1], mtx[0,2], mtx[1,2], d[0], d[1], d[2], d[3], d[4]])
+
+def intrinsics_matrices(intr):
+    mtx = np.array([[intr[0], 0., intr[2]],
+                    [0., intr[1], intr[3]],
+                    [0., 0., 1.]])
+    dist = np.array([[intr[4], intr[5], intr[6], intr[7], intr[8]]])
+    return mtx, dist
+
+def project(obj_points, R, t, intr):
+    """
+    Pinhole projection with the OpenCV 5-coefficient distortion model.
+    obj_points (npose,npts,3), R (npose,3,3), t (npose,3) -> (npose,npts,2)
+    """
+    fx, fy, cx, cy, k1, k2, p1, p2, k3 = intr
+    pc = obj_points @ np.swapaxes(R, 1, 2) + t[:,None,:]
+    x = pc[...,0] / pc[...,2]
+    y = pc[...,1] / pc[...,2]
+    r2 = x*x + y*y
+    radial = 1 + r2*(k1 + r2*(k2 + r2*k3))
+    xd = x*radial + 2*p1*x*y + p2*(r2 + 2*x*x)
+    yd = y*radial + p1*(r2 + 2*y*y) + 2*p2*x*y
+    return np.stack((fx*xd + cx, fy*yd + cy), axis=-1)
+
+
+class BundleAdjustment:
+
+    """
+    Joint refinement of both cameras' intrinsics, distortion and extrinsics
+    (and optionally corrections to the object points) by minimizing the
+    reprojection error over all poses, with a sparse finite-difference Jacobian.
+
+    Extrinsics are either per camera and pose (rig=None), or per pose for
+    camera 1 plus a fixed camera 1 -> camera 2 transform (rig=(R,T)). The rig
+    rotation is parametrized about the centroid of the object in camera 1's
+    frame rather than camera 1's center, which is far away (~10 cm) compared
+    to the object's size, so that the rotation and translation decouple.
+    Object point corrections are shared across poses when all poses see the
+    same object (e.g. a checkerboard), and are kept small by a Gaussian prior.
+
+    parameter layout: [intr1, intr2, rig, poses1, poses2, corrections]
+    """
+
+    def __init__(self, obj_points, img_points1, img_points2, intr1, intr2,
+                    rvecs1, tvecs1, rvecs2=None, tvecs2=None, rig=None,
+                    fix_intrinsics=False, refine_points=False, sigma_points=SIGMA_POINTS,
+                    mask=None):
+        self.obj_points = np.asarray(obj_points, dtype=np.float64)
+        self.img_points = (np.asarray(img_points1, dtype=np.float64),
+                            np.asarray(img_points2, dtype=np.float64))
+        self.npose, self.npts = self.obj_points.shape[:2]
+        self.is_rig = rig is not None
+        self.shared = bool(np.all(self.obj_points == self.obj_points[0]))
+        self.ncorr = self.npts if self.shared else self.npose * self.npts
+        self.sigma_points = sigma_points
+        # (npose,npts) inlier mask; outliers get zero weight
+        self.mask = np.ones((self.npose, self.npts), dtype=bool) if mask is None \
+                        else np.asarray(mask, dtype=bool)
+        self.weights = np.repeat(self.mask.ravel(), 2).astype(np.float64) / SIGMA_PIXELS
+
+        poses1 = np.concatenate((np.reshape(rvecs1, (-1,3)), np.reshape(tvecs1, (-1,3))), axis=1)
+        if self.is_rig:
+            R, T = rig
+            R1 = rodrigues(poses1[:,:3])
+            self.pivot = np.mean(self.obj_points @ np.swapaxes(R1, 1, 2) + poses1[:,None,3:],
+                                    axis=(0,1))
+            rig_params = np.concatenate((rotation_vectors(R)[0],
+                                            np.ravel(T) + R @ self.pivot - self.pivot))
+            poses2 = np.zeros((0,6))
+        else:
+            rig_params = np.zeros(0)
+            poses2 = np.concatenate((np.reshape(rvecs2, (-1,3)), np.reshape(tvecs2, (-1,3))),
+                                    axis=1)
+        corr = np.zeros(self.ncorr * 3)
+        blocks = [intr1, intr2, rig_params, poses1.ravel(), poses2.ravel(), corr]
+        sizes = [len(b) for b in blocks]
+        self.offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self.p0 = np.concatenate(blocks).astype(np.float64)
+
+        free = np.ones(len(self.p0), dtype=bool)
+        if fix_intrinsics:
+            free[:2*NINTR] = False
+        if not refine_points:
+            free[self.offsets[5]:] = False
+        self.free = np.flatnonzero(free)
+        self.refine_points = refine_points
+
+    def block(self, p, i):
+        return p[self.offsets[i]:self.offsets[i+1]]
+
+    def unpack(self, p):
+        intr1, intr2 = self.block(p, 0), self.block(p, 1)
+        poses1 = self.block(p, 3).reshape((-1,6))
+        R1, t1 = rodrigues(poses1[:,:3]), poses1[:,3:]
+        if self.is_rig:
+            Rr, Tr = self.rig_transform(p)
+            R2 = Rr @ R1
+            t2 = t1 @ Rr.T + Tr
+        else:
+            poses2 = self.block(p, 4).reshape((-1,6))
+            R2, t2 = rodrigues(poses2[:,:3]), poses2[:,3:]
+        corr = self.block(p, 5).reshape((-1,3))
+        return intr1, intr2, (R1, t1), (R2, t2), corr
+
+    def rig_transform(self, p):
+        # camera 1 -> camera 2 (R, T) from the rig parameters (rotation about the pivot)
+        rig = self.block(p, 2)
+        Rr = rodrigues(rig[:3])[0]
+        return Rr, rig[3:] + self.pivot - Rr @ self.pivot
+
+    def object_points(self, corr):
+        if self.shared:
+            return self.obj_points + corr[None,:,:]
+        return self.obj_points + corr.reshape(self.obj_points.shape)
+
+    def reprojection(self, p):
+        intr1, intr2, (R1, t1), (R2, t2), corr = self.unpack(p)
+        obj = self.object_points(corr)
+        return project(obj, R1, t1, intr1), project(obj, R2, t2, intr2)
+
+    def residuals(self, x):
+        p = self.p0.copy()
+        p[self.free] = x
+        proj1, proj2 = self.reprojection(p)
+        res = [(proj1 - self.img_points[0]).ravel() * self.weights,
+                (proj2 - self.img_points[1]).ravel() * self.weights]
+        if self.refine_points:
+            res.append(self.block(p, 5) / self.sigma_points)
+        return np.concatenate(res)
+
+    def sparsity(self):
+        # rows: [cam1 (pose, point, uv), cam2 (pose, point, uv), prior]
+        nobs = self.npose * self.npts * 2
+        pose = np.repeat(np.arange(self.npose), self.npts * 2)
+        point = np.tile(np.repeat(np.arange(self.npts), 2), self.npose)
+        if not self.shared:
+            point = pose * self.npts + point
+        rows, cols = [], []
+        def connect(r, c):
+            # every row in r depends on every column in c (same leading length)
+            r = np.asarray(r)[:,None] + np.zeros_like(c)
+            rows.append(np.ravel(r))
+            cols.append(np.ravel(c))
+        for cam in (0, 1):
+            r = cam * nobs + np.arange(nobs)
+            connect(r, self.offsets[cam] + np.tile(np.arange(NINTR), (nobs,1)))
+            connect(r, self.offsets[3] + 6*pose[:,None] + np.arange(6))
+            if cam == 1:
+                if self.is_rig:
+                    connect(r, self.offsets[2] + np.tile(np.arange(6), (nobs,1)))
+                else:
+                    connect(r, self.offsets[4] + 6*pose[:,None] + np.arange(6))
+            connect(r, self.offsets[5] + 3*point[:,None] + np.arange(3))
+        nres = 2 * nobs
+        if self.refine_points:
+            r = 2*nobs + np.arange(3*self.ncorr)
+            connect(r, (self.offsets[5] + np.arange(3*self.ncorr))[:,None])
+            nres += 3 * self.ncorr
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        if not self.is_rig:
+            # camera 2 doesn't depend on camera 1's poses
+            keep = ~((rows >= nobs) & (rows < 2*nobs) & (cols >= self.offsets[3]) & \
+                        (cols < self.offsets[4]))
+            rows, cols = rows[keep], cols[keep]
+        J = sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                                shape=(nres, len(self.p0))).tocsc()
+        return J[:,self.free]
+
+    def jacobian(self, x, f0, S, groups):
+        # forward differences; the columns of a group share no rows (see column_groups)
+        h = FD_STEP * np.maximum(1., np.abs(x))
+        data = np.zeros(len(S.indices))
+        for g in range(groups.max() + 1):
+            cols = np.flatnonzero(groups == g)
+            x1 = x.copy()
+            x1[cols] += h[cols]
+            df = self.residuals(x1) - f0
+            for j in cols:
+                k0, k1 = S.indptr[j], S.indptr[j+1]
+                data[k0:k1] = df[S.indices[k0:k1]] / h[j]
+        return sparse.csc_matrix((data, S.indices, S.indptr), shape=S.shape)
+
+    def solve(self, loss='linear', max_nfev=None, verbose=0):
+        """
+        Levenberg-Marquardt with a sparse finite-difference Jacobian and exact
+        steps from the normal equations (small: intrinsics, rig and poses),
+        robust losses by iterative reweighting. An iterative (LSMR) trust-region
+        solver needed hundreds of iterations here, since the focal lengths and
+        the viewing distances are strongly correlated.
+        """
+        rho, drho = LOSSES[loss]
+        max_iter = MAX_ITER if max_nfev is None else max_nfev
+        S = self.sparsity()
+        groups = column_groups(S)
+        x = self.p0[self.free].copy()
+        f = self.residuals(x)
+        cost = 0.5 * np.sum(rho(f*f))
+        cost0 = cost
+        nfev, lam, success = 1, LAMBDA0, False
+        message = 'maximum number of iterations reached'
+        for it in range(max_iter):
+            J = self.jacobian(x, f, S, groups)
+            nfev += groups.max() + 1
+            w = np.sqrt(drho(f*f))
+            Jw = sparse.diags(w) @ J
+            A = (Jw.T @ Jw).toarray()
+            g = Jw.T @ (w * f)
+            D = np.maximum(np.diag(A), 1e-12 * np.max(np.diag(A)))
+            while True:
+                dx = -np.linalg.solve(A + lam * np.diag(D), g)
+                f_new = self.residuals(x + dx)
+                cost_new = 0.5 * np.sum(rho(f_new*f_new))
+                nfev += 1
+                if cost_new < cost:
+                    break
+                lam *= 4.
+                if lam > 1e12:
+                    break
+            if verbose:
+                print('iteration %d: cost %.6g, lambda %.1e' % (it, min(cost, cost_new), lam))
+            if not (cost_new < cost):
+                success, message = True, 'no further reduction in cost'
+                break
+            x, f, reduction, cost = x + dx, f_new, cost - cost_new, cost_new
+            lam = max(lam / 3., 1e-12)
+            if reduction < FTOL * cost:
+                success, message = True, 'ftol termination condition is satisfied'
+                break
+        p = self.p0.copy()
+        p[self.free] = x
+        intr1, intr2, (R1, t1), (R2, t2), corr = self.unpack(p)
+        proj1, proj2 = self.reprojection(p)
+        rmse1 = np.sqrt(np.mean(np.sum((proj1 - self.img_points[0])**2, axis=-1)[self.mask]))
+        rmse2 = np.sqrt(np.mean(np.sum((proj2 - self.img_points[1])**2, axis=-1)[self.mask]))
+        mtx1, dist1 = intrinsics_matrices(intr1)
+        mtx2, dist2 = intrinsics_matrices(intr2)
+        rvecs1 = rotation_vectors(R1)
+        rvecs2 = rotation_vectors(R2)
+        refined = {
+            'mtx1': mtx1, 'dist1': dist1, 'mtx2': mtx2, 'dist2': dist2,
+            'rvecs1': tuple(r.reshape((3,1)) for r in rvecs1),
+            'tvecs1': tuple(t.reshape((3,1)) for t in t1),
+            'rvecs2': tuple(r.reshape((3,1)) for r in rvecs2),
+            'tvecs2': tuple(t.reshape((3,1)) for t in t2),
+            'obj_points': self.object_points(corr).astype(np.float32),
+            'rmse_reproj_1': rmse1,
+            'rmse_reproj_2': rmse2,
+            'nfev': nfev,
+            'cost': cost,
+            'initial_cost': cost0,
+            'success': success,
+            'message': message,
+        }
+        if self.is_rig:
+            Rr, Tr = self.rig_transform(p)
+            refined['R'] = Rr
+            refined['T'] = Tr.reshape((3,1))
+        return refined
+
+
+def column_groups(S):
+    """
+    Greedy grouping of the columns of a sparsity pattern (sparse, CSC) such
+    that the columns of a group share no rows: one residual evaluation per
+    group then gives all of its columns' finite differences.
+    """
+    groups = np.full(S.shape[1], -1)
+    masks = []
+    for j in range(S.shape[1]):
+        rows = S.indices[S.indptr[j]:S.indptr[j+1]]
+        for g, mask in enumerate(masks):
+            if not mask[rows].any():
+                break
+        else:
+            g = len(masks)
+            masks.append(np.zeros(S.shape[0], dtype=bool))
+        masks[g][rows] = True
+        groups[j] = g
+    return groups
@@ -3,18 +3,42 @@ from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGridLayout, QMenu, QCheck
 from PyQt5.QtWidgets import QTabWidget 
 from PyQt5.QtWidgets import QFileDialog, QLineEdit, QListWidget, QListWidgetItem, QAbstractItemView
 from PyQt5.QtGui import QIcon, QDrag
-from PyQt5.QtCore import QSize, pyqtSignal, Qt 
+from PyQt5.QtCore import QSize, pyqtSignal, Qt, QObject, QThread
 
 import numpy as np
 import time
 import datetime
 import cv2
 import os
-import pickle
 
 from . import get_image_file, data_dir
 from .helper import FONT_BOLD, WF, HF
-from .calibration import Calibration
+from .calibration import Calibration, convergence_warning
+from . import store
+from .pose_selection import select_poses
+
+class RefineWorker(QObject):
+
+    """
+    Bundle adjustment of a calibration (see Calibration.refine), which takes
+    seconds at a few hundred poses, off the GUI thread.
+    """
+
+    finished = pyqtSignal()
+
+    def __init__(self, cal, refine_points):
+        QObject.__init__(self)
+        self.cal = cal
+        self.refine_points = refine_points
+        self.error = None
+
+    def run(self):
+        try:
+            self.cal.refine(refine_points=self.refine_points)
+        except np.linalg.LinAlgError as e:
+            self.error = str(e)
+        self.finished.emit()
+
 
 class CalibrateStereoCornersTool(QWidget):
     msg_posted = pyqtSignal(str)
@@ -57,6 +81,25 @@ class CalibrateStereoCornersTool(QWidget):
         self.int2_button.setEnabled(False)
         self.int2_button.clicked.connect(self.load_int2)
 
+        self.refine_label = QLabel('Bundle Adjustment')
+        self.refine_label.setAlignment(Qt.AlignCenter)
+        self.refine_check = QCheckBox()
+        self.refine_check.setToolTip('Jointly refine both cameras after calibrating')
+        self.refine_check.stateChanged.connect(self.handle_refine_check)
+        self.refine_points_label = QLabel('Refine Object Points')
+        self.refine_points_label.setAlignment(Qt.AlignCenter)
+        self.refine_points_check = QCheckBox()
+        self.refine_points_check.setToolTip('Also estimate small corrections to the '
+                                            'checkerboard geometry')
+        self.refine_points_check.setEnabled(False)
+
+        self.select_label = QLabel('Select Poses')
+        self.select_label.setAlignment(Qt.AlignCenter)
+        self.select_check = QCheckBox()
+        self.select_check.setToolTip('Calibrate on the smallest subset of poses that '
+                                        'covers both frames with diverse tilts')
+        self.select_check.setChecked(True)
+
         self.generate_button = QPushButton('Generate Calibration')
         self.generate_button.clicked.connect(self.generate_calibration)
         self.generate_button.setEnabled(False)
@@ -72,7 +115,13 @@ class CalibrateStereoCornersTool(QWidget):
         layout.addWidget(self.int1_button, 4,1, 1,1)
         layout.addWidget(self.int2_label, 5,0, 1,1)
         layout.addWidget(self.int2_button, 5,1, 1,1)
-        layout.addWidget(self.generate_button, 6,0, 1,2)
+        layout.addWidget(self.refine_label, 6,0, 1,1)
+        layout.addWidget(self.refine_check, 6,1, 1,1)
+        layout.addWidget(self.refine_points_label, 7,0, 1,1)
+        layout.addWidget(self.refine_points_check, 7,1, 1,1)
+        layout.addWidget(self.select_label, 8,0, 1,1)
+        layout.addWidget(self.select_check, 8,1, 1,1)
+        layout.addWidget(self.generate_button, 9,0, 1,2)
 
         self.setLayout(layout)
         self.setMinimumWidth(350)
@@ -84,20 +133,21 @@ class CalibrateStereoCornersTool(QWidget):
         self.int1_button.setEnabled(self.intrinsics_check.checkState())
         self.int2_button.setEnabled(self.intrinsics_check.checkState())
 
+    def handle_refine_check(self):
+        self.refine_points_check.setEnabled(self.refine_check.isChecked())
+
     def load_int1(self):
         filename = QFileDialog.getOpenFileName(self, 'Load intrinsics file', data_dir,
-                                                    'Pickle files (*.pkl)')[0]
+                                                    'Intrinsics files (*.npz *.pkl)')[0]
         if filename:
-            with open(filename, 'rb') as f:
-                self.int1 = pickle.load(f)
+            self.int1 = store.load(filename)
             self.int1_button.setText(os.path.basename(self.int1.name))
 
     def load_int2(self):
         filename = QFileDialog.getOpenFileName(self, 'Load intrinsics file', data_dir,
-                                                    'Pickle files (*.pkl)')[0]
+                                                    'Intrinsics files (*.npz *.pkl)')[0]
         if filename:
-            with open(filename, 'rb') as f:
-                self.int2 = pickle.load(f)
+            self.int2 = store.load(filename)
             self.int2_button.setText(os.path.basename(self.int2.name))
 
     def load_corners(self):
@@ -122,8 +172,49 @@ class CalibrateStereoCornersTool(QWidget):
         if self.intrinsics_check.isChecked():
             self.cal.set_initial_intrinsics(self.int1.mtx, self.int2.mtx,
                                             self.int1.dist, self.int2.dist, fixed=True)
-        self.cal.calibrate(self.lipts, self.ripts, self.opts)
+        lipts, ripts, opts = self.lipts, self.ripts, self.opts
+        if self.select_check.isChecked():
+            selected, coverage = select_poses([lipts, ripts], opts)
+            self.msg_posted.emit('Selected %d of %d poses (coverage %.0f%%)' % \
+                                    (len(selected), len(opts), 100 * coverage))
+            lipts, ripts, opts = lipts[selected], ripts[selected], opts[selected]
+        self.cal.calibrate(lipts, ripts, opts)
+        if self.refine_check.isChecked():
+            self.start_refine_thread()
+        else:
+            self.finish_calibration()
+
+    def start_refine_thread(self):
+        self.rmse_before = self.cal.rmse
+        self.generate_button.setEnabled(False)
+        self.generate_button.setText('Refining...')
+        self.refine_thread = QThread()
+        self.refine_worker = RefineWorker(self.cal, self.refine_points_check.isChecked())
+        self.refine_worker.moveToThread(self.refine_thread)
+        self.refine_thread.started.connect(self.refine_worker.run)
+        self.refine_worker.finished.connect(self.refine_thread.quit)
+        self.refine_thread.finished.connect(self.handle_refine_finished)
+        self.refine_worker.finished.connect(self.refine_worker.deleteLater)
+        self.refine_thread.finished.connect(self.refine_thread.deleteLater)
+        self.msg_posted.emit('Bundle adjustment running...')
+        self.refine_thread.start()
+
+    def handle_refine_finished(self):
+        self.generate_button.setText('Generate Calibration')
+        self.generate_button.setEnabled(True)
+        if self.refine_worker.error is not None:
+            self.msg_posted.emit('Bundle adjustment failed (%s), keeping the calibration '
+                                    'before refinement' % self.refine_worker.error)
+        else:
+            self.msg_posted.emit('Bundle adjustment: RMSE %.2f -> %.2f um' % \
+                                    (self.rmse_before, self.cal.rmse))
+        self.finish_calibration()
+
+    def finish_calibration(self):
         self.msg_posted.emit('Generated %s' % self.cal.name)
+        warning = convergence_warning(self.cal.convergence)
+        if warning is not None:
+            self.msg_posted.emit(warning)
         self.msg_posted.emit('RMSE = %.2f um' % self.cal.rmse)
         self.model.add_calibration(self.cal)
         self.cal_generated.emit()
@@ -2,11 +2,14 @@
 
 import numpy as np
 import cv2
+import time
+from concurrent.futures import ThreadPoolExecutor
 from . import lib
+from . import bundle_adjustment
+from . import triangulation
+from .bundle_adjustment import BundleAdjustment, SIGMA_POINTS, SIGMA_PIXELS
 from .helper import WF, HF
 
-from .transform import TransformNP, TransformRT, TransformSRT
-
 
 imtx = np.array([[1.5e+04, 0.0e+00, 2e+03],
                 [0.0e+00, 1.5e+04, 1.5e+03],
@@ -16,10 +19,236 @@ imtx = np.array([[1.5e+04, 0.0e+00, 2e+03],
 idist = np.array([[ 0e+00, 0e+00, 0e+00, 0e+00, 0e+00 ]],
                     dtype=np.float32)
 
-CRIT = (cv2.TERM_CRITERIA_EPS, 0, 1e-8)
+CRIT = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 200, 1e-8)
+CRIT_WARM = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 10, 1e-8)
+
+CONVERGENCE_TOL = 0.1   # remaining Gauss-Newton step at a converged solution, in std devs
+STEP_RCOND = 1e-4       # relative curvature of the directions left out of that step
+
+RANSAC_THRESHOLD = 4.   # pixels, reprojection error of a linear (DLT) camera model
+
+EPIPOLAR_DIST_MAX = 10.  # pixels
+
+
+def calibrate_camera(obj_points, img_points, mtx, dist, flags, criteria):
+    """
+    Single-camera calibration. The initial intrinsics are copied, since OpenCV
+    may refine them in place. Returns (rmse, mtx, dist, rvecs, tvecs,
+    std_intrinsics, per_view_errors, step, hit_cap), where step is the
+    remaining Gauss-Newton step (see camera_step) and hit_cap whether the
+    solver was still iterating at the iteration cap.
+    """
+    def solve(criteria):
+        return cv2.calibrateCameraExtended(obj_points, img_points, (WF, HF),
+                                            np.array(mtx, dtype=np.float64),
+                                            np.array(dist, dtype=np.float64),
+                                            flags=flags, criteria=criteria)
+    rmse, mtx_, dist_, rvecs, tvecs, std_int, _, per_view = solve(criteria)
+    step = camera_step(obj_points, img_points, mtx_, dist_, rvecs, tvecs, flags)
+    hit_cap = (step >= CONVERGENCE_TOL) and stopped_at_cap(solve, criteria, (mtx_, dist_))
+    return rmse, mtx_, dist_, rvecs, tvecs, std_int.ravel()[:9], per_view.ravel(), step, \
+            hit_cap
+
+def convergence_warning(convergence):
+    # message for a calibration's convergence dict, None if it converged
+    if convergence['converged']:
+        return None
+    if convergence['hit_cap']:
+        return 'Warning: the solver stopped at its iteration cap (%d) before converging' % \
+                    convergence['max_iter']
+    step = max(np.max(convergence[key]) for key in ('step', 'step1', 'step2', 'step_stereo') \
+                if key in convergence)
+    return 'Warning: the solver stopped before converging (remaining step %.1f std devs)' % \
+                step
+
+def stopped_at_cap(solve, criteria, result, first=1):
+    """
+    Whether an OpenCV solver stopped at the iteration cap of criteria, rather
+    than on its tolerance (OpenCV doesn't report which): solve(criteria) is
+    rerun one iteration short, which only changes the result in that case.
+    result: arrays of the full run, compared with the outputs of the shorter
+    run from index first on.
+    """
+    if not (criteria[0] & cv2.TERM_CRITERIA_COUNT) or (criteria[1] <= 1):
+        return False
+    shorter = solve((criteria[0], criteria[1] - 1, criteria[2]))[first:]
+    return not all(np.array_equal(a, b) for a, b in zip(result, shorter))
+
+def remaining_step(A, g, ss, nres):
+    """
+    Largest Gauss-Newton step from normal equations A dx = g (residual sum of
+    squares ss over nres residuals), relative to each parameter's standard
+    deviation. Near 0 at a converged least-squares solution; of order 1 or
+    more if the solver stopped early (e.g. at the iteration cap).
+
+    The step leaves out directions with curvature below STEP_RCOND (relative,
+    with A scaled to unit diagonal), such as the higher-order distortion
+    terms of a single-pose calibration: the cost is nearly flat along them,
+    so the solver stops wherever its tolerance is met, and their (round-off
+    dominated) gradient says nothing about convergence.
+    """
+    free = np.diag(A) > 0
+    A, g = A[np.ix_(free, free)], g[free]
+    scale = 1. / np.sqrt(np.diag(A))
+    w, V = np.linalg.eigh(A * np.outer(scale, scale))
+    w = np.maximum(w, np.finfo(np.float64).eps * w[-1])
+    keep = w > STEP_RCOND * w[-1]
+    step = scale * (V[:,keep] @ ((V[:,keep].T @ (g * scale)) / w[keep]))
+    var = scale**2 * ((V**2) @ (1. / w)) * ss / max(nres - len(g), 1)
+    return float(np.max(np.abs(step) / np.sqrt(var)))
+
+def intrinsics_mask(flags, ndist):
+    # which of fx, fy, cx, cy, distortion coefficients a calibration estimates
+    free = np.ones(4 + ndist, dtype=bool)
+    if flags & cv2.CALIB_FIX_FOCAL_LENGTH:
+        free[0:2] = False
+    if flags & cv2.CALIB_FIX_PRINCIPAL_POINT:
+        free[2:4] = False
+    for k, flag in ((0, cv2.CALIB_FIX_K1), (1, cv2.CALIB_FIX_K2), (4, cv2.CALIB_FIX_K3)):
+        if (flags & flag) and (k < ndist):
+            free[4+k] = False
+    if flags & cv2.CALIB_FIX_TANGENT_DIST:
+        free[6:8] = False
+    return free
+
+def camera_step(obj_points, img_points, mtx, dist, rvecs, tvecs, flags):
+    """
+    Remaining Gauss-Newton step (see remaining_step) of a single-camera
+    calibration at its solution, over the estimated intrinsics and the
+    per-view extrinsics. OpenCV doesn't report whether its solver stopped
+    at the iteration cap, so this checks the solution itself.
+    """
+    nview = len(obj_points)
+    ndist = np.size(dist)
+    free = intrinsics_mask(flags, ndist)
+    nint = 4 + ndist
+    n = nint + 6 * nview
+    A = np.zeros((n,n))
+    g = np.zeros(n)
+    ss, nres = 0., 0
+    for i in range(nview):
+        obj = np.asarray(obj_points[i], dtype=np.float64).reshape((-1,3))
+        proj, J = cv2.projectPoints(obj, rvecs[i], tvecs[i], mtx, dist)
+        r = (np.asarray(img_points[i], dtype=np.float64).reshape((-1,2)) - \
+                proj.reshape((-1,2))).ravel()
+        # jacobian columns: rvec, tvec, fx, fy, cx, cy, distortion
+        Jv = np.hstack((J[:,6:6+nint] * free, J[:,:6]))
+        idx = np.r_[0:nint, nint+6*i:nint+6*i+6]
+        A[np.ix_(idx, idx)] += Jv.T @ Jv
+        g[idx] += Jv.T @ r
+        ss += r @ r
+        nres += len(r)
+    return remaining_step(A, g, ss, nres)
+
+def stereo_step(obj_points, img_points1, img_points2, mtx1, dist1, mtx2, dist2,
+                    rvecs, tvecs, R, T):
+    """
+    Remaining Gauss-Newton step (see remaining_step) of a stereo calibration
+    with fixed intrinsics, over camera 1's per-view extrinsics and the camera
+    1 -> camera 2 transform (R, T).
+    """
+    nview = len(obj_points)
+    n = 6 * nview + 6
+    A = np.zeros((n,n))
+    g = np.zeros(n)
+    ss, nres = 0., 0
+    rvec12 = cv2.Rodrigues(np.asarray(R, dtype=np.float64))[0]
+    tvec12 = np.asarray(T, dtype=np.float64).reshape((3,1))
+    for i in range(nview):
+        obj = np.asarray(obj_points[i], dtype=np.float64).reshape((-1,3))
+        rvec, tvec = np.reshape(rvecs[i], (3,1)), np.reshape(tvecs[i], (3,1))
+        rvec2, tvec2, dr2dr, dr2dt, dr2dr12, dr2dt12, dt2dr, dt2dt, dt2dr12, dt2dt12 = \
+            cv2.composeRT(rvec, tvec, rvec12, tvec12)
+        proj1, J1 = cv2.projectPoints(obj, rvec, tvec, mtx1, dist1)
+        proj2, J2 = cv2.projectPoints(obj, rvec2, tvec2, mtx2, dist2)
+        # chain rule through the composition: d(pose2)/d(pose1), d(pose2)/d(R, T)
+        D1 = np.block([[dr2dr, dr2dt], [dt2dr, dt2dt]])
+        D12 = np.block([[dr2dr12, dr2dt12], [dt2dr12, dt2dt12]])
+        Jv = np.vstack((np.hstack((J1[:,:6], np.zeros((len(J1),6)))),
+                        np.hstack((J2[:,:6] @ D1, J2[:,:6] @ D12))))
+        r = np.concatenate(((np.asarray(img_points1[i], dtype=np.float64).reshape((-1,2)) - \
+                                proj1.reshape((-1,2))).ravel(),
+                            (np.asarray(img_points2[i], dtype=np.float64).reshape((-1,2)) - \
+                                proj2.reshape((-1,2))).ravel()))
+        idx = np.r_[6*i:6*i+6, 6*nview:6*nview+6]
+        A[np.ix_(idx, idx)] += Jv.T @ Jv
+        g[idx] += Jv.T @ r
+        ss += r @ r
+        nres += len(r)
+    return remaining_step(A, g, ss, nres)
+
+
+class CalibrationBase:
+
+    """
+    Attribute caching and lazy loading shared by the calibration classes.
+    """
+
+    # derived quantities (projection matrices, fundamental matrix, rectification)
+    # are cached; assigning any of these attributes invalidates the cache
+    CACHE_DEPENDENCIES = ()
+
+    def __setattr__(self, name, value):
+        if name in self.CACHE_DEPENDENCIES:
+            self.invalidate_cache()
+        object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # arrays of calibrations loaded from a store file are read on first access
+        lazy = self.__dict__.get('_lazy')
+        if lazy and (name in lazy):
+            try:
+                value = lazy[name]()
+            except ValueError as e:
+                # an AttributeError, so that hasattr() and getattr() defaults still work
+                raise AttributeError('%s: %s' % (name, e)) from e
+            del lazy[name]
+            setattr(self, name, value)
+            return value
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        # don't pickle the cache; pickle lazy arrays by value
+        state = self.__dict__.copy()
+        state.pop('_cache', None)
+        for name, loader in state.pop('_lazy', {}).items():
+            state[name] = loader()
+        return state
+
+    def set_lazy_arrays(self, loaders):
+        # {attribute name: function returning the array}, see store.load
+        self.__dict__['_lazy'] = dict(loaders)
+
+    @property
+    def cache(self):
+        # created lazily, so calibrations unpickled from older versions work too
+        return self.__dict__.setdefault('_cache', {})
+
+    def invalidate_cache(self):
+        # call this after modifying calibration parameters in place
+        self.__dict__.pop('_cache', None)
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_cs(self, cs):
+        self.cs = cs
+
+
+class Calibration(CalibrationBase):
 
+    CACHE_DEPENDENCIES = ('mtx1', 'mtx2', 'dist1', 'dist2',
+                            'rvecs1', 'tvecs1', 'rvecs2', 'tvecs2', 'R', 'T', 'F',
+                            'undistort_lookup_step')
 
-class Calibration:
+    # grid step (pixels) for lib.UndistortLookup, or None for exact undistortion
+    undistort_lookup_step = None
+
+    # one of triangulation.METHODS
+    triangulation_method = 'linear'
+
+    # (npose, npts) mask of the points used for calibration, or None for all points
+    inliers = None
 
     def __init__(self, name, cs):
         self.set_name(name)
@@ -28,11 +257,8 @@ class Calibration:
         self.offset = np.array([0,0,0], dtype=np.float32)
         self.intrinsics_fixed = False
 
-    def set_name(self, name):
-        self.name = name
-
-    def set_cs(self, cs):
-        self.cs = cs
+    def _pose_key(self, pose_index):
+        return range(len(self.rvecs1))[pose_index]
 
     def set_initial_intrinsics(self, mtx1, mtx2, dist1, dist2, fixed=False):
 
@@ -46,38 +272,184 @@ class Calibration:
     def set_initial_intrinsics_default(self):
         self.set_initial_intrinsics(imtx, imtx, idist, idist)
 
+    def set_triangulation_method(self, method):
+        if method not in triangulation.METHODS:
+            raise ValueError('unknown triangulation method: %s' % method)
+        self.triangulation_method = method
+
     def triangulate(self, lcorr, rcorr):
         # use final pose extrinsics by default
         return self.triangulate_pose(lcorr, rcorr, -1)
 
     def triangulate_pose(self, lcorr, rcorr, pose_index):
-
-        img_points1_cv = np.array([lcorr], dtype=np.float32)
-        img_points2_cv = np.array([rcorr], dtype=np.float32)
-
-        # undistort
-        img_points1_cv = lib.undistort_image_points(img_points1_cv, self.mtx1, self.dist1)
-        img_points2_cv = lib.undistort_image_points(img_points2_cv, self.mtx2, self.dist2)
-
-        img_point1 = img_points1_cv[0,0]
-        img_point2 = img_points2_cv[0,0]
-
-        P1 = lib.get_projection_matrix(self.mtx1, self.rvecs1[pose_index], self.tvecs1[pose_index])
-        P2 = lib.get_projection_matrix(self.mtx2, self.rvecs2[pose_index], self.tvecs2[pose_index])
-
-        op_recon_coord4 = cv2.triangulatePoints(P1, P2, img_points1_cv, img_points2_cv).reshape(4)
-        op_recon = op_recon_coord4[:3] / op_recon_coord4[3]
-
-        return op_recon + self.offset # np.array([x,y,z])
-
-    def calibrate(self, img_points1, img_points2, obj_points, stats=True):
+        return self.triangulate_many([lcorr], [rcorr], pose_index)[0]
+
+    def triangulate_many(self, lpts, rpts, pose_index=-1, return_cov=False,
+                            sigma=SIGMA_PIXELS):
+        """
+        Triangulate N correspondence pairs at once.
+        lpts and rpts have dims (N,2), returns object points with dims (N,3).
+        With return_cov, also return their (N,3,3) covariances, propagated
+        from image noise of sigma pixels (scalar, or one per camera) to first
+        order. Distortion is treated as locally constant.
+        """
+        lpts = np.asarray(lpts, dtype=np.float32).reshape((-1,2))
+        rpts = np.asarray(rpts, dtype=np.float32).reshape((-1,2))
+        if len(lpts) == 0:
+            return (np.zeros((0,3)), np.zeros((0,3,3))) if return_cov else np.zeros((0,3))
+        lpts_ud, rpts_ud = self.undistort(lpts, rpts)
+        P1, P2 = self.get_projection_matrices(pose_index)
+        points = triangulation.triangulate(P1, P2, lpts_ud, rpts_ud, self.triangulation_method)
+        if return_cov:
+            cov = lib.triangulation_covariance(np.stack((P1, P2)), points, sigma)
+            return points + self.offset, cov
+        return points + self.offset
+
+    def undistort(self, lpts, rpts):
+        # (N,2) distorted image points -> (N,2) undistorted pixel coordinates
+        if self.undistort_lookup_step:
+            lookup1, lookup2 = self.get_undistort_lookups()
+            return lookup1(lpts)[0], lookup2(rpts)[0]
+        (mtx1, dist1), (mtx2, dist2) = self.get_undistortion_params()
+        return lib.undistort_image_points(lpts, mtx1, dist1)[0], \
+                lib.undistort_image_points(rpts, mtx2, dist2)[0]
+
+    def get_undistort_lookups(self):
+        key = ('lookup',)
+        if key not in self.cache:
+            self.cache[key] = tuple(lib.UndistortLookup(mtx, dist, (WF, HF),
+                                                        self.undistort_lookup_step)
+                                    for mtx, dist in self.get_undistortion_params())
+        return self.cache[key]
+
+    def get_undistortion_params(self):
+        key = ('undistortion',)
+        if key not in self.cache:
+            self.cache[key] = tuple((np.ascontiguousarray(mtx, dtype=np.float64),
+                                    np.ascontiguousarray(dist, dtype=np.float64).reshape((1,-1)))
+                                    for mtx, dist in ((self.mtx1, self.dist1),
+                                                        (self.mtx2, self.dist2)))
+        return self.cache[key]
+
+    def get_projection_matrices(self, pose_index=-1):
+        key = ('P', self._pose_key(pose_index))
+        if key not in self.cache:
+            P1 = lib.get_projection_matrix(self.mtx1, self.rvecs1[pose_index],
+                                            self.tvecs1[pose_index])
+            P2 = lib.get_projection_matrix(self.mtx2, self.rvecs2[pose_index],
+                                            self.tvecs2[pose_index])
+            self.cache[key] = (P1, P2)
+        return self.cache[key]
+
+    def get_relative_rt(self, pose_index=-1):
+        # pose of camera 2 relative to camera 1
+        return lib.relative_rt(self.rvecs1[pose_index], self.tvecs1[pose_index],
+                                self.rvecs2[pose_index], self.tvecs2[pose_index])
+
+    def get_rectification(self, pose_index=-1):
+        """
+        Stereo rectification (cv2.stereoRectify) for the full-resolution frame.
+        Returns a dict with R1, R2, P1, P2, Q and the valid ROIs.
+        """
+        key = ('rectification', self._pose_key(pose_index))
+        if key not in self.cache:
+            R, T = self.get_relative_rt(pose_index)
+            (mtx1, dist1), (mtx2, dist2) = self.get_undistortion_params()
+            R1, R2, P1, P2, Q, roi1, roi2 = cv2.stereoRectify(mtx1, dist1, mtx2, dist2, (WF, HF),
+                                                    np.asarray(R, dtype=np.float64),
+                                                    np.asarray(T, dtype=np.float64).reshape((3,1)))
+            self.cache[key] = dict(R1=R1, R2=R2, P1=P1, P2=P2, Q=Q, roi1=roi1, roi2=roi2)
+        return self.cache[key]
+
+    def get_rectify_params(self, camera, rectify=True, pose_index=-1):
+        # (R, P) for camera 0 or 1: rotation into the rectified frame and its 3x3
+        # camera matrix; identity and the intrinsics for plain undistortion
+        if rectify:
+            rect = self.get_rectification(pose_index)
+            return rect['R%d' % (camera+1)], rect['P%d' % (camera+1)][:,:3]
+        return np.eye(3), self.get_undistortion_params()[camera][0]
+
+    def get_rectify_maps(self, camera, scale=1., rectify=True, pose_index=-1):
+        """
+        cv2.remap tables (fixed point) from the full-resolution frame of camera
+        0 or 1 to its undistorted (or stereo rectified) image, scaled by scale.
+        Cached per camera, scale and mode.
+        """
+        key = ('rectify_maps', camera, scale, rectify, self._pose_key(pose_index))
+        if key not in self.cache:
+            mtx, dist = self.get_undistortion_params()[camera]
+            R, P = self.get_rectify_params(camera, rectify, pose_index)
+            S = np.diag([scale, scale, 1.])
+            size = (int(round(WF*scale)), int(round(HF*scale)))
+            self.cache[key] = cv2.initUndistortRectifyMap(mtx, dist, R, S @ P, size,
+                                                            cv2.CV_16SC2)
+        return self.cache[key]
+
+    def rectify_points(self, camera, pts, scale=1., rectify=True, pose_index=-1):
+        # (N,2) frame pixels -> (N,2) pixels in the image of get_rectify_maps
+        pts = np.asarray(pts, dtype=np.float64).reshape((-1,1,2))
+        mtx, dist = self.get_undistortion_params()[camera]
+        R, P = self.get_rectify_params(camera, rectify, pose_index)
+        S = np.diag([scale, scale, 1.])
+        return cv2.undistortPoints(pts, mtx, dist, R=R, P=S @ P).reshape((-1,2))
+
+    def unrectify_points(self, camera, pts, scale=1., rectify=True, pose_index=-1):
+        # inverse of rectify_points
+        pts = np.asarray(pts, dtype=np.float64).reshape((-1,2))
+        mtx, dist = self.get_undistortion_params()[camera]
+        R, P = self.get_rectify_params(camera, rectify, pose_index)
+        S = np.diag([scale, scale, 1.])
+        rays = np.concatenate((pts, np.ones((len(pts),1))), axis=1) @ np.linalg.inv(S @ P).T
+        rays = rays @ R     # back to the camera frame (R^T x)
+        zero = np.zeros(3)
+        return cv2.projectPoints(rays, zero, zero, mtx, dist)[0].reshape((-1,2))
+
+    def get_fundamental_matrix(self, pose_index=-1):
+        key = ('F', self._pose_key(pose_index))
+        if key not in self.cache:
+            R, T = self.get_relative_rt(pose_index)
+            self.cache[key] = lib.fundamental_matrix(self.mtx1, self.mtx2, R, T)
+        return self.cache[key]
+
+    def epipolar_distance(self, lcorr, rcorr):
+        return self.epipolar_distances([lcorr], [rcorr])[0,0]
+
+    def epipolar_distances(self, lpts, rpts):
+        # (N,M) symmetric epipolar distances between left and right detections
+        lpts_ud, rpts_ud = self.undistort(lpts, rpts)
+        return lib.epipolar_distances(self.get_fundamental_matrix(), lpts_ud, rpts_ud)
+
+    def match_stereo(self, lpts, rpts, max_dist=EPIPOLAR_DIST_MAX):
+        """
+        Associate left and right tip detections using the epipolar constraint.
+        Returns a list of (left index, right index, epipolar distance) tuples;
+        implausible pairs (distance > max_dist pixels) are dropped.
+        """
+        if (len(lpts) == 0) or (len(rpts) == 0):
+            return []
+        return lib.match_epipolar(self.epipolar_distances(lpts, rpts), max_dist)
+
+    def calibrate(self, img_points1, img_points2, obj_points, stats=True, warm_start=None,
+                    ransac_threshold=None):
 
         # img_points have dims (npose, npts, 2)
         # obj_points have dims (npose, npts, 3)
+        # warm_start is a previous Calibration of the same rig, whose intrinsics
+        #   are used as the initial guess (unless intrinsics are fixed)
+        # ransac_threshold (pixels): if given, reject outlier correspondences first
 
         self.npose = obj_points.shape[0]
         self.npts = obj_points.shape[1]
 
+        if ransac_threshold is not None:
+            self.inliers = self.find_inliers(img_points1, img_points2, obj_points,
+                                                ransac_threshold)
+            obj_fit, img_fit1, img_fit2 = self.select_inliers(obj_points, img_points1,
+                                                                img_points2)
+        else:
+            self.inliers = None
+            obj_fit, img_fit1, img_fit2 = obj_points, img_points1, img_points2
+
         # calibrate each camera against these points
         # don't undistort img_points, use "simple" initial intrinsics, same for both cameras
         # don't fix principal point
@@ -89,17 +461,41 @@ class Calibration:
             my_flags += cv2.CALIB_FIX_K2
             my_flags += cv2.CALIB_FIX_K3
             my_flags += cv2.CALIB_FIX_TANGENT_DIST
-            
-        rmse1, mtx1, dist1, rvecs1, tvecs1 = cv2.calibrateCamera(obj_points, img_points1,
-                                                                        (WF, HF),
-                                                                        self.imtx1, self.idist1,
-                                                                        flags=my_flags,
-                                                                        criteria=CRIT)
-        rmse2, mtx2, dist2, rvecs2, tvecs2 = cv2.calibrateCamera(obj_points, img_points2,
-                                                                        (WF, HF),
-                                                                        self.imtx2, self.idist2,
-                                                                        flags=my_flags,
-                                                                        criteria=CRIT)
+
+        if (warm_start is not None) and not self.intrinsics_fixed:
+            guess1 = (warm_start.mtx1, warm_start.dist1)
+            guess2 = (warm_start.mtx2, warm_start.dist2)
+            crit = CRIT_WARM
+        else:
+            guess1 = (self.imtx1, self.idist1)
+            guess2 = (self.imtx2, self.idist2)
+            crit = CRIT
+
+        # the two cameras are independent; OpenCV releases the GIL while solving
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future1 = executor.submit(calibrate_camera, obj_fit, img_fit1, *guess1,
+                                        my_flags, crit)
+            future2 = executor.submit(calibrate_camera, obj_fit, img_fit2, *guess2,
+                                        my_flags, crit)
+            rmse1, mtx1, dist1, rvecs1, tvecs1, std1, pve1, step1, cap1 = future1.result()
+            rmse2, mtx2, dist2, rvecs2, tvecs2, std2, pve2, step2, cap2 = future2.result()
+
+        self.convergence = {
+            'warm_start': None if warm_start is None else warm_start.name,
+            'max_iter': crit[1],
+            'elapsed': time.time() - t0,
+            # remaining Gauss-Newton step (std devs, see remaining_step), and
+            # whether a solver that didn't converge was stopped by max_iter
+            'step1': step1,
+            'step2': step2,
+            'converged': bool(max(step1, step2) < CONVERGENCE_TOL),
+            'hit_cap': bool(cap1 or cap2),
+            'std_intrinsics1': std1,   # fx, fy, cx, cy, k1, k2, p1, p2, k3
+            'std_intrinsics2': std2,
+            'per_view_errors1': pve1,  # RMS reprojection error per pose (pixels)
+            'per_view_errors2': pve2,
+        }
 
         # save all calibration parameters
         self.rvecs1 = rvecs1
@@ -121,20 +517,79 @@ class Calibration:
         if stats:
             self.compute_error_statistics()
 
-    def compute_error_statistics(self):
-
+    def find_inliers(self, img_points1, img_points2, obj_points, threshold=RANSAC_THRESHOLD):
+        """
+        RANSAC per pose, on image points undistorted with the initial intrinsics.
+        Returns the (npose, npts) inlier mask.
+        """
+        inliers = np.ones(obj_points.shape[:2], dtype=bool)
+        for i in range(len(obj_points)):
+            ipts1 = lib.undistort_image_points(img_points1[i], self.imtx1, self.idist1)[0]
+            ipts2 = lib.undistort_image_points(img_points2[i], self.imtx2, self.idist2)[0]
+            inliers[i] = lib.ransac_projection(obj_points[i], ipts1, ipts2, threshold)
+        return inliers
+
+    def select_inliers(self, *arrays):
+        # per-pose lists of the inlier points (OpenCV accepts ragged lists of views)
+        return tuple([a[i][self.inliers[i]] for i in range(len(a))] for a in arrays)
+
+    def get_outliers(self):
+        # (pose, point) indices of the rejected correspondences
+        if self.inliers is None:
+            return []
+        return [(int(i), int(j)) for i,j in np.argwhere(~self.inliers)]
+
+    def get_inlier_mask(self):
+        if self.inliers is None:
+            return np.ones((self.npose, self.npts), dtype=bool)
+        return self.inliers
+
+    def refine(self, refine_points=False, sigma_points=SIGMA_POINTS, loss='linear', stats=True):
+        """
+        Joint bundle adjustment of both cameras (intrinsics, distortion, per-pose
+        extrinsics and optionally object point corrections), starting from the
+        current solution. Call after calibrate().
+        """
+        ba = BundleAdjustment(self.obj_points, self.img_points1, self.img_points2,
+                                *self.get_intrinsics_vectors(),
+                                self.rvecs1, self.tvecs1, self.rvecs2, self.tvecs2,
+                                fix_intrinsics=self.intrinsics_fixed,
+                                refine_points=refine_points, sigma_points=sigma_points,
+                                mask=self.inliers)
+        refined = ba.solve(loss=loss)
+        self.apply_refinement(refined)
+        if stats:
+            self.compute_error_statistics()
+        return refined
+
+    def get_intrinsics_vectors(self):
+        return (bundle_adjustment.intrinsics_vector(self.mtx1, self.dist1),
+                bundle_adjustment.intrinsics_vector(self.mtx2, self.dist2))
+
+    def apply_refinement(self, refined):
+        for key in ('mtx1', 'dist1', 'mtx2', 'dist2', 'rvecs1', 'tvecs1', 'rvecs2', 'tvecs2',
+                    'rmse_reproj_1', 'rmse_reproj_2'):
+            setattr(self, key, refined[key])
+        self.obj_points_refined = refined['obj_points']
+
+    def compute_error_statistics(self, summary_only=False):
+        """
+        Triangulation error against the calibration object points.
+        With summary_only, just return the RMSE (attributes are left untouched).
+        """
         err = np.zeros(self.obj_points.shape, dtype=np.float32)
         for i in range(self.npose):
-            for j in range(self.npts):
-                op = self.obj_points[i,j,:]
-                ip1 = self.img_points1[i,j,:]
-                ip2 = self.img_points2[i,j,:]
-                op_recon = self.triangulate_pose(ip1, ip2, i)
-                err[i,j,:] = op - op_recon
-        self.mean_error = np.mean(err, axis=(0,1))
-        self.std_error = np.std(err, axis=(0,1))
-        self.rmse = np.sqrt(np.mean(err*err))
+            op_recon = self.triangulate_many(self.img_points1[i], self.img_points2[i], i)
+            err[i,:,:] = self.obj_points[i] - op_recon
+        err_inliers = err[self.get_inlier_mask()]
+        rmse = np.sqrt(np.mean(err_inliers*err_inliers))
+        if summary_only:
+            return rmse
+        self.mean_error = np.mean(err_inliers, axis=0)
+        self.std_error = np.std(err_inliers, axis=0)
+        self.rmse = rmse
         self.err = err
+        return rmse
 
 
 class CalibrationStereo(Calibration):
@@ -142,18 +597,37 @@ class CalibrationStereo(Calibration):
     def __init__(self, name, cs):
         Calibration.__init__(self, name, cs)
 
-    def calibrate(self, img_points1, img_points2, obj_points, stats=False):
+    def calibrate(self, img_points1, img_points2, obj_points, stats=False, warm_start=None,
+                    ransac_threshold=None):
         # thought: if not fixed, then do the below. otherwise no?
-        Calibration.calibrate(self, img_points1, img_points2, obj_points, stats=False)
-
-
+        Calibration.calibrate(self, img_points1, img_points2, obj_points, stats=False,
+                                warm_start=warm_start, ransac_threshold=ransac_threshold)
+        if self.inliers is not None:
+            obj_points, img_points1, img_points2 = self.select_inliers(obj_points,
+                                                                img_points1, img_points2)
+
+        # with the intrinsics fixed, the relative pose is initialized from the per-view
+        # extrinsics, so a warm start only needs a few iterations
         stereo_flags = cv2.CALIB_FIX_INTRINSIC
-        rmse, _, _, _, _, R, T, E, F = cv2.stereoCalibrate(obj_points, img_points1, 
-                                                                    img_points2, self.mtx1, self.dist1,
-                                                                     self.mtx2, self.dist2, (WF, HF),
-                                                                    criteria = CRIT,
-                                                                    flags = stereo_flags)
-
+        crit = CRIT if warm_start is None else CRIT_WARM
+        def solve(criteria):
+            return cv2.stereoCalibrateExtended(obj_points, img_points1, img_points2,
+                                                self.mtx1, self.dist1,
+                                                self.mtx2, self.dist2, (WF, HF),
+                                                np.eye(3), np.zeros((3,1)),
+                                                criteria = criteria,
+                                                flags = stereo_flags)
+        t0 = time.time()
+        rmse, _, _, _, _, R, T, E, F, rvecs, tvecs, _ = solve(crit)
+        self.convergence['elapsed_stereo'] = time.time() - t0
+        step = stereo_step(obj_points, img_points1, img_points2, self.mtx1, self.dist1,
+                            self.mtx2, self.dist2, rvecs, tvecs, R, T)
+        self.convergence['step_stereo'] = step
+        if step >= CONVERGENCE_TOL:
+            self.convergence['converged'] = False
+            # the intrinsics are fixed, so only R and T can differ
+            if stopped_at_cap(solve, crit, (R, T), first=5):
+                self.convergence['hit_cap'] = True
 
         # save stereo calibration parameters
         self.R = R
@@ -165,54 +639,298 @@ class CalibrationStereo(Calibration):
         if stats:
             self.compute_error_statistics()
 
-    def triangulate(self, lcorr, rcorr):
+    def refine(self, refine_points=False, sigma_points=SIGMA_POINTS, loss='linear', stats=True):
+        """
+        Joint bundle adjustment over the rig: both cameras' intrinsics and
+        distortion, camera 1's pose per view, the camera 1 -> camera 2 transform
+        (R, T), and optionally object point corrections.
+        """
+        ba = BundleAdjustment(self.obj_points, self.img_points1, self.img_points2,
+                                *self.get_intrinsics_vectors(), self.rvecs1, self.tvecs1,
+                                rig=(self.R, self.T), fix_intrinsics=self.intrinsics_fixed,
+                                refine_points=refine_points, sigma_points=sigma_points,
+                                mask=self.inliers)
+        refined = ba.solve(loss=loss)
+        self.apply_refinement(refined)
+        self.R = refined['R']
+        self.T = refined['T']
+        self.E = np.matmul(lib.skew(self.T), self.R)
+        self.F = lib.fundamental_matrix(self.mtx1, self.mtx2, self.R, self.T)
+        self.rmse_reproj_stereo = np.sqrt((refined['rmse_reproj_1']**2 + \
+                                            refined['rmse_reproj_2']**2) / 2.)
+        if stats:
+            self.compute_error_statistics()
+        return refined
+
+    def get_fundamental_matrix(self, pose_index=-1):
+        return self.F
+
+    def get_projection_matrices(self, pose_index=-1):
+        # camera 1 frame (stereo extrinsics don't depend on the pose)
+        key = ('P',)
+        if key not in self.cache:
+            r1 = np.zeros((3,1), dtype=np.float32)
+            t1 = np.zeros((3,1), dtype=np.float32)
+            P1 = lib.get_projection_matrix(self.mtx1, r1, t1)
+            r2 = lib.axis_angle_from_matrix(self.R)
+            t2 = self.T
+            P2 = lib.get_projection_matrix(self.mtx2, r2, t2)
+            self.cache[key] = (P1, P2)
+        return self.cache[key]
+
+    def get_relative_rt(self, pose_index=-1):
+        return self.R, self.T
+
+    def compute_error_statistics(self, summary_only=False):
+        """
+        Triangulation error in checker coordinates: for each pose, fit a rigid
+        transform (camera 1 -> checker) from 13 correspondence points, then map
+        all of the pose's triangulated points through it.
+        With summary_only, just return the RMSE (attributes are left untouched).
+        """
+        npose, npts = self.obj_points.shape[:2]
+        opts_cam1 = self.triangulate_many(self.img_points1.reshape((-1,2)),
+                                            self.img_points2.reshape((-1,2)))
+        opts_cam1 = opts_cam1.reshape((npose, npts, 3))
+        jx = np.linspace(0, npts-1, 13).astype(int)
+        rot, ori = lib.rigid_fit(opts_cam1[:,jx,:], self.obj_points[:,jx,:])
+        op_recon = (opts_cam1 + ori[:,None,:]) @ rot     # TransformNP.map, for all poses
+        err = (op_recon - self.obj_points).astype(np.float32)
+        err_inliers = err[self.get_inlier_mask()]
+        rmse = np.sqrt(np.mean(err_inliers*err_inliers))
+        if summary_only:
+            return rmse
+        self.mean_error = np.mean(err_inliers, axis=0)
+        self.std_error = np.std(err_inliers, axis=0)
+        self.rmse = rmse
+        self.err = err
+        return rmse
 
-        img_points1_cv = np.array([lcorr], dtype=np.float32)
-        img_points2_cv = np.array([rcorr], dtype=np.float32)
 
-        # undistort
-        img_points1_cv = lib.undistort_image_points(img_points1_cv, self.mtx1, self.dist1)
-        img_points2_cv = lib.undistort_image_points(img_points2_cv, self.mtx2, self.dist2)
+class CalibrationN(CalibrationBase):
 
-        img_point1 = img_points1_cv[0,0]
-        img_point2 = img_points2_cv[0,0]
+    """
+    Calibration of any number of cameras against a shared set of object points.
+    Image points have dims (ncam, npose, npts, 2), with NaN where a camera
+    doesn't see a point. Each camera is calibrated independently (in parallel);
+    triangulation is a weighted DLT over all cameras that see a point, with
+    each view weighted by its camera's reprojection error.
+    """
 
-        r1 = np.zeros((3,1), dtype=np.float32)
-        t1 = np.zeros((3,1), dtype=np.float32)
-        P1 = lib.get_projection_matrix(self.mtx1, r1, t1)
-        r2 = lib.axis_angle_from_matrix(self.R)
-        t2 = self.T
-        P2 = lib.get_projection_matrix(self.mtx2, r2, t2)
+    CACHE_DEPENDENCIES = ('mtx', 'dist', 'rvecs', 'tvecs')
 
-        op_recon_coord4 = cv2.triangulatePoints(P1, P2, img_points1_cv, img_points2_cv).reshape(4)
-        op_recon = op_recon_coord4[:3] / op_recon_coord4[3]
+    MIN_VIEW_POINTS = 6     # a camera needs this many points to solve a pose
 
-        return op_recon + self.offset # np.array([x,y,z])
+    def __init__(self, name, cs, ncam):
+        self.set_name(name)
+        self.set_cs(cs)
+        self.ncam = ncam
+        self.set_initial_intrinsics([imtx] * ncam, [idist] * ncam)
+        self.offset = np.array([0,0,0], dtype=np.float32)
 
-    def compute_error_statistics(self):
+    def set_initial_intrinsics(self, mtx, dist, fixed=False):
+        self.imtx = np.array(mtx, dtype=np.float64).reshape((self.ncam,3,3))
+        self.idist = np.array(dist, dtype=np.float64).reshape((self.ncam,-1))
+        self.intrinsics_fixed = fixed
 
-        # warning: this function computes transforms for each pose, and takes
-        # about 5 seconds to complete for a 19x19 checkerboard
+    def calibrate(self, img_points, obj_points, stats=True, warm_start=None):
 
-        err = np.zeros(self.obj_points.shape, dtype=np.float32)
+        # img_points have dims (ncam, npose, npts, 2), NaN for missing views
+        # obj_points have dims (npose, npts, 3)
+        # warm_start is a previous CalibrationN of the same cameras
+
+        img_points = np.asarray(img_points, dtype=np.float32)
+        obj_points = np.asarray(obj_points, dtype=np.float32)
+        if len(img_points) != self.ncam:
+            raise ValueError('expected image points from %d cameras' % self.ncam)
+        self.npose = obj_points.shape[0]
+        self.npts = obj_points.shape[1]
+
+        my_flags = cv2.CALIB_USE_INTRINSIC_GUESS
+        if self.intrinsics_fixed:
+            my_flags += cv2.CALIB_FIX_PRINCIPAL_POINT
+            my_flags += cv2.CALIB_FIX_FOCAL_LENGTH
+            my_flags += cv2.CALIB_FIX_K1
+            my_flags += cv2.CALIB_FIX_K2
+            my_flags += cv2.CALIB_FIX_K3
+            my_flags += cv2.CALIB_FIX_TANGENT_DIST
+
+        if (warm_start is not None) and not self.intrinsics_fixed:
+            guesses = zip(warm_start.mtx, warm_start.dist)
+            crit = CRIT_WARM
+        else:
+            guesses = zip(self.imtx, self.idist)
+            crit = CRIT
+
+        # per camera, only the poses where it sees enough points take part
+        visible = np.all(np.isfinite(img_points), axis=-1)      # (ncam, npose, npts)
+        poses = [np.flatnonzero(np.sum(vis, axis=1) >= self.MIN_VIEW_POINTS) \
+                    for vis in visible]
+        for c in range(self.ncam):
+            if len(poses[c]) == 0:
+                raise ValueError('camera %d sees too few points in every pose' % c)
+
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=self.ncam) as executor:
+            futures = []
+            for c, (mtx, dist) in enumerate(guesses):
+                obj_fit = [obj_points[i][visible[c,i]] for i in poses[c]]
+                img_fit = [img_points[c,i][visible[c,i]] for i in poses[c]]
+                futures.append(executor.submit(calibrate_camera, obj_fit, img_fit, mtx, dist,
+                                                my_flags, crit))
+            results = [f.result() for f in futures]
+
+        # extrinsics are NaN for the poses a camera didn't solve
+        rvecs = np.full((self.ncam, self.npose, 3, 1), np.nan)
+        tvecs = np.full((self.ncam, self.npose, 3, 1), np.nan)
+        for c, (rmse, mtx, dist, rv, tv, std, pve, step, hit_cap) in enumerate(results):
+            rvecs[c,poses[c]] = np.reshape(rv, (-1,3,1))
+            tvecs[c,poses[c]] = np.reshape(tv, (-1,3,1))
+
+        self.convergence = {
+            'warm_start': None if warm_start is None else warm_start.name,
+            'max_iter': crit[1],
+            'elapsed': time.time() - t0,
+            'step': np.array([r[7] for r in results]),    # see Calibration.calibrate
+            'converged': bool(max(r[7] for r in results) < CONVERGENCE_TOL),
+            'hit_cap': any(r[8] for r in results),
+            'std_intrinsics': np.array([r[5] for r in results]),
+            'per_view_errors': [r[6] for r in results],
+        }
+
+        # save all calibration parameters
+        self.mtx = np.array([r[1] for r in results])
+        self.dist = np.array([np.ravel(r[2])[:5] for r in results])
+        self.rvecs = rvecs
+        self.tvecs = tvecs
+        self.rmse_reproj = np.array([r[0] for r in results])    # per camera (pixels)
+        self.weights = 1. / np.maximum(self.rmse_reproj, 1e-3)
+
+        # save calibration points
+        self.obj_points = obj_points
+        self.img_points = img_points
+
+        if stats:
+            self.compute_error_statistics()
+
+    def get_projection_matrices(self, pose_index=-1):
+        # (ncam,3,4) [R|t] for normalized (undistorted) image coordinates;
+        # NaN for cameras without extrinsics for this pose
+        pose_index = range(self.npose)[pose_index]
+        key = ('P', pose_index)
+        if key not in self.cache:
+            P = np.full((self.ncam,3,4), np.nan)
+            for c in range(self.ncam):
+                if np.all(np.isfinite(self.rvecs[c,pose_index])):
+                    P[c] = lib.get_rt_matrix(self.rvecs[c,pose_index],
+                                                self.tvecs[c,pose_index])
+            self.cache[key] = P
+        return self.cache[key]
+
+    def normalize(self, img_points):
+        # (ncam,N,2) distorted pixels -> normalized camera coordinates (NaN preserved)
+        img_points = np.asarray(img_points, dtype=np.float64).reshape((self.ncam,-1,2))
+        out = np.full(img_points.shape, np.nan)
+        for c in range(self.ncam):
+            valid = np.all(np.isfinite(img_points[c]), axis=1)
+            if np.any(valid):
+                pts = img_points[c,valid].reshape((-1,1,2))
+                out[c,valid] = cv2.undistortPoints(pts, self.mtx[c], self.dist[c]).reshape((-1,2))
+        return out
+
+    def triangulate(self, *corrs):
+        # one image point per camera, None for cameras that don't see it
+        pts = np.array([(np.nan, np.nan) if c is None else c for c in corrs], dtype=np.float64)
+        return self.triangulate_many(pts[:,None,:])[0]
+
+    def triangulate_many(self, img_points, pose_index=-1, weights=None, residuals=False,
+                            return_cov=False, sigma=SIGMA_PIXELS):
+        """
+        Triangulate N points seen by any subset of the cameras.
+        img_points have dims (ncam,N,2), NaN where a camera doesn't see a point;
+        returns object points (N,3), NaN for points seen by fewer than 2 cameras.
+        weights (ncam,) or (ncam,N) default to the inverse reprojection RMSE of
+        each camera. With residuals, also return the (ncam,N,2) reprojection
+        residuals (pixels) of each view. With return_cov, also return the (N,3,3)
+        covariances for image noise of sigma pixels (scalar, (ncam,) or (ncam,N)).
+        """
+        img_points = np.asarray(img_points, dtype=np.float64).reshape((self.ncam,-1,2))
+        if weights is None:
+            weights = self.weights
+        # normalized coordinates: scale the weights to pixels
+        focal = np.sqrt(self.mtx[:,0,0] * self.mtx[:,1,1])
+        weights = np.asarray(weights, dtype=np.float64).reshape((self.ncam,-1)) * focal[:,None]
+        P = self.get_projection_matrices(pose_index)
+        points = lib.triangulate_points_n(P, self.normalize(img_points), weights)
+        result = [points + self.offset]
+        if residuals:
+            result.append(self.reprojection_residuals(points, img_points, pose_index))
+        if return_cov:
+            s = np.asarray(sigma, dtype=np.float64)
+            if s.ndim == 1:
+                s = s[:,None]
+            s = np.where(np.all(np.isfinite(img_points), axis=-1), s, np.inf)
+            result.append(lib.triangulation_covariance(self.mtx @ P, points, s))
+        return result[0] if len(result) == 1 else tuple(result)
+
+    def project(self, points, pose_index=-1):
+        # (N,3) object points (without offset) -> (ncam,N,2) image points, NaN if not solvable
+        points = np.asarray(points, dtype=np.float64).reshape((-1,3))
+        pose_index = range(self.npose)[pose_index]
+        proj = np.full((self.ncam, len(points), 2), np.nan)
+        valid = np.all(np.isfinite(points), axis=1)
+        if not np.any(valid):
+            return proj
+        for c in range(self.ncam):
+            rvec, tvec = self.rvecs[c,pose_index], self.tvecs[c,pose_index]
+            if np.all(np.isfinite(rvec)):
+                proj[c,valid] = cv2.projectPoints(points[valid], rvec, tvec, self.mtx[c],
+                                                    self.dist[c])[0].reshape((-1,2))
+        return proj
+
+    def reprojection_residuals(self, points, img_points, pose_index=-1):
+        # (ncam,N,2) projected minus observed, NaN for missing views
+        return self.project(points, pose_index) - img_points
+
+    def get_pair(self, i, j, name=None):
+        """
+        Two-camera Calibration for cameras i and j, for the stereo tools
+        (epipolar matching, rectification). Needs both cameras in every pose.
+        """
+        cal = Calibration(name or '%s (%d,%d)' % (self.name, i, j), self.cs)
+        cal.set_initial_intrinsics(self.imtx[i], self.imtx[j], self.idist[i][None,:],
+                                    self.idist[j][None,:], fixed=self.intrinsics_fixed)
+        cal.offset = self.offset
+        cal.mtx1, cal.mtx2 = self.mtx[i], self.mtx[j]
+        cal.dist1, cal.dist2 = self.dist[i][None,:], self.dist[j][None,:]
+        cal.rvecs1, cal.tvecs1 = tuple(self.rvecs[i]), tuple(self.tvecs[i])
+        cal.rvecs2, cal.tvecs2 = tuple(self.rvecs[j]), tuple(self.tvecs[j])
+        cal.rmse_reproj_1, cal.rmse_reproj_2 = self.rmse_reproj[i], self.rmse_reproj[j]
+        cal.npose, cal.npts = self.npose, self.npts
+        cal.obj_points = self.obj_points
+        cal.img_points1, cal.img_points2 = self.img_points[i], self.img_points[j]
+        return cal
+
+    def compute_error_statistics(self, summary_only=False):
+        """
+        Triangulation error against the calibration object points, and the
+        per-view reprojection residuals of the triangulated points.
+        With summary_only, just return the RMSE (attributes are left untouched).
+        """
+        err = np.full(self.obj_points.shape, np.nan, dtype=np.float32)
+        res = np.full(self.img_points.shape, np.nan, dtype=np.float32)
         for i in range(self.npose):
-            # first establish a transform from 8 corr points
-            tx = TransformNP('tmp', 'cam1', 'checker')
-            jx = np.linspace(0,360,13).astype(int)
-            opts_cam1 = np.zeros((len(jx),3), dtype=np.float32)
-            for k,j in enumerate(jx):
-                ip1 = self.img_points1[i,j,:]
-                ip2 = self.img_points2[i,j,:]
-                opts_cam1[k,:] = self.triangulate(ip1, ip2)
-            tx.compute_from_correspondence(opts_cam1, self.obj_points[i,jx,:])
-            for j in range(self.npts):
-                ip1 = self.img_points1[i,j,:]
-                ip2 = self.img_points2[i,j,:]
-                op_cam1 = self.triangulate(ip1, ip2)
-                op_recon = tx.map(op_cam1)
-                err[i,j,:] = op_recon - self.obj_points[i,j,:]
-        self.mean_error = np.mean(err, axis=(0,1))
-        self.std_error = np.std(err, axis=(0,1))
-        self.rmse = np.sqrt(np.mean(err*err))
+            op_recon, res[:,i] = self.triangulate_many(self.img_points[:,i], i, residuals=True)
+            err[i] = self.obj_points[i] - op_recon
+        err_valid = err[np.all(np.isfinite(err), axis=-1)]
+        rmse = np.sqrt(np.mean(err_valid*err_valid))
+        if summary_only:
+            return rmse
+        self.mean_error = np.mean(err_valid, axis=0)
+        self.std_error = np.std(err_valid, axis=0)
+        self.rmse = rmse
         self.err = err
-
+        self.residuals = res
+        # per camera RMS reprojection error of the triangulated points (pixels)
+        self.rmse_views = np.sqrt(np.nanmean(np.sum(res*res, axis=-1), axis=(1,2)))
+        return rmse
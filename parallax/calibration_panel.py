@@ -6,9 +6,9 @@ from PyQt5.QtWidgets import QLineEdit, QPlainTextEdit, QSpinBox, QCheckBox
 from PyQt5.QtCore import pyqtSignal, Qt, QThread, QMimeData
 from PyQt5.QtGui import QDrag, QIcon
 
-import pickle
 import os
 import numpy as np
+import cv2
 import time
 import datetime
 
@@ -16,9 +16,11 @@ from . import data_dir
 from . import get_image_file
 from .helper import FONT_BOLD
 from .rigid_body_transform_tool import RigidBodyTransformTool, PointTransformWidget
-from .calibration import Calibration
+from .calibration import EPIPOLAR_DIST_MAX, convergence_warning
+from . import store
+from . import triangulation
 from .rigid_body_transform_tool import CoordinateWidget
-from .stage_dropdown import StageDropdown
+from .stage_dropdown import StageDropdown, CalibrationDropdown
 from .calibration_worker import CalibrationWorker
 
 
@@ -72,6 +74,7 @@ class CalibrationPanel(QFrame):
         dlg = CalibrationSettingsDialog(cal)
         if dlg.exec_():
             cal.offset = np.array(dlg.offset_value.get_coordinates(), dtype=np.float32)
+            cal.set_triangulation_method(dlg.method_dropdown.currentText())
 
     def get_cal(self):
         if (self.combo.currentIndex() < 0):
@@ -92,13 +95,21 @@ class CalibrationPanel(QFrame):
         else:
             lcorr, rcorr = self.model.lcorr, self.model.rcorr
 
-        obj_point = cal_selected.triangulate(lcorr, rcorr)
+        epi_dist = cal_selected.epipolar_distance(lcorr, rcorr)
+        if epi_dist > EPIPOLAR_DIST_MAX:
+            self.msg_posted.emit('Warning: correspondence points are %.1f px off the '
+                                    'epipolar line; they may not be the same point.' % epi_dist)
+
+        points, cov = cal_selected.triangulate_many([lcorr], [rcorr], return_cov=True)
+        obj_point = points[0]
         self.model.set_last_object_point(obj_point)
         self.model.set_last_image_point(lcorr, rcorr)
 
         x,y,z = obj_point
+        sx,sy,sz = np.sqrt(np.diag(cov[0]))
         self.msg_posted.emit('Reconstructed object point: '
-                            '[{0:.2f}, {1:.2f}, {2:.2f}]'.format(x, y, z))
+                            '[{0:.2f}, {1:.2f}, {2:.2f}] +/- '
+                            '[{3:.1f}, {4:.1f}, {5:.1f}]'.format(x, y, z, sx, sy, sz))
 
     def cal_start_stop(self):
         if self.start_stop_button.text() == 'Start':
@@ -111,17 +122,32 @@ class CalibrationPanel(QFrame):
                 name = dlg.get_name()
                 cs = dlg.get_cs()
                 intrinsics = dlg.get_intrinsics()
-                self.start_cal_thread(stage, res, extent, origin, name, cs, intrinsics)
+                warm_start = dlg.get_warm_start()
+                incremental, rmse_target = dlg.get_incremental()
+                reject_outliers = dlg.get_reject_outliers()
+                unattended = dlg.get_unattended()
+                self.start_cal_thread(stage, res, extent, origin, name, cs, intrinsics,
+                                        warm_start, incremental, rmse_target, reject_outliers,
+                                        unattended)
         elif self.start_stop_button.text() == 'Stop':
             self.stop_cal_thread()
 
-    def start_cal_thread(self, stage, res, extent, origin, name, cs, intrinsics):
+    def start_cal_thread(self, stage, res, extent, origin, name, cs, intrinsics,
+                            warm_start=None, incremental=False, rmse_target=None,
+                            reject_outliers=False, unattended=False):
         self.model.cal_in_progress = True
         self.cal_thread = QThread()
-        self.cal_worker = CalibrationWorker(name, cs, stage, intrinsics, res, extent, origin)
+        self.cal_worker = CalibrationWorker(name, cs, stage, intrinsics, res, extent, origin,
+                                            warm_start=warm_start, incremental=incremental,
+                                            rmse_target=rmse_target,
+                                            reject_outliers=reject_outliers,
+                                            unattended=unattended,
+                                            telemetry=self.model.get_telemetry(stage))
         self.cal_worker.moveToThread(self.cal_thread)
         self.cal_thread.started.connect(self.cal_worker.run)
         self.cal_worker.calibration_point_reached.connect(self.handle_cal_point_reached)
+        self.cal_worker.calibration_updated.connect(self.handle_cal_updated)
+        self.cal_worker.msg_posted.connect(self.msg_posted)
         self.cal_thread.finished.connect(self.handle_cal_finished)
         self.cal_worker.finished.connect(self.cal_worker.deleteLater)
         self.cal_thread.finished.connect(self.cal_thread.deleteLater)
@@ -138,10 +164,25 @@ class CalibrationPanel(QFrame):
         self.msg_posted.emit('Highlight correspondence points and press C to continue')
         self.cal_point_reached.emit()
 
-    def register_corr_points_cal(self):
+    def handle_cal_updated(self, npts, rmse, sigma_fx, pred_rms):
+        self.msg_posted.emit('Calibration updated (%d points): RMSE = %.2f um, '
+                                'prediction error = %.2f um, focal length +/- %.1f px' % \
+                                (npts, rmse, pred_rms, sigma_fx))
+
+    def update_tips_left(self, tip_positions, timestamp):
+        # detector output, for unattended calibration
+        if self.model.cal_in_progress:
+            self.cal_worker.update_left(tip_positions, timestamp)
+
+    def update_tips_right(self, tip_positions, timestamp):
+        if self.model.cal_in_progress:
+            self.cal_worker.update_right(tip_positions, timestamp)
+
+    def register_corr_points_cal(self, times=None):
+        # times: capture times of the frames the points were selected in
         lcorr, rcorr = self.model.lcorr, self.model.rcorr
         if (lcorr and rcorr):
-            self.cal_worker.register_corr_points(lcorr, rcorr)
+            self.cal_worker.register_corr_points(lcorr, rcorr, times)
             self.msg_posted.emit('Correspondence points registered: (%d,%d) and (%d,%d)' % \
                                     (lcorr[0],lcorr[1], rcorr[0],rcorr[1]))
             self.cal_worker.carry_on()
@@ -149,30 +190,45 @@ class CalibrationPanel(QFrame):
             self.msg_posted.emit('Highlight correspondence points and press C to continue')
 
     def handle_cal_finished(self):
+        cal = None
         if self.cal_worker.complete:
-            cal = Calibration(self.cal_worker.name, self.cal_worker.cs)
-            if (self.cal_worker.intrinsics is not None):
-                int1, int2 = self.cal_worker.intrinsics
-                cal.set_initial_intrinsics(int1.mtx, int2.mtx, int1.dist, int2.dist, fixed=True)
-            img_points1, img_points2 = self.cal_worker.get_image_points()
-            obj_points = self.cal_worker.get_object_points()
-            cal.calibrate(img_points1, img_points2, obj_points)
-            self.msg_posted.emit('Calibration finished. RMSE = %f um' % cal.rmse)
-            self.model.add_calibration(cal)
-            self.update_cals()
+            cal = self.cal_worker.cal
+            if (cal is None) or (cal.npts != len(self.cal_worker.object_points)):
+                # in incremental mode, the latest fit already includes every point
+                # (unless its refit failed)
+                try:
+                    cal = self.cal_worker.make_calibration(self.cal_worker.warm_start)
+                except (cv2.error, np.linalg.LinAlgError) as e:
+                    self.msg_posted.emit('Calibration failed: %s' % str(e).strip())
+                    cal = None
         else:
             self.msg_posted.emit('Calibration aborted.')
+        if cal is not None:
+            outliers = cal.get_outliers()
+            if outliers:
+                self.msg_posted.emit('Rejected calibration points: %s' % \
+                                        ', '.join(str(j+1) for i,j in outliers))
+            self.msg_posted.emit('Calibration finished. RMSE = %f um (%.3f s)' % \
+                                    (cal.rmse, cal.convergence['elapsed']))
+            warning = convergence_warning(cal.convergence)
+            if warning is not None:
+                self.msg_posted.emit(warning)
+            self.model.add_calibration(cal)
+            self.update_cals()
         self.model.cal_in_progress = False
         self.start_stop_button.setText('Start')
 
     def load_cal(self):
         filenames = QFileDialog.getOpenFileNames(self, 'Load calibration file', data_dir,
-                                                    'Pickle files (*.pkl)')[0]
+                                                    'Calibration files (*.npz *.pkl)')[0]
         if filenames:
             for filename in filenames:
-                with open(filename, 'rb') as f:
-                    cal = pickle.load(f)
-                    self.model.add_calibration(cal)
+                cal = store.load(filename)
+                if not hasattr(cal, 'match_stereo'):
+                    # e.g. a CalibrationN: the panel and trackers need a stereo pair
+                    self.msg_posted.emit('Not a stereo calibration, skipped: %s' % filename)
+                    continue
+                self.model.add_calibration(cal)
             self.update_cals()
 
     def save_cal(self):
@@ -183,19 +239,19 @@ class CalibrationPanel(QFrame):
         else:
             cal_selected = self.model.calibrations[self.combo.currentText()]
 
-        suggested_filename = os.path.join(data_dir, cal_selected.name + '.pkl')
+        suggested_filename = os.path.join(data_dir, cal_selected.name + '.npz')
         filename = QFileDialog.getSaveFileName(self, 'Save calibration file',
                                                 suggested_filename,
-                                                'Pickle files (*.pkl)')[0]
+                                                'Calibration files (*.npz)')[0]
         if filename:
-            with open(filename, 'wb') as f:
-                pickle.dump(cal_selected, f)
+            store.save(cal_selected, filename)
             self.msg_posted.emit('Saved calibration %s to: %s' % (cal_selected.name, filename))
 
     def update_cals(self):
         self.combo.clear()
-        for cal in self.model.calibrations.keys():
-            self.combo.addItem(cal)
+        for name, cal in self.model.calibrations.items():
+            if hasattr(cal, 'match_stereo'):
+                self.combo.addItem(name)
 
     def mousePressEvent(self, e):
         self.dragHold = True
@@ -230,6 +286,13 @@ class CalibrationSettingsDialog(QDialog):
         self.offset_label = QLabel('Offset:')
         self.offset_value = CoordinateWidget(vertical=True)
         self.offset_value.set_coordinates(self.cal.offset)
+        self.method_label = QLabel('Triangulation:')
+        self.method_dropdown = QComboBox()
+        for method in triangulation.METHODS:
+            self.method_dropdown.addItem(method)
+        self.method_dropdown.setCurrentText(self.cal.triangulation_method)
+        self.method_dropdown.setToolTip('linear is fastest (live tracking); '
+                                        'iterative is most accurate (targeting)')
         layout = QGridLayout()
         layout.addWidget(self.name_label, 0,0, 1,1)
         layout.addWidget(self.name_value, 0,1, 1,1)
@@ -237,6 +300,8 @@ class CalibrationSettingsDialog(QDialog):
         layout.addWidget(self.cs_value, 1,1, 1,1)
         layout.addWidget(self.offset_label, 2,0, 1,1)
         layout.addWidget(self.offset_value, 2,1, 1,1)
+        layout.addWidget(self.method_label, 3,0, 1,1)
+        layout.addWidget(self.method_dropdown, 3,1, 1,1)
         self.general_tab.setLayout(layout)
 
         self.stats_tab = QWidget()
@@ -419,6 +484,39 @@ class CalibrationDialog(QDialog):
         self.int2_button.setEnabled(False)
         self.int2_button.clicked.connect(self.load_int2)
 
+        self.warm_label = QLabel('Warm start from:')
+        self.warm_label.setAlignment(Qt.AlignCenter)
+        self.warm_check = QCheckBox()
+        self.warm_check.setToolTip('Use a previous calibration of this rig as the initial guess')
+        self.warm_check.stateChanged.connect(self.handle_warm_check)
+        self.warm_dropdown = CalibrationDropdown(self.model)
+        self.warm_dropdown.setEnabled(False)
+
+        self.incremental_label = QLabel('Incremental')
+        self.incremental_label.setAlignment(Qt.AlignCenter)
+        self.incremental_check = QCheckBox()
+        self.incremental_check.setToolTip('Refit after each point, and stop once the '
+                                            'target RMSE is reached')
+        self.incremental_check.stateChanged.connect(self.handle_incremental_check)
+        self.rmse_target_label = QLabel('Target RMSE (um):')
+        self.rmse_target_label.setAlignment(Qt.AlignCenter)
+        self.rmse_target_edit = QLineEdit('')
+        self.rmse_target_edit.setPlaceholderText('(visit all points)')
+        self.rmse_target_edit.setEnabled(False)
+
+        self.ransac_label = QLabel('Reject Outliers')
+        self.ransac_label.setAlignment(Qt.AlignCenter)
+        self.ransac_check = QCheckBox()
+        self.ransac_check.setToolTip('Exclude correspondence points inconsistent with '
+                                        'the others (RANSAC)')
+
+        self.unattended_label = QLabel('Unattended')
+        self.unattended_label.setAlignment(Qt.AlignCenter)
+        self.unattended_check = QCheckBox()
+        self.unattended_check.setToolTip('Register the tip detector output at each point '
+                                            '(points with unreliable detections are left '
+                                            'for manual registration at the end)')
+
         self.start_button = QPushButton('Start Calibration Routine')
         self.start_button.setFont(FONT_BOLD)
         self.start_button.setEnabled(False)
@@ -448,7 +546,18 @@ class CalibrationDialog(QDialog):
         layout.addWidget(self.int1_button, 8,1, 1,1)
         layout.addWidget(self.int2_label, 9,0, 1,1)
         layout.addWidget(self.int2_button, 9,1, 1,1)
-        layout.addWidget(self.start_button, 10,0, 1,2)
+        layout.addWidget(self.warm_label, 10,0, 1,1)
+        layout.addWidget(self.warm_check, 10,1, 1,1)
+        layout.addWidget(self.warm_dropdown, 11,0, 1,2)
+        layout.addWidget(self.incremental_label, 12,0, 1,1)
+        layout.addWidget(self.incremental_check, 12,1, 1,1)
+        layout.addWidget(self.rmse_target_label, 13,0, 1,1)
+        layout.addWidget(self.rmse_target_edit, 13,1, 1,1)
+        layout.addWidget(self.ransac_label, 14,0, 1,1)
+        layout.addWidget(self.ransac_check, 14,1, 1,1)
+        layout.addWidget(self.unattended_label, 15,0, 1,1)
+        layout.addWidget(self.unattended_check, 15,1, 1,1)
+        layout.addWidget(self.start_button, 16,0, 1,2)
         self.setLayout(layout)
 
         self.setWindowTitle("Calibration Routine Parameters")
@@ -459,24 +568,28 @@ class CalibrationDialog(QDialog):
 
     def load_int1(self):
         filename = QFileDialog.getOpenFileName(self, 'Load intrinsics file', data_dir,
-                                                    'Pickle files (*.pkl)')[0]
+                                                    'Intrinsics files (*.npz *.pkl)')[0]
         if filename:
-            with open(filename, 'rb') as f:
-                self.int1 = pickle.load(f)
+            self.int1 = store.load(filename)
             self.int1_button.setText(os.path.basename(self.int1.name))
 
     def load_int2(self):
         filename = QFileDialog.getOpenFileName(self, 'Load intrinsics file', data_dir,
-                                                    'Pickle files (*.pkl)')[0]
+                                                    'Intrinsics files (*.npz *.pkl)')[0]
         if filename:
-            with open(filename, 'rb') as f:
-                self.int2 = pickle.load(f)
+            self.int2 = store.load(filename)
             self.int2_button.setText(os.path.basename(self.int2.name))
 
     def handle_check(self):
         self.int1_button.setEnabled(self.intrinsics_check.checkState())
         self.int2_button.setEnabled(self.intrinsics_check.checkState())
 
+    def handle_incremental_check(self):
+        self.rmse_target_edit.setEnabled(self.incremental_check.checkState())
+
+    def handle_warm_check(self):
+        self.warm_dropdown.setEnabled(self.warm_check.checkState())
+
     def set_origin(self, pos):
         self.origin_value.setText('[%.1f, %.1f, %.1f]' % pos)
         self.origin = pos
@@ -512,6 +625,25 @@ class CalibrationDialog(QDialog):
         else:
             return None
 
+    def get_incremental(self):
+        # returns (incremental, rmse_target)
+        if not self.incremental_check.checkState():
+            return False, None
+        text = self.rmse_target_edit.text()
+        return True, (float(text) if text else None)
+
+    def get_reject_outliers(self):
+        return bool(self.ransac_check.checkState())
+
+    def get_unattended(self):
+        return bool(self.unattended_check.checkState())
+
+    def get_warm_start(self):
+        if self.warm_check.checkState() and self.warm_dropdown.is_selected():
+            return self.warm_dropdown.get_current()
+        else:
+            return None
+
     def go(self):
         self.accept()
 
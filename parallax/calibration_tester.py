@@ -69,16 +69,11 @@ class CalibrationTester(QWidget):
     def test_calibration(self):
         cal = self.model.calibrations[self.cal_dropdown.currentText()]
         nposes, ncorners, _ = self.opts.shape
-        delta = []
-        for i in range(nposes):
-            origin_cb = self.opts[i,0,:]
-            origin_cam = cal.triangulate(self.lipts[i,0,:], self.ripts[i,0,:])
-            for j in range(1, ncorners):
-                vec_cb = np.linalg.norm(self.opts[i,j,:] - origin_cb)
-                vec_cam = np.linalg.norm(cal.triangulate(self.lipts[i,j,:], self.ripts[i,j,:]) - \
-                                        origin_cam)
-                delta.append(vec_cam - vec_cb)
-        delta = np.array(delta, dtype=np.float32)
+        opts_cam = cal.triangulate_many(self.lipts.reshape((-1,2)), self.ripts.reshape((-1,2)))
+        opts_cam = opts_cam.reshape((nposes, ncorners, 3))
+        vec_cb = np.linalg.norm(self.opts[:,1:,:] - self.opts[:,:1,:], axis=2)
+        vec_cam = np.linalg.norm(opts_cam[:,1:,:] - opts_cam[:,:1,:], axis=2)
+        delta = (vec_cam - vec_cb).ravel().astype(np.float32)
         self.results_edit.append('mean(err) = %.2f' % np.mean(delta, axis=0))
         self.results_edit.append('std(err) = %.2f' % np.std(delta, axis=0))
         self.results_edit.append('rms(err) = %.2f' % np.sqrt(np.mean(delta * delta)))
@@ -1,21 +1,54 @@
 from PyQt5.QtCore import QObject, pyqtSignal
 import numpy as np
+import cv2
 import time
+from collections import deque
+
+from .calibration import Calibration, RANSAC_THRESHOLD
+from . import waypoints
 
 
 class CalibrationWorker(QObject):
     finished = pyqtSignal()
     calibration_point_reached = pyqtSignal(int, int, float, float, float)
+    # npts, rmse (um), fx stdev (px), prediction error (um)
+    calibration_updated = pyqtSignal(int, float, float, float)
+    msg_posted = pyqtSignal(str)
 
     RESOLUTION_DEFAULT = 3
     EXTENT_UM_DEFAULT = 2000
     ORIGIN_DEFAULT = (7500., 7500., 7500.)
+    MIN_POINTS_INCREMENTAL = 12
+    CONVERGE_COUNT = 3  # recent points whose prediction error must be below target
+    DIVERGENCE_FACTOR = 2.  # warm-started refit is redone cold if its RMSE grows this much
+    # unattended mode
+    NFRAMES_DEFAULT = 10    # detector frames (per camera) per calibration point
+    MAX_SPREAD_PX = 2.      # RMS spread of the detections about their median
+    MIN_DETECTION_RATE = 0.8    # fraction of frames with exactly one tip
+    SETTLE_TOL_UM = 1.      # stage is settled when it moves less than this...
+    SETTLE_TIME = 0.3       # ...for this long (seconds)
+    SETTLE_TIMEOUT = 10.
+    COLLECT_TIMEOUT = 10.
+    POLL_INTERVAL = 0.05
 
     def __init__(self, name, cs, stage, intrinsics, resolution=RESOLUTION_DEFAULT,
-                    extent_um=EXTENT_UM_DEFAULT, origin=ORIGIN_DEFAULT, parent=None):
+                    extent_um=EXTENT_UM_DEFAULT, origin=ORIGIN_DEFAULT, warm_start=None,
+                    incremental=False, rmse_target=None, reject_outliers=False,
+                    unattended=False, nframes=NFRAMES_DEFAULT, telemetry=None, parent=None):
         # resolution is number of steps per dimension, for 3 dimensions
         # (so default value of 3 will yield 3^3 = 27 calibration points)
         # extent_um is the extent in microns for each dimension, centered on zero
+        # warm_start is an optional previous Calibration to initialize the solve
+        # incremental: refit after each point (once there are enough), visiting the
+        #   grid coverage-first, and stop early once the prediction error (um) of the
+        #   latest fits is below rmse_target
+        # reject_outliers: exclude mis-clicked correspondences (RANSAC) from the fit
+        # unattended: after each move, wait for the stage to settle and take the
+        #   median of nframes tip detections from each screen (see update_left and
+        #   update_right); points that fail the spread/detection checks are queued
+        #   and visited again at the end for manual registration
+        # telemetry: StageTelemetry of the stage, to look up its position at the
+        #   capture times of the registered frames
         QObject.__init__(self)
         self.name = name
         self.cs = cs
@@ -24,19 +57,33 @@ class CalibrationWorker(QObject):
         self.resolution = resolution
         self.extent_um = extent_um
         self.origin = origin
+        self.warm_start = warm_start
+        self.incremental = incremental
+        self.rmse_target = rmse_target
+        self.reject_outliers = reject_outliers
+        self.unattended = unattended
+        self.nframes = nframes
+        self.telemetry = telemetry
+        self.cal = None     # latest incremental fit
+        self.review = []    # grid points left for manual registration
+        self.detections_left = deque()  # (timestamp, tip positions)
+        self.detections_right = deque()
 
         self.object_points = []  # units are mm
         self.num_cal = self.resolution**3
 
         self.img_points1 = []
         self.img_points2 = []
+        self.img_times = []     # frame capture times (left, right) of each point
+        self.moving = []        # points registered while the stage was moving
 
         self.complete = False
         self.alive = True
 
-    def register_corr_points(self, lcorr, rcorr):
+    def register_corr_points(self, lcorr, rcorr, times=None):
         self.img_points1.append(lcorr)
         self.img_points2.append(rcorr)
+        self.img_times.append(times)
 
     def carry_on(self):
         self.ready_to_go = True
@@ -44,33 +91,200 @@ class CalibrationWorker(QObject):
     def stop(self):
         self.alive = False
 
-    def run(self):
+    def get_grid_points(self):
         x1, x2 = self.origin[0]-self.extent_um/2., self.origin[0]+self.extent_um/2.
         y1, y2 = self.origin[1]-self.extent_um/2., self.origin[1]+self.extent_um/2.
         z1, z2 = self.origin[2]-self.extent_um/2., self.origin[2]+self.extent_um/2.
-        n = 0
-        for x in np.linspace(x1, x2, self.resolution):
-            for y in np.linspace(y1, y2, self.resolution):
-                for z in np.linspace(z1, z2, self.resolution):
-                    self.stage.move_absolute_3d(x,y,z, safe=False)
-                    self.calibration_point_reached.emit(n,self.num_cal, x,y,z)
-                    self.ready_to_go = False
-                    while self.alive and not self.ready_to_go:
-                        time.sleep(0.1)
+        xs = np.linspace(x1, x2, self.resolution)
+        ys = np.linspace(y1, y2, self.resolution)
+        zs = np.linspace(z1, z2, self.resolution)
+        grid = np.array([(x,y,z) for x in xs for y in ys for z in zs])
+        if self.incremental:
+            grid = grid[coverage_order(grid)]
+        else:
+            grid = grid[self.plan_order(grid)]
+        return grid
+
+    def plan_order(self, points):
+        # travel-optimized visiting order from the current stage position
+        return waypoints.plan_order(points, self.stage.get_position(),
+                                    waypoints.get_speeds(self.stage))
+
+    def update_left(self, tip_positions, timestamp):
+        if self.unattended:
+            self.detections_left.append((timestamp, tip_positions))
+
+    def update_right(self, tip_positions, timestamp):
+        if self.unattended:
+            self.detections_right.append((timestamp, tip_positions))
+
+    def run(self):
+        self.n = 0
+        self.pred_errors = []
+        self.complete = self.visit_points(self.get_grid_points(), self.unattended)
+        if self.complete and self.review:
+            self.msg_posted.emit('%d calibration points need manual registration' % \
+                                    len(self.review))
+            review, self.review = self.review, []
+            review = np.array(review)[self.plan_order(review)]
+            self.complete = self.visit_points(review, False)
+        self.finished.emit()
+
+    def visit_points(self, points, unattended):
+        # returns False if aborted, True when done (or converged)
+        for x,y,z in points:
+            self.stage.move_absolute_3d(x,y,z, safe=False)
+            if unattended:
+                if not self.register_detected_points(x,y,z):
                     if not self.alive:
-                        break
-                    pos = self.stage.get_position()
-                    self.object_points.append(list(pos))
-                    n += 1
-                else:
+                        return False
+                    self.review.append((x,y,z))
                     continue
-                break
             else:
-                continue
-            break
-        else:
-            self.complete = True
-        self.finished.emit()
+                self.calibration_point_reached.emit(self.n,self.num_cal, x,y,z)
+                self.ready_to_go = False
+                while self.alive and not self.ready_to_go:
+                    time.sleep(0.1)
+                if not self.alive:
+                    return False
+            pos = self.get_stage_position()
+            self.object_points.append(list(pos))
+            self.n += 1
+            if self.incremental and self.update_fit(pos):
+                return True
+        return True
+
+    def get_stage_position(self):
+        # stage position when the frames of the last registered point were captured
+        times = self.img_times[-1]
+        if (self.telemetry is not None) and (times is not None) and (None not in times):
+            pos, moving = self.telemetry.register(times)
+            if moving:
+                self.moving.append(self.n)
+                self.msg_posted.emit('Warning: stage was moving when the frames of '
+                                        'calibration point %d were captured' % (self.n+1))
+            if pos is not None:
+                return pos
+        return self.stage.get_position()
+
+    def update_fit(self, pos):
+        # refit with the new point; returns True once converged
+        if self.n < self.MIN_POINTS_INCREMENTAL:
+            return False
+        if self.cal is not None:
+            # out-of-sample check: predict the new point before refitting
+            # (the fit RMSE itself is optimistic with few points)
+            obj_point = self.cal.triangulate(self.img_points1[-1], self.img_points2[-1])
+            self.pred_errors.append(np.linalg.norm(obj_point - np.array(pos)))
+        if not self.refit():
+            return False
+        pred_rms = np.sqrt(np.mean(np.square(self.pred_errors[-self.CONVERGE_COUNT:]))) \
+                    if self.pred_errors else np.nan
+        sigma_fx = max(self.cal.convergence['std_intrinsics1'][0],
+                        self.cal.convergence['std_intrinsics2'][0])
+        self.calibration_updated.emit(self.n, self.cal.rmse, sigma_fx, pred_rms)
+        return (self.rmse_target is not None) and \
+                (len(self.pred_errors) >= self.CONVERGE_COUNT) and (pred_rms < self.rmse_target)
+
+    def wait_for_settle(self):
+        # returns the time the stage settled, or None on timeout/abort
+        t0 = time.time()
+        last = np.array(self.stage.get_position())
+        t_still = time.time()
+        while self.alive and (time.time() - t0 < self.SETTLE_TIMEOUT):
+            time.sleep(self.POLL_INTERVAL)
+            pos = np.array(self.stage.get_position())
+            t = time.time()
+            if np.max(np.abs(pos - last)) > self.SETTLE_TOL_UM:
+                t_still = t
+            elif t - t_still >= self.SETTLE_TIME:
+                return t
+            last = pos
+        return None
+
+    def collect_detections(self, t_settled):
+        # detector outputs captured after t_settled, nframes per camera (or timeout)
+        self.detections_left.clear()
+        self.detections_right.clear()
+        t0 = time.time()
+        while self.alive and (time.time() - t0 < self.COLLECT_TIMEOUT):
+            left = [d for d in self.detections_left if d[0] >= t_settled]
+            right = [d for d in self.detections_right if d[0] >= t_settled]
+            if (len(left) >= self.nframes) and (len(right) >= self.nframes):
+                return left[:self.nframes], right[:self.nframes]
+            time.sleep(self.POLL_INTERVAL)
+        return None, None
+
+    def register_detected_points(self, x, y, z):
+        """
+        Unattended registration: returns True if the median detections were
+        accepted and registered, False if the point needs manual review.
+        """
+        t_settled = self.wait_for_settle()
+        if t_settled is None:
+            self.msg_posted.emit('Calibration point [%.1f, %.1f, %.1f]: stage did not settle' % \
+                                    (x,y,z))
+            return False
+        left, right = self.collect_detections(t_settled)
+        if left is None:
+            self.msg_posted.emit('Calibration point [%.1f, %.1f, %.1f]: no detections' % (x,y,z))
+            return False
+        median1, spread1, rate1 = detection_stats(left)
+        median2, spread2, rate2 = detection_stats(right)
+        spread = max(spread1, spread2)
+        rate = min(rate1, rate2)
+        if (rate < self.MIN_DETECTION_RATE) or not (spread <= self.MAX_SPREAD_PX):
+            self.msg_posted.emit('Calibration point [%.1f, %.1f, %.1f] queued for review: '
+                                    'spread %.2f px, detection rate %.0f%%' % \
+                                    (x,y,z, spread, rate*100))
+            return False
+        # capture times of the frames the medians come from
+        times_left = [d[0] for d in left if len(d[1]) == 1]
+        times_right = [d[0] for d in right if len(d[1]) == 1]
+        if not (times_left and times_right):
+            self.msg_posted.emit('Calibration point [%.1f, %.1f, %.1f] queued for review: '
+                                    'no frames with a single tip' % (x,y,z))
+            return False
+        times = (np.median(times_left), np.median(times_right))
+        self.register_corr_points(tuple(median1), tuple(median2), times)
+        self.msg_posted.emit('Calibration point %d (of %d) registered: (%.1f,%.1f) and '
+                                '(%.1f,%.1f), spread %.2f px' % (self.n+1, self.num_cal,
+                                median1[0], median1[1], median2[0], median2[1], spread))
+        return True
+
+    def refit(self):
+        # warm-started from the previous fit; with few points the distortion is
+        # poorly constrained, so fall back to a cold solve if the warm one diverges.
+        # Returns False (keeping the previous fit) if the points admit no fit yet
+        cal = None
+        if self.cal is not None:
+            try:
+                cal = self.make_calibration(self.cal)
+                if not (cal.rmse < self.DIVERGENCE_FACTOR * self.cal.rmse):
+                    cal = None
+            except cv2.error:
+                cal = None
+        if cal is None:
+            try:
+                cal = self.make_calibration(self.warm_start)
+            except (cv2.error, np.linalg.LinAlgError) as e:
+                self.msg_posted.emit('Fit with %d calibration points failed, refit skipped '
+                                        '(%s)' % (self.n, str(e).strip()))
+                return False
+        self.cal = cal
+        return True
+
+    def make_calibration(self, warm_start=None):
+        cal = Calibration(self.name, self.cs)
+        if (self.intrinsics is not None):
+            int1, int2 = self.intrinsics
+            cal.set_initial_intrinsics(int1.mtx, int2.mtx, int1.dist, int2.dist, fixed=True)
+        img_points1, img_points2 = self.get_image_points()
+        obj_points = self.get_object_points()
+        ransac_threshold = RANSAC_THRESHOLD if self.reject_outliers else None
+        cal.calibrate(img_points1, img_points2, obj_points, warm_start=warm_start,
+                        ransac_threshold=ransac_threshold)
+        return cal
 
     def get_image_points(self):
         return np.array([self.img_points1], dtype=np.float32),  \
@@ -79,3 +293,33 @@ class CalibrationWorker(QObject):
     def get_object_points(self):
         return np.array([self.object_points], dtype=np.float32)
 
+
+
+def detection_stats(detections):
+    """
+    Median tip position, RMS spread about it (pixels) and the fraction of
+    frames with exactly one tip, for a list of (timestamp, tip positions)
+    with one entry per processed frame (including frames without tips).
+    """
+    tips = np.array([d[1][0] for d in detections if len(d[1]) == 1], dtype=np.float64)
+    rate = len(tips) / len(detections)
+    if len(tips) == 0:
+        return None, np.inf, rate
+    median = np.median(tips, axis=0)
+    spread = np.sqrt(np.mean(np.sum((tips - median)**2, axis=1)))
+    return median, spread, rate
+
+def coverage_order(points):
+    """
+    Greedy farthest-point ordering: start at the first point, then always visit
+    the point farthest from all points visited so far, so that any prefix of
+    the sequence spans the volume as evenly as possible.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    order = [0]
+    dmin = np.linalg.norm(points - points[0], axis=1)
+    for i in range(1, len(points)):
+        j = int(np.argmax(dmin))
+        order.append(j)
+        dmin = np.minimum(dmin, np.linalg.norm(points - points[j], axis=1))
+    return np.array(order)
@@ -32,6 +32,8 @@ def close_cameras():
 
 class PySpinCamera:
 
+    CLOCK_SYNC_INTERVAL = 10.   # seconds between re-syncs of the camera clock offset
+
     pyspin_cameras = None
     pyspin_instance = None
     cameras = []
@@ -87,8 +89,12 @@ class PySpinCamera:
         node_expauto_mode.SetIntValue(node_expauto_mode_off.GetValue())
         node_exptime = PySpin.CFloatPtr(self.node_map.GetNode("ExposureTime"))
         node_exptime.SetValue(125000)   # 8 fps
+        self.exposure_time = node_exptime.GetValue() * 1e-6     # seconds
 
         self.last_image = None
+        self.last_capture_time = None
+        self.clock_offset = None
+        self.clock_sync_time = 0.
 
         # begin acquisition
         self.begin_acquisition()
@@ -113,14 +119,40 @@ class PySpinCamera:
         self.capture_thread = threading.Thread(target=self.capture_loop, daemon=True)
         self.capture_thread.start()
 
-    def capture(self):
-        ts = time.time()
-        self.last_capture_time = ts
+    def sync_clock(self):
+        """
+        Offset (seconds) from the camera's timestamp clock to time.time(), from
+        a latched camera timestamp, or None if the camera can't latch one.
+        """
+        node_latch = PySpin.CCommandPtr(self.node_map.GetNode('TimestampLatch'))
+        node_value = PySpin.CIntegerPtr(self.node_map.GetNode('TimestampLatchValue'))
+        if not (PySpin.IsAvailable(node_latch) and PySpin.IsWritable(node_latch) and \
+                PySpin.IsAvailable(node_value) and PySpin.IsReadable(node_value)):
+            return None
+        t0 = time.time()
+        node_latch.Execute()
+        t1 = time.time()
+        return (t0 + t1) / 2. - node_value.GetValue() * 1e-9
 
+    def capture(self):
         image = self.camera.GetNextImage(1000)
+        t_received = time.time()
         while image.IsIncomplete():
             time.sleep(0.001)
 
+        # capture time: middle of the exposure, from the image's device timestamp
+        # (exposure start, ns); the camera clock offset is re-synced periodically
+        # since the clocks drift apart. Without device timestamps, the time the
+        # image arrived (late by the readout and transfer time)
+        if t_received - self.clock_sync_time > self.CLOCK_SYNC_INTERVAL:
+            self.clock_offset = self.sync_clock()
+            self.clock_sync_time = t_received
+        device_ts = image.GetTimeStamp()
+        if (self.clock_offset is not None) and device_ts:
+            ts = device_ts * 1e-9 + self.clock_offset + self.exposure_time / 2.
+        else:
+            ts = t_received
+
         if self.last_image is not None:
             try:
                 self.last_image.Release()
@@ -128,6 +160,7 @@ class PySpinCamera:
                 print("Spinnaker Exception: Couldn't release last image")
 
         self.last_image = image
+        self.last_capture_time = ts
 
     def get_last_capture_time(self):
         ts = self.last_capture_time
@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QPushButton, QLabel, QWidget, QFrame, QComboBox
+from PyQt5.QtWidgets import QPushButton, QLabel, QWidget, QFrame
 from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGridLayout, QCheckBox
 from PyQt5.QtWidgets import QSpinBox, QMenu
 from PyQt5.QtWidgets import QFileDialog, QLineEdit, QListWidget, QListWidgetItem, QAbstractItemView
@@ -9,13 +9,15 @@ import numpy as np
 import time
 import datetime
 import csv
+import hashlib
 
 from .helper import FONT_BOLD
 from . import get_image_file, data_dir
-from .stage_dropdown import StageDropdown, CalibrationDropdown
+from .stage_dropdown import StageDropdown, CalibrationDropdown, TransformDropdown
 from .transform import TransformNP
 from .points import Point3D
-from .formations import mapping
+from . import formations
+from . import waypoints
 
 
 class CameraToProbeTransformTool(QWidget):
@@ -47,6 +49,7 @@ class CameraToProbeTransformTool(QWidget):
         self.gen_panel.msg_posted.connect(self.msg_posted)
         self.auto_panel.corr_generated.connect(self.corr_panel.add_correspondence)
         self.gen_panel.transform_generated.connect(self.transform_generated)
+        self.gen_panel.transform_generated.connect(self.auto_panel.fov_dropdown.populate)
 
         self.setWindowTitle('Camera-to-Probe Transform Tool')
         self.setWindowIcon(QIcon(get_image_file('sextant.png')))
@@ -55,6 +58,11 @@ class CameraToProbeTransformTool(QWidget):
         if self.auto_panel.kb_check.isChecked():
             self.auto_panel.register()
 
+    def showEvent(self, e):
+        # transforms may have been added or loaded while the tool was hidden
+        self.auto_panel.fov_dropdown.populate()
+        QWidget.showEvent(self, e)
+
     def closeEvent(self, e):
         self.auto_panel.stop()
         QWidget.closeEvent(self, e)
@@ -86,9 +94,10 @@ class AutomationPanel(QFrame):
         self.stage_dropdown.activated.connect(self.update_status)
         self.ncorr_label = QLabel('# of points:')
         self.ncorr_label.setAlignment(Qt.AlignCenter)
-        self.ncorr_box = QComboBox()
-        for ncorr in mapping.keys():
-            self.ncorr_box.addItem(str(ncorr))
+        self.ncorr_box = QSpinBox()
+        self.ncorr_box.setMinimum(4)
+        self.ncorr_box.setMaximum(200)
+        self.ncorr_box.setValue(12)
         self.origin_label = QLabel('Origin:')
         self.origin_label.setAlignment(Qt.AlignCenter)
         self.origin_value = QLabel()
@@ -100,6 +109,12 @@ class AutomationPanel(QFrame):
         self.cal_label = QLabel('Calibration:')
         self.cal_label.setAlignment(Qt.AlignCenter)
         self.cal_dropdown = CalibrationDropdown(self.model)
+        self.fov_label = QLabel('Field of view:')
+        self.fov_label.setAlignment(Qt.AlignCenter)
+        self.fov_dropdown = TransformDropdown(self.model, ['(unconstrained)', '(calibration)'])
+        self.fov_dropdown.setToolTip('Keep the points visible to both cameras: stage '
+                                        'positions are in calibration coordinates, or are '
+                                        'mapped with the selected transform')
         self.start_stop_button = QPushButton('Start Automation')
         self.start_stop_button.setFont(FONT_BOLD)
         self.start_stop_button.setEnabled(False)
@@ -128,7 +143,9 @@ class AutomationPanel(QFrame):
         layout.addWidget(self.origin_button, 5,0, 1,2)
         layout.addWidget(self.cal_label, 6,0, 1,1)
         layout.addWidget(self.cal_dropdown, 6,1, 1,1)
-        layout.addWidget(self.start_stop_button, 7,0, 1,2)
+        layout.addWidget(self.fov_label, 7,0, 1,1)
+        layout.addWidget(self.fov_dropdown, 7,1, 1,1)
+        layout.addWidget(self.start_stop_button, 8,0, 1,2)
         self.setLayout(layout)
 
         self.state = self.STATE_NOT_RUNNING
@@ -159,11 +176,29 @@ class AutomationPanel(QFrame):
         return self.cal_dropdown.get_current()
 
     def get_ncorr(self):
-        return int(self.ncorr_box.currentText())
+        return self.ncorr_box.value()
 
     def get_radius(self):
         return float(self.radius_edit.text())
 
+    def get_formation(self, ncorr, radius, origin):
+        # formation points (stage coordinates), optionally within the field of view
+        index = self.fov_dropdown.currentIndex()
+        if index <= 0:
+            return formations.generate(ncorr, radius, origin)
+        cal = self.get_calibration()
+        transform = self.model.transforms[self.fov_dropdown.currentText()] \
+                        if index > 1 else None
+        visible = formations.field_of_view(cal, transform)
+        # identify the constraint by its numbers, not by names
+        h = hashlib.sha1()
+        for a in cal.get_projection_matrices() + (cal.mtx1, cal.dist1, cal.mtx2, cal.dist2,
+                                                    cal.offset, radius, origin):
+            h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+        if transform is not None:
+            h.update(np.ascontiguousarray(transform.params, dtype=np.float64).tobytes())
+        return formations.generate(ncorr, radius, origin, visible, h.hexdigest()[:16])
+
     def update_status(self):
         if self.stage_dropdown.is_selected():
             self.origin_button.setEnabled(True)
@@ -181,7 +216,15 @@ class AutomationPanel(QFrame):
         ncorr = self.get_ncorr()
         radius = self.get_radius()
         origin = np.array(self.get_origin(), dtype=np.float32)
-        points = mapping[ncorr] * radius + origin
+        try:
+            points = self.get_formation(ncorr, radius, origin)
+        except ValueError as e:
+            self.msg_posted.emit('Automation: %s' % e)
+            return
+        sigma = formations.parameter_std(points - origin)
+        self.msg_posted.emit('Formation of %d points: predicted transform uncertainty '
+                                '%.3f mrad, %.2f um (per um of tip position noise)' % \
+                                (ncorr, np.max(sigma[:3])*1e3, np.max(sigma[3:])))
 
         self.thread = QThread()
         self.worker = AutomationWorker(stage, points)
@@ -195,6 +238,7 @@ class AutomationPanel(QFrame):
 
         self.stage_running = stage
         self.cal_running = self.get_calibration()
+        self.model.get_telemetry(stage)   # start recording the stage position
         self.ncorr_running = ncorr
 
         self.set_running(True)
@@ -237,7 +281,17 @@ class AutomationPanel(QFrame):
                                         'correspondence point.')
                 return
             coord_camera = tuple(self.cal_running.triangulate(lipt, ript))
-            coord_probe = self.stage_running.get_position()
+            # stage position when the selected frames were captured
+            times = (self.screen1.get_selected_time(), self.screen2.get_selected_time())
+            coord_probe, moving = None, False
+            if None not in times:
+                telemetry = self.model.get_telemetry(self.stage_running)
+                coord_probe, moving = telemetry.register(times)
+            if moving:
+                self.msg_posted.emit('Warning: stage was moving when the registered frames '
+                                        'were captured.')
+            if coord_probe is None:
+                coord_probe = self.stage_running.get_position()
             p1 = Point3D('auto%03d_camera')
             p1.set_coordinates(*coord_camera)
             p1.set_img_points(lipt + ript)
@@ -271,6 +325,9 @@ class AutomationWorker(QObject):
         self.alive = False
 
     def run(self):
+        order = waypoints.plan_order(self.points, self.stage.get_position(),
+                                        waypoints.get_speeds(self.stage))
+        self.points = self.points[order]
         for i in range(self.npoints):
             x,y,z = self.points[i,:]
             self.stage.move_absolute_3d(x,y,z, safe=False)
@@ -390,6 +447,9 @@ class GeneratePanel(QFrame):
         self.to_cs_edit = QLineEdit('probe')
         self.generate_button = QPushButton('Generate')
         self.generate_button.clicked.connect(self.generate)
+        self.ransac_check = QCheckBox('Reject Outliers')
+        self.ransac_check.setToolTip('Exclude correspondence points inconsistent with '
+                                        'the others (RANSAC)')
 
         layout = QGridLayout()
         layout.addWidget(self.gen_label, 0,0, 1,2)
@@ -399,7 +459,8 @@ class GeneratePanel(QFrame):
         layout.addWidget(self.from_cs_edit, 2,1, 1,1)
         layout.addWidget(self.to_cs_label, 3,0, 1,1)
         layout.addWidget(self.to_cs_edit, 3,1, 1,1)
-        layout.addWidget(self.generate_button, 4,0, 1,2)
+        layout.addWidget(self.ransac_check, 4,0, 1,2)
+        layout.addWidget(self.generate_button, 5,0, 1,2)
         self.setLayout(layout)
 
         self.setMinimumWidth(400)
@@ -417,7 +478,14 @@ class GeneratePanel(QFrame):
         from_cs = self.from_cs_edit.text()
         to_cs = self.to_cs_edit.text()
         transform = TransformNP(name, from_cs, to_cs)
-        transform.compute_from_correspondence(p1, p2)
+        if self.ransac_check.isChecked():
+            transform.compute_from_correspondence_ransac(p1, p2)
+            outliers = transform.get_outliers()
+            if outliers:
+                self.msg_posted.emit('Probe Transform Tool: rejected correspondence points %s' \
+                                        % ', '.join(str(i+1) for i in outliers))
+        else:
+            transform.compute_from_correspondence(p1, p2)
         self.model.add_transform(transform)
         self.transform_generated.emit()
 
@@ -5,6 +5,7 @@ from PyQt5.QtGui import QIcon
 
 import cv2
 import numpy as np
+import pyqtgraph as pg
 import time
 import datetime
 import os
@@ -13,6 +14,8 @@ import pickle
 from . import get_image_file, data_dir
 from .screen_widget import ScreenWidget
 from .filters import CheckerboardFilter, CheckerboardSmoothFilter
+from .helper import WF, HF
+from .pose_selection import GRID, COVER_DEPTH, coverage_map, suggest_region
 
 CB_ROWS = 19 #number of checkerboard rows.
 CB_COLS = 19 #number of checkerboard columns.
@@ -24,6 +27,62 @@ OBJPOINTS_CB[:,:2] = np.mgrid[0:CB_ROWS,0:CB_COLS].T.reshape(-1,2)
 OBJPOINTS_CB = WORLD_SCALE * OBJPOINTS_CB
 
 
+class CoverageWidget(QWidget):
+
+    """
+    Heatmap of how many grabbed poses cover each part of the frame (saturating
+    at COVER_DEPTH), with the outline of the currently detected board, and a
+    hint of where to move the board next.
+    """
+
+    def __init__(self, parent=None):
+        QWidget.__init__(self, parent=parent)
+
+        self.view = pg.GraphicsView()
+        self.view_box = pg.ViewBox(defaultPadding=0)
+        self.view.setCentralItem(self.view_box)
+        self.view_box.setAspectLocked()
+        self.view_box.invertY()
+        self.view_box.setMouseEnabled(x=False, y=False)
+        self.view.setFixedHeight(120)
+
+        self.image_item = pg.ImageItem(axisOrder='row-major')
+        self.image_item.setColorMap(pg.colormap.get('viridis'))
+        self.view_box.addItem(self.image_item)
+        self.outline = pg.PlotCurveItem(pen=pg.mkPen('r', width=2))
+        self.view_box.addItem(self.outline)
+
+        self.label = QLabel()
+        self.label.setAlignment(Qt.AlignCenter)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0,0,0,0)
+        layout.addWidget(self.view)
+        layout.addWidget(self.label)
+        self.setLayout(layout)
+
+        self.set_poses([])
+
+    def set_poses(self, img_points):
+        counts = coverage_map(img_points)
+        self.image_item.setImage(counts, levels=(0, COVER_DEPTH))
+        coverage = np.mean(np.minimum(counts, COVER_DEPTH)) / COVER_DEPTH
+        if coverage < 1:
+            self.label.setText('Coverage: %.0f%%, move the board to the %s' % \
+                                (100 * coverage, suggest_region(counts)))
+        else:
+            self.label.setText('Coverage: 100%')
+
+    def set_current(self, corners):
+        if corners is None:
+            self.outline.setData([], [])
+            return
+        pts = np.asarray(corners).reshape((-1,2)) * [GRID[1] / WF, GRID[0] / HF]
+        hull = cv2.convexHull(pts.astype(np.float32)).reshape((-1,2))
+        hull = np.concatenate((hull, hull[:1]))
+        self.outline.setData(hull[:,0], hull[:,1])
+
+
 class CheckerboardToolMono(QWidget):
     msg_posted = pyqtSignal(str)
 
@@ -42,8 +101,11 @@ class CheckerboardToolMono(QWidget):
         self.load_corners_button = QPushButton('Load Corners')
         self.load_corners_button.clicked.connect(self.load_corners)
 
+        self.coverage = CoverageWidget()
+
         self.layout = QVBoxLayout()
         self.layout.addWidget(self.lscreen)
+        self.layout.addWidget(self.coverage)
         self.layout.addWidget(self.grab_button)
         self.layout.addWidget(self.save_corners_button)
         self.layout.addWidget(self.load_corners_button)
@@ -54,6 +116,7 @@ class CheckerboardToolMono(QWidget):
 
         self.refresh_timer = QTimer()
         self.refresh_timer.timeout.connect(self.lscreen.refresh)
+        self.refresh_timer.timeout.connect(self.update_coverage)
         self.refresh_timer.start(250)
 
         self.opts = []  # object points
@@ -71,6 +134,14 @@ class CheckerboardToolMono(QWidget):
 
     def update_gui(self):
         self.save_corners_button.setText('Save Corners (%d)' % len(self.opts))
+        self.coverage.set_poses(self.ipts)
+
+    def update_coverage(self):
+        lfilter = self.lscreen.filter
+        if isinstance(lfilter, (CheckerboardFilter, CheckerboardSmoothFilter)):
+            self.coverage.set_current(lfilter.worker.corners)
+        else:
+            self.coverage.set_current(None)
 
     def save_corners(self):
         ts = time.time()
@@ -119,8 +190,15 @@ class CheckerboardToolStereo(QWidget):
         self.screens_layout.addWidget(self.lscreen)
         self.screens_layout.addWidget(self.rscreen)
 
+        self.lcoverage = CoverageWidget()
+        self.rcoverage = CoverageWidget()
+        self.coverage_layout = QHBoxLayout()
+        self.coverage_layout.addWidget(self.lcoverage)
+        self.coverage_layout.addWidget(self.rcoverage)
+
         self.layout = QVBoxLayout()
         self.layout.addLayout(self.screens_layout)
+        self.layout.addLayout(self.coverage_layout)
         self.layout.addWidget(self.grab_button)
         self.layout.addWidget(self.save_button)
         self.layout.addWidget(self.load_button)
@@ -132,6 +210,7 @@ class CheckerboardToolStereo(QWidget):
         self.refresh_timer = QTimer()
         self.refresh_timer.timeout.connect(self.lscreen.refresh)
         self.refresh_timer.timeout.connect(self.rscreen.refresh)
+        self.refresh_timer.timeout.connect(self.update_coverage)
         self.refresh_timer.start(250)
 
         self.opts = []  # object points
@@ -155,6 +234,15 @@ class CheckerboardToolStereo(QWidget):
 
     def update_text(self):
         self.save_button.setText('Save Corners (%d)' % len(self.opts))
+        self.lcoverage.set_poses(self.lipts)
+        self.rcoverage.set_poses(self.ripts)
+
+    def update_coverage(self):
+        for screen, coverage in ((self.lscreen, self.lcoverage), (self.rscreen, self.rcoverage)):
+            if isinstance(screen.filter, (CheckerboardFilter, CheckerboardSmoothFilter)):
+                coverage.set_current(screen.filter.worker.corners)
+            else:
+                coverage.set_current(None)
 
     def save_corners(self):
         ts = time.time()
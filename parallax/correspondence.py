@@ -0,0 +1,106 @@
+"""
+Automatic correspondence search: given a point in one camera's frame, find the
+matching point in the other camera's frame along the epipolar line, by
+normalized cross-correlation of image patches over an image pyramid (coarse
+to fine), with sub-pixel refinement along the line.
+"""
+
+import numpy as np
+import cv2
+
+from .helper import WF, HF
+
+
+PATCH_RADIUS = 8        # pixels, at each pyramid level
+NLEVELS = 3             # pyramid levels (full, 1/2, 1/4 resolution)
+SCORE_ACCEPT = 0.8      # NCC score to auto-select a match
+
+
+def to_gray(frame):
+    if frame.ndim > 2:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+def pyramid(frame, nlevels=NLEVELS):
+    levels = [to_gray(frame).astype(np.float32)]
+    for i in range(nlevels - 1):
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+def sample_patches(img, centers, radius):
+    # (N,2) centers (level pixels) -> (N, (2*radius+1)**2) bilinearly sampled patches
+    d = np.arange(-radius, radius+1, dtype=np.float32)
+    dx, dy = np.meshgrid(d, d)
+    map_x = (centers[:,0,None] + dx.ravel()[None,:]).astype(np.float32)
+    map_y = (centers[:,1,None] + dy.ravel()[None,:]).astype(np.float32)
+    return cv2.remap(img, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+def ncc(template, patches):
+    t = template.ravel() - np.mean(template)
+    p = patches - np.mean(patches, axis=1, keepdims=True)
+    denom = np.linalg.norm(p, axis=1) * np.linalg.norm(t)
+    return np.where(denom > 0, (p @ t) / np.where(denom > 0, denom, 1.), -1.)
+
+def epipolar_line(cal, pt, src_camera):
+    # line (a,b,c) in the other camera's undistorted image, with a^2 + b^2 = 1
+    pt_ud = cal.undistort([pt], [pt])[src_camera][0]
+    F = cal.get_fundamental_matrix()
+    if src_camera == 1:
+        F = F.T
+    line = F @ np.array([pt_ud[0], pt_ud[1], 1.])
+    return line / np.linalg.norm(line[:2])
+
+def search_epipolar(cal, frame_src, frame_dst, pt, src_camera=0, radius=PATCH_RADIUS,
+                    nlevels=NLEVELS):
+    """
+    Find the point in frame_dst corresponding to pt (x,y) in frame_src.
+    cal is a two-camera Calibration; src_camera is 0 (left) or 1 (right).
+    Returns ((x,y), score) with the NCC score in [-1,1], or (None, None)
+    if the epipolar line doesn't cross the other frame.
+    """
+    dst_camera = 1 - src_camera
+    pyr_src = pyramid(frame_src, nlevels)
+    pyr_dst = pyramid(frame_dst, nlevels)
+    pt = np.asarray(pt, dtype=np.float64)
+
+    # parametrize the line by arc length t (undistorted pixels) from the point
+    # closest to the image center
+    a, b, c = epipolar_line(cal, pt, src_camera)
+    center = np.array([WF/2., HF/2.])
+    p0 = center - (a*center[0] + b*center[1] + c) * np.array([a, b])
+    direction = np.array([b, -a])
+    def to_frame(t):
+        pts_ud = p0 + np.asarray(t)[:,None] * direction
+        return cal.unrectify_points(dst_camera, pts_ud, 1., rectify=False)
+
+    # candidates that land inside the destination frame
+    half = np.hypot(WF, HF) / 2.
+    t = np.arange(-half, half, 2**(nlevels-1))
+    pts = to_frame(t)
+    inside = np.all((pts >= 0) & (pts < (WF, HF)), axis=1)
+    if not np.any(inside):
+        return None, None
+    t = t[inside]
+
+    # coarsest level: all candidates; finer levels: around the previous best
+    t_best = None
+    for level in reversed(range(nlevels)):
+        s = 2.**level
+        if t_best is not None:
+            t = t_best + np.arange(-2*s, 2*s + 1, s)
+        template = sample_patches(pyr_src[level], pt[None,:] / s, radius)
+        scores = ncc(template, sample_patches(pyr_dst[level], to_frame(t) / s, radius))
+        k = int(np.argmax(scores))
+        t_best = t[k]
+
+    # sub-pixel: parabola through the neighbors along the line
+    score = scores[k]
+    if 0 < k < len(t) - 1:
+        s0, s1, s2 = scores[k-1], scores[k], scores[k+1]
+        denom = s0 - 2*s1 + s2
+        if denom < 0:
+            offset = 0.5 * (s0 - s2) / denom
+            t_best += offset * (t[1] - t[0])
+            score = s1 - 0.25 * (s0 - s2) * offset
+    x, y = to_frame([t_best])[0]
+    return (float(x), float(y)), float(score)
@@ -4,15 +4,15 @@ import random
 import time
 import os
 
-import sleap
 from time import perf_counter
 
 from PyQt5.QtWidgets import QWidget, QLabel, QSlider, QPushButton
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QFileDialog
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox
 from PyQt5.QtCore import pyqtSignal, Qt, QThread, QObject
 
 from . import data_dir, training_dir
 from .helper import FONT_BOLD
+from .tip_model import TipModel, export_model
 
 
 class NoDetector:
@@ -22,7 +22,9 @@ class NoDetector:
     def __init__(self):
         pass
 
-    def process(self, frame): return None
+    def process(self, frame, frame_time=None): return None
+
+    def detect(self, frame): return []
 
     def launch_control_panel(self):
         pass
@@ -34,12 +36,12 @@ class SleapDetector(QObject):
 
     name = 'SLEAP'
 
-    tracked = pyqtSignal(list)
+    tracked = pyqtSignal(list, float)   # tip positions, frame capture time
 
     class SleapWorker(QObject):
 
         finished = pyqtSignal()
-        tracked = pyqtSignal(list)
+        tracked = pyqtSignal(list, float)
         fps_updated = pyqtSignal(float)
         ninstances_updated = pyqtSignal(int)
 
@@ -52,25 +54,29 @@ class SleapDetector(QObject):
         def set_predictor(self, predictor):
             self.predictor = predictor
 
-        def update_frame(self, frame):
-            self.frame = frame
+        def update_frame(self, frame, frame_time):
+            self.frame = (frame, frame_time)
             self.new = True
 
-        def process(self, frame):
-            frame = np.array([frame])
-            t0 = perf_counter()
-            labeled_frames = self.predictor.predict(frame)        
-            self.dt = perf_counter() - t0
-            self.fps_updated.emit(1./self.dt)
+        def predict(self, frame):
+            labeled_frames = self.predictor.predict(np.array([frame]))
             labeled_frame = labeled_frames[0]
             tip_positions = []
             for i, instance in enumerate(labeled_frame.instances):
                 point = instance.points[0]
                 tip_positions.append((point.x, point.y))
+            return tip_positions
+
+        def process(self, frame, frame_time):
+            t0 = perf_counter()
+            tip_positions = self.predict(frame)
+            self.dt = perf_counter() - t0
+            self.fps_updated.emit(1./self.dt)
             self.ninstances = len(tip_positions)
             self.ninstances_updated.emit(self.ninstances)
-            if self.ninstances >= 1:
-                self.tracked.emit(tip_positions)
+            # emitted for every frame, also when nothing was found (so missed
+            # frames count against the detection rate, see detection_stats)
+            self.tracked.emit(tip_positions, frame_time)
 
         def stop_running(self):
             self.running = False
@@ -82,7 +88,7 @@ class SleapDetector(QObject):
             while self.running:
                 if self.predictor is not None:
                     if self.new:
-                        self.process(self.frame)
+                        self.process(*self.frame)
                         self.new = False
                 time.sleep(0.01)
             self.finished.emit()
@@ -108,6 +114,9 @@ class SleapDetector(QObject):
             self.instance_label.clicked.connect(self.select_instance_dir)
             self.load_button = QPushButton('Load Model')
             self.load_button.clicked.connect(self.load)
+            self.export_button = QPushButton('Export for CPU')
+            self.export_button.setToolTip('Export this model for the SLEAP (CPU) detector')
+            self.export_button.clicked.connect(self.export)
             self.fps_label = QLabel('(fps)')
             self.fps_label.setAlignment(Qt.AlignCenter)
             self.ninstances_label = QLabel('(ninstances)')
@@ -116,6 +125,7 @@ class SleapDetector(QObject):
             layout.addWidget(self.centroid_label)
             layout.addWidget(self.instance_label)
             layout.addWidget(self.load_button)
+            layout.addWidget(self.export_button)
             layout.addWidget(self.fps_label)
             layout.addWidget(self.ninstances_label)
             self.setLayout(layout)
@@ -144,6 +154,21 @@ class SleapDetector(QObject):
             if self.centroid_dir and self.instance_dir:
                 self.model_selected.emit(self.centroid_dir, self.instance_dir)
 
+        def export(self):
+            if not (self.centroid_dir and self.instance_dir):
+                return
+            output_dir = QFileDialog.getExistingDirectory(self, 'Select Export Directory',
+                                                    os.path.join(training_dir, 'models'),
+                                                    QFileDialog.ShowDirsOnly)
+            if output_dir:
+                try:
+                    export_model(self.centroid_dir, self.instance_dir, output_dir)
+                except Exception as e:
+                    QMessageBox.warning(self, 'Export failed', str(e))
+                    return
+                QMessageBox.information(self, 'Export complete',
+                                        'Model exported to: %s' % output_dir)
+
         def update_fps(self, fps):
             self.fps_label.setText('%.2f FPS' % fps)
 
@@ -178,20 +203,114 @@ class SleapDetector(QObject):
         self.cv_thread.wait()
 
     def load_model(self, centroid_dir, instance_dir):
+        import sleap    # deferred, pulls in tensorflow
         predictor = sleap.load_model([centroid_dir, instance_dir], batch_size=1, tracker='simple')
         predictor.verbosity = None  # NECESSARY for multiple detector instances
         self.cv_worker.set_predictor(predictor)
         self.cv_worker.start_running()
         self.cv_thread.start()
 
-    def process(self, frame):
-        self.cv_worker.update_frame(frame)
+    def process(self, frame, frame_time=None):
+        # frame_time: capture time of the frame, carried through to the tracked signal
+        if frame_time is None:
+            frame_time = time.time()
+        self.cv_worker.update_frame(frame, frame_time)
         return 0,0
 
+    def detect(self, frame):
+        # synchronous, bypasses the worker thread (e.g. for benchmarking)
+        return self.cv_worker.predict(frame)
+
     def launch_control_panel(self):
         self.control_panel.show()
 
 
+class OnnxDetector(SleapDetector):
+
+    """
+    Runs a SLEAP model exported with export_model() on the CPU, using onnxruntime
+    or OpenCV DNN instead of sleap/tensorflow.
+    """
+
+    name = 'SLEAP (CPU)'
+
+    def __init__(self):
+        SleapDetector.__init__(self)
+        # a model this runtime can't use is reported in the panel (not raised in the slot)
+        self.control_panel.model_selected.disconnect(self.load_model)
+        self.control_panel.model_selected.connect(self.handle_model_selected)
+
+    def handle_model_selected(self, model_dir):
+        try:
+            self.load_model(model_dir)
+        except ValueError as e:
+            self.control_panel.backend_label.setText('Model not loaded: %s' % e)
+
+    class SleapWorker(SleapDetector.SleapWorker):
+
+        def predict(self, frame):
+            return self.predictor.predict(frame)
+
+    class ControlPanel(QWidget):
+
+        model_selected = pyqtSignal(str)
+
+        class ClickLabel(SleapDetector.ControlPanel.ClickLabel):
+            pass
+
+        def __init__(self):
+            QWidget.__init__(self)
+            self.model_label = self.ClickLabel('(click to select exported model directory)')
+            self.model_label.setAlignment(Qt.AlignCenter)
+            self.model_label.clicked.connect(self.select_model_dir)
+            self.load_button = QPushButton('Load Model')
+            self.load_button.clicked.connect(self.load)
+            self.backend_label = QLabel('(backend)')
+            self.backend_label.setAlignment(Qt.AlignCenter)
+            self.fps_label = QLabel('(fps)')
+            self.fps_label.setAlignment(Qt.AlignCenter)
+            self.ninstances_label = QLabel('(ninstances)')
+            self.ninstances_label.setAlignment(Qt.AlignCenter)
+            layout = QVBoxLayout()
+            layout.addWidget(self.model_label)
+            layout.addWidget(self.load_button)
+            layout.addWidget(self.backend_label)
+            layout.addWidget(self.fps_label)
+            layout.addWidget(self.ninstances_label)
+            self.setLayout(layout)
+            self.setWindowTitle('Sleap Detector (CPU)')
+            self.setMinimumWidth(500)
+            self.model_dir = None
+
+        def select_model_dir(self):
+            model_dir = QFileDialog.getExistingDirectory(self, 'Select Exported Model Directory',
+                                                    os.path.join(training_dir, 'models'),
+                                                    QFileDialog.ShowDirsOnly)
+            if model_dir:
+                self.model_label.setText(model_dir)
+                self.model_dir = model_dir
+
+        def load(self):
+            if self.model_dir:
+                self.model_selected.emit(self.model_dir)
+
+        def update_backend(self, backend):
+            self.backend_label.setText('backend: %s' % backend)
+
+        def update_fps(self, fps):
+            self.fps_label.setText('%.2f FPS' % fps)
+
+        def update_ninstances(self, ninstances):
+            self.ninstances_label.setText('%d instances found' % ninstances)
+
+    def load_model(self, model_dir, backend=None):
+        predictor = TipModel(model_dir, backend=backend)
+        self.control_panel.update_backend(predictor.backend)
+        self.cv_worker.set_predictor(predictor)
+        self.cv_worker.start_running()
+        self.cv_thread.start()
+
+
 class RandomWalkDetector:
 
     name = 'Random Walk'
@@ -209,13 +328,16 @@ class RandomWalkDetector:
         if val >= mx:   val = mx-1
         return val
 
-    def process(self, frame):
+    def process(self, frame, frame_time=None):
         x,y = self.pos
         x = self.walk(x, self.step, 0, 4000)
         y = self.walk(y, self.step, 0, 3000)
         self.pos = (x,y)
         return self.pos
 
+    def detect(self, frame):
+        return [self.process(frame)]
+
     def launch_control_panel(self):
         self.control_panel = QWidget()
         layout = QVBoxLayout()
@@ -275,7 +397,7 @@ class TemplateMatchDetector:
         if self.template is not None:
             self.template_scaled = self.scale(self.template)
 
-    def process(self, frame):
+    def process(self, frame, frame_time=None):
         if self.template_scaled is not None:
             frame_scaled = self.scale(frame)
             res, mx = template_match(frame_scaled, self.template_scaled, self.method)
@@ -284,6 +406,12 @@ class TemplateMatchDetector:
         else:
             return (0,0)
 
+    def detect(self, frame):
+        if self.template_scaled is not None:
+            return [self.process(frame)]
+        else:
+            return []
+
     def launch_control_panel(self):
         self.control_panel.show()
 
@@ -291,10 +419,13 @@ class TemplateMatchDetector:
         filename = QFileDialog.getOpenFileName(self.control_panel, 'Load template file',
                                                 data_dir, 'Numpy files (*.npy)')[0]
         if filename:
-            self.template = np.load(filename)
-            self.offset = np.array(self.template.shape[:2]) // 2
-            self.scale_template()
-            self.template_label.setText(os.path.relpath(filename))
+            self.load_model(filename)
+
+    def load_model(self, filename):
+        self.template = np.load(filename)
+        self.offset = np.array(self.template.shape[:2]) // 2
+        self.scale_template()
+        self.template_label.setText(os.path.relpath(filename))
 
     def clean(self):
         pass
@@ -0,0 +1,210 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import numpy as np
+import threading
+from collections import deque
+
+from .transform import TransformNP
+from .bundle_adjustment import rodrigues
+
+
+HALF_LIFE = 200         # samples, exponential forgetting of the residual statistics
+MIN_SAMPLES = 20        # before alerts are raised
+BIAS_ALERT_UM = 20.     # alert if the mean residual exceeds this...
+RMS_ALERT_UM = 40.      # ...or its RMS exceeds this
+HYSTERESIS = 0.8        # alert clears below this fraction of the thresholds
+SIGMA_ROT0 = 1e-2       # rad, RLS prior on the rotation correction
+SIGMA_TRANS0 = 100.     # um, RLS prior on the translation correction
+MAX_PENDING = 100       # tracked records waiting for telemetry
+REFIT_MAX_ROT_STD = 0.5 # of SIGMA_ROT0, refit only once the rotation is this well determined
+
+
+class DriftMonitor:
+
+    """
+    Residuals between the stage position and the tracked tip mapped through
+    the camera-to-probe transform, with exponential forgetting: the mean
+    (bias) and RMS over roughly the last HALF_LIFE samples. Optionally
+    estimates a small rigid correction of the transform by recursive least
+    squares (same forgetting), about the first sample. The RLS covariance is
+    kept below the prior, so directions the samples don't excite (e.g. the
+    rotation while the probe is parked) don't wind up. All updates are O(1).
+    """
+
+    def __init__(self, half_life=HALF_LIFE, refit=False):
+        self.lam = 0.5 ** (1. / half_life)
+        self.refit = refit
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.weight = 0.    # sum of the forgetting weights
+        self.mean = np.zeros(3)
+        self.mean_sq = 0.
+        self.center = None
+        self.theta = np.zeros(6)    # rotation vector, translation (about center)
+        self.P0_sqrt = np.array([SIGMA_ROT0]*3 + [SIGMA_TRANS0]*3)
+        self.P = np.diag(self.P0_sqrt**2)
+
+    def update(self, point, stage_position):
+        # point: tracked tip in stage coordinates; returns the residual
+        point = np.asarray(point, dtype=np.float64)
+        r = np.asarray(stage_position, dtype=np.float64) - point
+        self.n += 1
+        self.weight = self.lam * self.weight + 1.
+        a = 1. / self.weight
+        self.mean += a * (r - self.mean)
+        self.mean_sq += a * (np.dot(r, r) - self.mean_sq)
+        if self.refit:
+            self.update_rls(point, r)
+        return r
+
+    def update_rls(self, point, r):
+        # r = w x (point - center) + t, linearized for a small rotation w
+        if self.center is None:
+            self.center = point.copy()
+        q = point - self.center
+        H = np.zeros((3,6))
+        H[0,1], H[0,2] = q[2], -q[1]
+        H[1,0], H[1,2] = -q[2], q[0]
+        H[2,0], H[2,1] = q[1], -q[0]
+        H[:,3:] = np.eye(3)
+        S = self.lam * np.eye(3) + H @ self.P @ H.T
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.theta += K @ (r - H @ self.theta)
+        P = (self.P - K @ H @ self.P) / self.lam
+        # bound P by the prior: clip its eigenvalues relative to P0 at 1
+        Pw = P / np.outer(self.P0_sqrt, self.P0_sqrt)
+        w, V = np.linalg.eigh((Pw + Pw.T) / 2.)
+        Pw = (V * np.clip(w, 0., 1.)) @ V.T
+        self.P = Pw * np.outer(self.P0_sqrt, self.P0_sqrt)
+
+    def get_bias(self):
+        return self.mean
+
+    def get_rms(self):
+        return float(np.sqrt(self.mean_sq))
+
+    def is_excited(self):
+        # whether the samples determine the rotation (spread out, not parked)
+        rot_std = np.sqrt(np.diag(self.P)[:3])
+        return bool(np.all(rot_std < REFIT_MAX_ROT_STD * SIGMA_ROT0))
+
+    def get_refit_transform(self, transform):
+        """
+        TransformNP composing transform (rigid) with the estimated correction,
+        or None if refitting is off, transform isn't rigid, or the samples
+        don't determine the rotation (see is_excited).
+        """
+        if not (self.refit and self.n and isinstance(transform, TransformNP)):
+            return None
+        if not (self.is_excited() and np.all(np.isfinite(self.theta))):
+            return None
+        R = rodrigues(self.theta[:3])[0]
+        t = self.center - R @ self.center + self.theta[3:]
+        # TransformNP maps row vectors: p -> (p + ori) @ rot
+        rot = transform.rot @ R.T
+        ori = transform.ori + t @ rot.T
+        refit = TransformNP('%s-refit' % transform.name, transform.from_cs, transform.to_cs)
+        refit.set_from_rot_ori(rot, ori)
+        refit.set_from_points(getattr(transform, 'from_points', None))
+        refit.set_to_points(getattr(transform, 'to_points', None))
+        return refit
+
+
+class DriftMonitorWorker(QObject):
+
+    """
+    Feeds a DriftMonitor from tip tracker records (connected directly, so it
+    runs in the tracker's thread) and the stage telemetry, using only frames
+    captured while the stage was at rest. Records wait until the telemetry
+    covers their capture time.
+    """
+
+    alert = pyqtSignal(str)
+    updated = pyqtSignal(dict)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.monitor = DriftMonitor()
+        self.transform = None
+        self.telemetry = None
+        self.pending = deque(maxlen=MAX_PENDING)
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.alerted = False
+
+    def set_transform(self, transform):
+        with self.lock:
+            self.transform = transform
+            self.reset()
+
+    def set_telemetry(self, telemetry):
+        with self.lock:
+            self.telemetry = telemetry
+            self.reset()
+
+    def set_refit(self, refit):
+        with self.lock:
+            self.monitor.refit = refit
+            self.reset()
+
+    def reset(self):
+        self.monitor.reset()
+        self.pending.clear()
+        self.alerted = False
+
+    def start_monitoring(self):
+        with self.lock:
+            self.reset()
+        self.enabled = True
+
+    def stop_monitoring(self):
+        self.enabled = False
+
+    def get_refit_transform(self):
+        with self.lock:
+            if self.transform is None:
+                return None
+            return self.monitor.get_refit_transform(self.transform)
+
+    def handle_tracked(self, record):
+        # called (directly) from the tracker's thread
+        if not (self.enabled and (self.transform is not None) and \
+                (self.telemetry is not None)):
+            return
+        t = (record['timestamp_left'] + record['timestamp_right']) / 2.
+        with self.lock:
+            self.pending.append((t, record['obj_point']))
+            while self.pending:
+                t, obj_point = self.pending[0]
+                position, moving = self.telemetry.lookup(t)
+                if position is None:
+                    break
+                self.pending.popleft()
+                if not moving:
+                    self.update(obj_point, position)
+
+    def update(self, obj_point, position):
+        point = self.transform.map(obj_point)
+        residual = self.monitor.update(point, position)
+        bias = self.monitor.get_bias()
+        rms = self.monitor.get_rms()
+        self.updated.emit({
+            'residual': residual,
+            'bias': bias.copy(),
+            'rms': rms,
+            'n': self.monitor.n,
+        })
+        if self.monitor.n < MIN_SAMPLES:
+            return
+        bias_norm = np.linalg.norm(bias)
+        if (not self.alerted) and ((bias_norm > BIAS_ALERT_UM) or (rms > RMS_ALERT_UM)):
+            self.alerted = True
+            self.alert.emit('Drift alert: tip vs stage bias [%.1f, %.1f, %.1f] um, '
+                            'RMS %.1f um. Check the rig, or recalibrate.' % (tuple(bias) + (rms,)))
+        elif self.alerted and (bias_norm < HYSTERESIS * BIAS_ALERT_UM) and \
+                (rms < HYSTERESIS * RMS_ALERT_UM):
+            self.alerted = False
+            self.alert.emit('Drift alert cleared (bias %.1f um, RMS %.1f um).' % \
+                                (bias_norm, rms))
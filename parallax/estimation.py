@@ -0,0 +1,240 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import numpy as np
+import threading
+import time
+from collections import deque
+
+
+SIGMA_TRI = 10.         # um, triangulated tip (after transform)
+SIGMA_STAGE = 1.        # um, stage encoder reading
+SIGMA_BIAS0 = 50.       # um, prior on the stage/camera offset
+Q_POS = 1.              # um^2/s, tip random walk (e.g. probe flex)
+Q_BIAS = 0.1            # um^2/s, offset random walk (drift)
+K_STEP = 0.01           # fractional error of a commanded stage step
+GATE_CHI2 = 16.27       # chi-square, 3 dof, p = 0.001
+POLL_INTERVAL = 0.05    # seconds
+MAX_PENDING = 100       # camera fixes waiting for telemetry
+STALE_FIX = 1.          # seconds, drop fixes the telemetry can't cover by then
+
+
+class TipEstimator:
+
+    """
+    Kalman filter for a single probe tip, in stage coordinates.
+
+    state: x = [p, b], where p is the tip position and b is the offset between
+    the stage reading and the tip as seen by the cameras (transform error, drift).
+    Stage motion drives the prediction (p += ds); triangulated tips measure p,
+    stage readings measure p + b.
+    """
+
+    def __init__(self, sigma_tri=SIGMA_TRI, sigma_stage=SIGMA_STAGE, sigma_bias0=SIGMA_BIAS0,
+                    q_pos=Q_POS, q_bias=Q_BIAS, k_step=K_STEP, gate=GATE_CHI2):
+        self.sigma_tri = sigma_tri
+        self.sigma_stage = sigma_stage
+        self.sigma_bias0 = sigma_bias0
+        self.q_pos = q_pos
+        self.q_bias = q_bias
+        self.k_step = k_step
+        self.gate = gate
+        self.H_tri = np.hstack((np.eye(3), np.zeros((3,3))))
+        self.H_stage = np.hstack((np.eye(3), np.eye(3)))
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.P = None
+        self.t = None
+        self.stage_last = None
+        self.nrejected = 0
+
+    @property
+    def initialized(self):
+        return self.x is not None
+
+    def _init(self, p, var_p, t):
+        self.x = np.concatenate((np.asarray(p, dtype=np.float64), np.zeros(3)))
+        self.P = np.diag([var_p]*3 + [self.sigma_bias0**2]*3)
+        self.t = t
+
+    def predict(self, t, ds=None):
+        if not self.initialized:
+            return
+        dt = max(t - self.t, 0.)
+        q_p = self.q_pos * dt
+        if ds is not None:
+            ds = np.asarray(ds, dtype=np.float64)
+            self.x[:3] += ds
+            q_p += (self.k_step * np.linalg.norm(ds))**2
+        self.P[:3,:3] += q_p * np.eye(3)
+        self.P[3:,3:] += self.q_bias * dt * np.eye(3)
+        self.t = max(t, self.t)
+
+    def _update(self, z, H, var, gated=False):
+        # var is a variance, or a 3x3 covariance
+        R = var * np.eye(3) if np.ndim(var) == 0 else var
+        y = np.asarray(z, dtype=np.float64) - H @ self.x
+        S = H @ self.P @ H.T + R
+        Sinv = np.linalg.inv(S)
+        if gated and (y @ Sinv @ y > self.gate):
+            self.nrejected += 1
+            return False
+        K = self.P @ H.T @ Sinv
+        self.x = self.x + K @ y
+        I_KH = np.eye(6) - K @ H
+        self.P = I_KH @ self.P @ I_KH.T + K @ R @ K.T  # Joseph form
+        return True
+
+    def update_triangulation(self, point, t, cov=None):
+        # cov: 3x3 triangulation covariance (see Calibration.triangulate_many),
+        # added to the transform/detection error sigma_tri
+        var = self.sigma_tri**2
+        if cov is not None:
+            var = var * np.eye(3) + cov
+        if not self.initialized:
+            self._init(point, np.max(np.diag(np.atleast_2d(var))), t)
+            return True
+        self.predict(t)
+        return self._update(point, self.H_tri, var, gated=True)
+
+    def update_stage(self, position, t):
+        position = np.asarray(position, dtype=np.float64)
+        ds = None if self.stage_last is None else position - self.stage_last
+        self.stage_last = position
+        if not self.initialized:
+            # no camera fix yet: trust the stage, with an uncertain offset
+            self._init(position, self.sigma_stage**2 + self.sigma_bias0**2, t)
+            return True
+        self.predict(t, ds)
+        return self._update(position, self.H_stage, self.sigma_stage**2)
+
+    def get_estimate(self, t=None):
+        """
+        Returns the tip position and its 3x3 covariance, extrapolated to time t
+        (default: time of last update), or (None, None) if not initialized.
+        """
+        if not self.initialized:
+            return None, None
+        P = self.P[:3,:3].copy()
+        if (t is not None) and (t > self.t):
+            P += self.q_pos * (t - self.t) * np.eye(3)
+        return self.x[:3].copy(), P
+
+    def get_offset(self):
+        if not self.initialized:
+            return None, None
+        return self.x[3:].copy(), self.P[3:,3:].copy()
+
+
+class EstimatorWorker(QObject):
+
+    """
+    Feeds a TipEstimator from stage telemetry (see StageTelemetry) and from tip
+    tracker records (mapped through the camera-to-probe transform), in this
+    worker's thread. A camera fix arrives after the stage has moved on (capture,
+    detection, triangulation), so it waits until the telemetry covers its
+    capture time, and is then shifted by the stage displacement since capture
+    and applied at the filter's current time.
+    """
+
+    finished = pyqtSignal()
+    estimated = pyqtSignal(dict)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.estimator = TipEstimator()
+        self.telemetry = None
+        self.transform = None
+        self.pending = deque(maxlen=MAX_PENDING)   # (capture time, point, cov)
+        self.t_stage = None     # time of the last telemetry sample applied
+        self.lock = threading.Lock()
+        self.running = True
+        self.enabled = False
+
+    def set_telemetry(self, telemetry):
+        with self.lock:
+            self.telemetry = telemetry
+            self.reset()
+
+    def set_transform(self, transform):
+        with self.lock:
+            self.transform = transform
+            self.reset()
+
+    def reset(self):
+        self.estimator.reset()
+        self.pending.clear()
+        self.t_stage = None
+
+    def start_estimating(self):
+        with self.lock:
+            self.reset()
+        self.enabled = True
+
+    def stop_estimating(self):
+        self.enabled = False
+
+    def stop_running(self):
+        self.running = False
+
+    def handle_tracked(self, record):
+        # called (directly) from the tracker's thread; applied in run()
+        if not (self.enabled and (self.transform is not None)):
+            return
+        with self.lock:
+            point = np.asarray(self.transform.map(record['obj_point']), dtype=np.float64)
+            cov = None
+            if record.get('obj_cov') is not None:
+                # propagate through the linear part of the transform
+                A = np.array([self.transform.map(record['obj_point'] + e) for e in np.eye(3)]).T
+                A -= point[:,None]
+                cov = A @ record['obj_cov'] @ A.T
+            t = (record['timestamp_left'] + record['timestamp_right']) / 2.
+            self.pending.append((t, point, cov))
+
+    def emit_estimate(self, source, accepted=True):
+        p, P = self.estimator.get_estimate()
+        b, _ = self.estimator.get_offset()
+        self.estimated.emit({
+            'timestamp': self.estimator.t,
+            'source': source,
+            'accepted': accepted,
+            'point': p,
+            'cov': P,
+            'sigma': np.sqrt(np.diag(P)),
+            'offset': b,
+            'nrejected': self.estimator.nrejected,
+        })
+
+    def update(self):
+        # apply new telemetry samples, then the camera fixes they cover
+        samples = self.telemetry.get_samples(since=self.t_stage)
+        if self.t_stage is not None:
+            samples = samples[samples[:,0] > self.t_stage]
+        for sample in samples:
+            self.estimator.update_stage(sample[1:], sample[0])
+            self.t_stage = sample[0]
+        if len(samples):
+            self.emit_estimate('stage')
+        while self.pending and (self.t_stage is not None):
+            t, point, cov = self.pending[0]
+            position, moving = self.telemetry.lookup(t)
+            if (position is None) and (t > self.t_stage - STALE_FIX):
+                break   # not covered yet
+            self.pending.popleft()
+            if position is None:
+                continue    # older than the telemetry history
+            ds = self.estimator.stage_last - position
+            var_ds = (self.estimator.k_step * np.linalg.norm(ds))**2
+            cov = var_ds * np.eye(3) if cov is None else cov + var_ds * np.eye(3)
+            accepted = self.estimator.update_triangulation(point + ds, self.estimator.t, cov)
+            self.emit_estimate('camera', accepted)
+
+    def run(self):
+        while self.running:
+            if self.enabled and (self.telemetry is not None):
+                with self.lock:
+                    self.update()
+            time.sleep(POLL_INTERVAL)
+        self.finished.emit()
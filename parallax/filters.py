@@ -2,7 +2,7 @@ import cv2
 import numpy as np
 import time
 
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QSlider
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QSlider, QGridLayout, QLabel, QComboBox
 from PyQt5.QtCore import pyqtSignal, Qt, QObject, QThread, QMutex
 
 
@@ -65,6 +65,17 @@ class NoFilter(QObject):
     def launch_control_panel(self):
         pass
 
+    def set_model(self, model):
+        pass
+
+    def map_point(self, x, y):
+        # camera frame -> displayed image coordinates
+        return x, y
+
+    def unmap_point(self, x, y):
+        # displayed image -> camera frame coordinates
+        return x, y
+
     def clean(self):
         self.worker.stop_running()
         self.thread.quit()
@@ -205,3 +216,98 @@ class CheckerboardSmoothFilter(NoFilter):
         self.worker.mtx_corners.unlock()
 
 
+
+
+class RectifyFilter(NoFilter):
+
+    """
+    Undistorted or stereo rectified view, using a calibration's precomputed
+    remap tables (one cv2.remap per frame, at display resolution).
+    """
+
+    name = "Undistort / Rectify"
+    SCALES = {'1': 1., '1/2': 0.5, '1/4': 0.25}
+    SCALE_DEFAULT = '1/2'
+
+    frame_processed = pyqtSignal(object)
+
+    class Worker(NoFilter.Worker):
+
+        def __init__(self, name):
+            NoFilter.Worker.__init__(self, name)
+            self.maps = None
+
+        def set_maps(self, maps):
+            self.maps = maps
+
+        def process(self, frame):
+            maps = self.maps
+            if maps is not None:
+                frame = cv2.remap(frame, maps[0], maps[1], cv2.INTER_LINEAR)
+            self.frame_processed.emit(frame)
+
+    def __init__(self):
+        NoFilter.__init__(self)
+        self.model = None
+        self.control_panel = None
+        self.cal = None
+        self.camera = 0
+        self.rectify = True
+        self.scale = self.SCALES[self.SCALE_DEFAULT]
+
+    def set_model(self, model):
+        self.model = model
+        self.control_panel = QWidget()
+        self.cal_dropdown = QComboBox()
+        for name, cal in model.calibrations.items():
+            if hasattr(cal, 'get_rectify_maps'):
+                self.cal_dropdown.addItem(name)
+        self.camera_dropdown = QComboBox()
+        self.camera_dropdown.addItems(['Camera 1 (left)', 'Camera 2 (right)'])
+        self.mode_dropdown = QComboBox()
+        self.mode_dropdown.addItems(['Rectified', 'Undistorted'])
+        self.scale_dropdown = QComboBox()
+        self.scale_dropdown.addItems(list(self.SCALES))
+        self.scale_dropdown.setCurrentText(self.SCALE_DEFAULT)
+        for dropdown in (self.cal_dropdown, self.camera_dropdown, self.mode_dropdown,
+                            self.scale_dropdown):
+            dropdown.activated.connect(self.update_maps)
+        layout = QGridLayout()
+        layout.addWidget(QLabel('Calibration:'), 0,0, 1,1)
+        layout.addWidget(self.cal_dropdown, 0,1, 1,1)
+        layout.addWidget(QLabel('Camera:'), 1,0, 1,1)
+        layout.addWidget(self.camera_dropdown, 1,1, 1,1)
+        layout.addWidget(QLabel('Mode:'), 2,0, 1,1)
+        layout.addWidget(self.mode_dropdown, 2,1, 1,1)
+        layout.addWidget(QLabel('Scale:'), 3,0, 1,1)
+        layout.addWidget(self.scale_dropdown, 3,1, 1,1)
+        self.control_panel.setLayout(layout)
+        self.control_panel.setWindowTitle('Undistort / Rectify Filter')
+        self.control_panel.setMinimumWidth(300)
+        self.update_maps()
+
+    def update_maps(self):
+        name = self.cal_dropdown.currentText()
+        if not name:
+            self.cal = None
+            self.worker.set_maps(None)
+            return
+        self.cal = self.model.calibrations[name]
+        self.camera = self.camera_dropdown.currentIndex()
+        self.rectify = (self.mode_dropdown.currentText() == 'Rectified')
+        self.scale = self.SCALES[self.scale_dropdown.currentText()]
+        self.worker.set_maps(self.cal.get_rectify_maps(self.camera, self.scale, self.rectify))
+
+    def launch_control_panel(self):
+        if self.control_panel is not None:
+            self.control_panel.show()
+
+    def map_point(self, x, y):
+        if self.cal is None:
+            return x, y
+        return tuple(self.cal.rectify_points(self.camera, [(x, y)], self.scale, self.rectify)[0])
+
+    def unmap_point(self, x, y):
+        if self.cal is None:
+            return x, y
+        return tuple(self.cal.unrectify_points(self.camera, [(x, y)], self.scale, self.rectify)[0])
@@ -1,4 +1,16 @@
 import numpy as np
+import os
+
+from . import data_dir
+from .helper import WF, HF
+
+
+FORMATIONS_DIR = os.path.join(data_dir, 'formations')
+FORMATION_VERSION = 1   # bump when the generator changes, to invalidate cached files
+NITER_REFINE = 300
+NITER_REFINE_CONSTRAINED = 60
+NSTARTS_CONSTRAINED = 4     # random rotations of the seed tried under a field of view
+FOV_MARGIN = 100    # pixels
 
 
 vertices_tetrahedron = np.array([
@@ -146,3 +158,148 @@ mapping = {
     42  : vertices_icosahedron_ref1,
 }
 
+
+def fibonacci_sphere(n):
+    # n nearly uniformly spaced points on the unit sphere (golden-angle spiral)
+    i = np.arange(n) + 0.5
+    z = 1. - 2.*i/n
+    r = np.sqrt(1. - z*z)
+    phi = np.pi * (3. - np.sqrt(5.)) * i
+    return np.stack((r*np.cos(phi), r*np.sin(phi), z), axis=1)
+
+def information_matrix(points):
+    """
+    Fisher information (6,6) of a rigid transform fit (small rotation, then
+    translation) from correspondences at points (N,3), for unit isotropic noise.
+    """
+    p = np.asarray(points, dtype=np.float64).reshape((-1,3))
+    J = np.zeros((len(p),3,6))
+    J[:,0,1], J[:,0,2] = p[:,2], -p[:,1]     # d(w x p)/dw = -[p]x
+    J[:,1,0], J[:,1,2] = -p[:,2], p[:,0]
+    J[:,2,0], J[:,2,1] = p[:,1], -p[:,0]
+    J[:,:,3:] = np.eye(3)
+    return np.einsum('nij,nik->jk', J, J)
+
+def parameter_std(points, sigma=1.):
+    # predicted standard deviations of (rotation (rad), translation) for noise sigma
+    return sigma * np.sqrt(np.diag(np.linalg.inv(information_matrix(points))))
+
+def d_criterion(points):
+    # D-optimality (log det of the information matrix), to be maximized
+    return np.linalg.slogdet(information_matrix(points))[1]
+
+def clip_to_view(points, visible, origin, radius, nsteps=10):
+    # pull points (unit scale) radially inwards until visible (bisection)
+    ok = visible(origin + radius * points)
+    if np.all(ok):
+        return points
+    out = points[~ok]
+    lo, hi = np.zeros(len(out)), np.ones(len(out))
+    for i in range(nsteps):
+        mid = (lo + hi) / 2.
+        vis = visible(origin + radius * out * mid[:,None])
+        lo = np.where(vis, mid, lo)
+        hi = np.where(vis, hi, mid)
+    points = points.copy()
+    points[~ok] = out * lo[:,None]
+    return points
+
+def refine(points, visible=None, origin=(0,0,0), radius=1., niter=NITER_REFINE):
+    """
+    Spread points (unit scale) evenly over the unit sphere by minimizing their
+    Coulomb energy, keeping them within the field of view if given. Evenly
+    spread points on the boundary make the information matrix isotropic and
+    close to D-optimal, while keeping the fit robust to losing a point.
+    """
+    points = np.array(points, dtype=np.float64)
+    n = len(points)
+    origin = np.asarray(origin, dtype=np.float64)
+    spacing = np.sqrt(4*np.pi / n)
+    for i in range(niter):
+        d = points[:,None,:] - points[None,:,:]
+        r = np.linalg.norm(d, axis=2)
+        np.fill_diagonal(r, np.inf)
+        force = np.sum(d / np.maximum(r, 1e-9)[:,:,None]**3, axis=1)
+        fmax = np.max(np.linalg.norm(force, axis=1))
+        step = 0.1 * spacing * (1. - i/niter)
+        points = points + step * force / fmax
+        points /= np.linalg.norm(points, axis=1)[:,None]
+        if visible is not None:
+            points = clip_to_view(points, visible, origin, radius)
+    return points
+
+def formation_file(key):
+    return os.path.join(FORMATIONS_DIR, 'formation_v%d_%s.npy' % (FORMATION_VERSION, key))
+
+def generate(n, radius=1., origin=(0,0,0), visible=None, cache_key=None):
+    """
+    Formation of n correspondence points for a rigid transform fit, within a
+    sphere of the given radius around origin: a spherical Fibonacci seed,
+    spread evenly by refine(). If visible is given (a function of (N,3)
+    positions returning a boolean mask, see field_of_view), points are kept
+    within it and the best (D-optimal) of several rotated seeds is used.
+
+    Unit-scale formations are cached in FORMATIONS_DIR: unconstrained ones per
+    n, constrained ones only if a cache_key identifying the constraint is given.
+    Returns positions (n,3).
+    """
+    if n < 4:
+        raise ValueError('a formation needs at least 4 points')
+    origin = np.asarray(origin, dtype=np.float64)
+    if visible is None:
+        key = 'n%d' % n
+    elif cache_key is not None:
+        key = 'n%d_%s' % (n, cache_key)
+    else:
+        key = None
+    filename = formation_file(key) if key is not None else None
+    if (filename is not None) and os.path.exists(filename):
+        return origin + radius * np.load(filename)
+
+    seed = fibonacci_sphere(n)
+    if visible is None:
+        points = refine(seed)
+    else:
+        if not visible(origin[None,:])[0]:
+            raise ValueError('formation origin is outside the field of view')
+        rng = np.random.default_rng(0)
+        best, best_d = None, -np.inf
+        for i in range(NSTARTS_CONSTRAINED):
+            # random rotation of the seed (QR of a Gaussian matrix)
+            q, r = np.linalg.qr(rng.normal(size=(3,3)))
+            q = q * np.sign(np.diag(r))
+            start = clip_to_view(seed @ q.T, visible, origin, radius)
+            points = refine(start, visible, origin, radius, NITER_REFINE_CONSTRAINED)
+            d = d_criterion(points)
+            if d > best_d:
+                best, best_d = points, d
+        points = best
+
+    if filename is not None:
+        os.makedirs(FORMATIONS_DIR, exist_ok=True)
+        np.save(filename, points)
+    return origin + radius * points
+
+def field_of_view(cal, transform=None, margin=FOV_MARGIN):
+    """
+    Visibility test for stage positions (N,3): True where a point projects in
+    front of both cameras of a stereo calibration and inside both frames (by
+    margin pixels). Positions are mapped into calibration coordinates with
+    transform.inverse_map (e.g. a camera-to-probe transform), or used as is.
+    """
+    Ps = cal.get_projection_matrices()
+    def visible(points):
+        points = np.asarray(points, dtype=np.float64).reshape((-1,3))
+        if transform is not None:
+            points = np.array([transform.inverse_map(p) for p in points])
+        X = np.concatenate((points - cal.offset, np.ones((len(points),1))), axis=1)
+        ok = np.ones(len(points), dtype=bool)
+        for camera, P in enumerate(Ps):
+            x = X @ np.asarray(P, dtype=np.float64).T
+            ok &= x[:,2] > 0
+            uv = x[:,:2] / np.where(x[:,2:] > 0, x[:,2:], 1.)
+            uv = cal.unrectify_points(camera, uv, rectify=False)
+            ok &= (uv[:,0] >= margin) & (uv[:,0] < WF - margin) & \
+                    (uv[:,1] >= margin) & (uv[:,1] < HF - margin)
+        return ok
+    return visible
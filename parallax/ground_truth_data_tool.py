@@ -16,6 +16,7 @@ from . import get_image_file, data_dir
 from .toggle_switch import ToggleSwitch
 from .stage_dropdown import StageDropdown
 from .helper import FONT_BOLD
+from . import waypoints
 
 
 class GroundTruthDataTool(QWidget):
@@ -46,12 +47,16 @@ class GroundTruthDataTool(QWidget):
 class CollectTab(QWidget):
     msg_posted = pyqtSignal(str)
 
+    NBATCH = 20     # random points planned at a time
+
     def __init__(self, screens, settings=None, parent=None):
         QWidget.__init__(self, parent=parent)
         self.lscreen, self.rscreen = screens
         self.settings = settings
 
         self.npoints = 0
+        self.waypoints = []     # planned random points, in visiting order
+        self.waypoints_extent = None
 
         self.clear_button = QPushButton('Clear list')
         self.clear_button.clicked.connect(self.clear)
@@ -91,9 +96,10 @@ class CollectTab(QWidget):
             mode = self.settings.get_mode()
             x1,y1,z1, x2,y2,z2 = self.settings.get_extent()
             if mode == 'random':
-                x = np.random.uniform(x1, x2)
-                y = np.random.uniform(y1, y2)
-                z = np.random.uniform(z1, z2)
+                extent = (x1,y1,z1, x2,y2,z2)
+                if (not self.waypoints) or (extent != self.waypoints_extent):
+                    self.plan_waypoints(stage, extent)
+                x, y, z = self.waypoints.pop(0)
             elif mode == 'lattice':
                 self.msg_posted.emit('Ground Truth Collector: mode not implemented')
                 return
@@ -114,6 +120,14 @@ class CollectTab(QWidget):
         else:
             self.msg_posted.emit('Ground Truth Collector: select stage in Settings')
 
+    def plan_waypoints(self, stage, extent):
+        # a batch of random points, ordered for minimal stage travel
+        x1,y1,z1, x2,y2,z2 = extent
+        points = np.random.uniform((x1,y1,z1), (x2,y2,z2), size=(self.NBATCH,3))
+        order = waypoints.plan_order(points, stage.get_position(), waypoints.get_speeds(stage))
+        self.waypoints = list(points[order])
+        self.waypoints_extent = extent
+
     def grab(self):
         stage = self.settings.stage
         if stage:
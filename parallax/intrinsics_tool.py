@@ -10,11 +10,12 @@ import time
 import datetime
 import cv2
 import os
-import pickle
 
 from . import get_image_file, data_dir
 from .helper import FONT_BOLD, WF, HF
 from .calibration import imtx, idist
+from . import store
+from .pose_selection import select_poses
 
 CRIT = (cv2.TERM_CRITERIA_EPS, 0, 1e-8)
 
@@ -78,6 +79,11 @@ class IntrinsicsTool(QWidget):
                                         dt.month, dt.day, dt.hour, dt.minute, dt.second)
         self.name_edit = QLineEdit(suggested_name)
 
+        self.select_check = QCheckBox('Select poses by coverage')
+        self.select_check.setToolTip('Calibrate on the smallest subset of poses that '
+                                        'covers the frame with diverse tilts')
+        self.select_check.setChecked(True)
+
         self.generate_button = QPushButton('Generate intrinsics')
         self.generate_button.clicked.connect(self.generate_intrinsics)
         self.generate_button.setEnabled(False)
@@ -90,6 +96,7 @@ class IntrinsicsTool(QWidget):
         layout.addWidget(self.load_corners_button)
         layout.addWidget(self.npts_label)
         layout.addWidget(self.name_edit)
+        layout.addWidget(self.select_check)
         layout.addWidget(self.generate_button)
         layout.addWidget(self.save_button)
 
@@ -116,7 +123,13 @@ class IntrinsicsTool(QWidget):
     def generate_intrinsics(self):
         name = self.name_edit.text()
         self.intrinsics = IntrinsicParameters(name)
-        self.intrinsics.calibrate(self.ipts, self.opts)
+        ipts, opts = self.ipts, self.opts
+        if self.select_check.isChecked():
+            selected, coverage = select_poses([ipts], opts)
+            self.msg_posted.emit('Selected %d of %d poses (coverage %.0f%%)' % \
+                                    (len(selected), len(opts), 100 * coverage))
+            ipts, opts = ipts[selected], opts[selected]
+        self.intrinsics.calibrate(ipts, opts)
         self.msg_posted.emit('Generated %s' % self.intrinsics.name)
         self.msg_posted.emit('mtx = %s' % np.array2string(self.intrinsics.mtx))
         self.msg_posted.emit('dist = %s' % np.array2string(self.intrinsics.dist))
@@ -124,12 +137,11 @@ class IntrinsicsTool(QWidget):
         self.save_button.setEnabled(True)
 
     def save_intrinsics(self):
-        suggested_filename = os.path.join(data_dir, self.intrinsics.name + '.pkl')
+        suggested_filename = os.path.join(data_dir, self.intrinsics.name + '.npz')
         filename = QFileDialog.getSaveFileName(self, 'Save intrinsics file',
                                                 suggested_filename,
-                                                'Pickle files (*.pkl)')[0]
+                                                'Intrinsics files (*.npz)')[0]
         if filename:
-            with open(filename, 'wb') as f:
-                pickle.dump(self.intrinsics, f)
+            store.save(self.intrinsics, filename)
             self.msg_posted.emit('Saved intrinsics to: %s' % filename)
 
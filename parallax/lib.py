@@ -1,21 +1,64 @@
 import numpy as np
 import cv2 as cv
 import scipy.linalg as linalg
+from scipy.optimize import linear_sum_assignment
 
 
+RANSAC_ITER = 500
+
 def undistort_image_points(img_points, mtx, dist):
-    img_points_corrected_normalized = cv.undistortPoints(img_points, mtx, dist)
-    fx = mtx[0,0]
-    fy = mtx[1,1]
-    cx = mtx[0,2]
-    cy = mtx[1,2]
-    img_points_corrected = []
-    for img_point in img_points_corrected_normalized:
-        x,y = img_point[0]
-        x = x * fx + cx
-        y = y * fy + cy
-        img_points_corrected.append(np.array([x,y]))
-    return np.array([img_points_corrected], dtype=np.float32)
+    # img_points have dims (N,2), (N,1,2) or (1,N,2); returns dims (1,N,2), in pixels
+    pts = np.asarray(img_points, dtype=np.float64).reshape((-1,1,2))
+    if len(pts) == 0:
+        return np.zeros((1,0,2), dtype=np.float32)
+    pts_ud = cv.undistortPoints(pts, mtx, dist, P=mtx)
+    return pts_ud.reshape((1,-1,2)).astype(np.float32)
+
+class UndistortLookup:
+
+    """
+    Precomputed undistortion for repeated calls on the same camera: exact
+    undistortion on a sparse grid over the image, bilinearly interpolated.
+    Points outside the grid fall back to undistort_image_points.
+    """
+
+    def __init__(self, mtx, dist, size, step=16):
+        self.mtx = mtx
+        self.dist = dist
+        self.step = step
+        w, h = size
+        self.xs = np.arange(0, w + step, step, dtype=np.float64)
+        self.ys = np.arange(0, h + step, step, dtype=np.float64)
+        gx, gy = np.meshgrid(self.xs, self.ys)
+        grid = np.stack((gx.ravel(), gy.ravel()), axis=1)
+        self.table = undistort_image_points(grid, mtx, dist)[0].astype(np.float64).reshape(
+                                                                gx.shape + (2,))
+        # worst-case interpolation error, evaluated at the cell centers
+        centers = grid.reshape(gx.shape + (2,))[:-1,:-1].reshape((-1,2)) + step / 2.
+        self.max_error = float(np.max(np.linalg.norm(self.lookup(centers) - \
+                                undistort_image_points(centers, mtx, dist)[0], axis=1)))
+
+    def lookup(self, pts):
+        pts = np.asarray(pts, dtype=np.float64).reshape((-1,2))
+        u = pts[:,0] / self.step
+        v = pts[:,1] / self.step
+        i = np.clip(np.floor(v).astype(int), 0, len(self.ys) - 2)
+        j = np.clip(np.floor(u).astype(int), 0, len(self.xs) - 2)
+        fu = (u - j)[:,None]
+        fv = (v - i)[:,None]
+        t = self.table
+        return (t[i,j] * (1-fu) * (1-fv) + t[i,j+1] * fu * (1-fv) +
+                t[i+1,j] * (1-fu) * fv + t[i+1,j+1] * fu * fv)
+
+    def __call__(self, img_points):
+        # same contract as undistort_image_points
+        pts = np.asarray(img_points, dtype=np.float64).reshape((-1,2))
+        out = self.lookup(pts)
+        outside = (pts[:,0] < 0) | (pts[:,0] > self.xs[-1]) | \
+                    (pts[:,1] < 0) | (pts[:,1] > self.ys[-1])
+        if np.any(outside):
+            out[outside] = undistort_image_points(pts[outside], self.mtx, self.dist)[0]
+        return out.reshape((1,-1,2)).astype(np.float32)
 
 def get_projection_matrix(mtx, r, t):
     R, jacobian = cv.Rodrigues(r)
@@ -23,6 +66,89 @@ def get_projection_matrix(mtx, r, t):
     P = np.matmul(mtx,rt) # A[R|t]
     return P
 
+def triangulate_points(P1, P2, img_points1, img_points2):
+    # img_points have dims (N,2), returns object points (N,3)
+    pts1 = np.asarray(img_points1, dtype=np.float64).reshape((-1,2)).T
+    pts2 = np.asarray(img_points2, dtype=np.float64).reshape((-1,2)).T
+    coords4 = cv.triangulatePoints(np.asarray(P1, dtype=np.float64),
+                                    np.asarray(P2, dtype=np.float64), pts1, pts2)
+    return (coords4[:3] / coords4[3]).T
+
+def triangulate_points_n(Ps, img_points, weights=None, niter=1):
+    """
+    Weighted linear (DLT) triangulation from any number of views, batched.
+    Ps (ncam,3,4), img_points (ncam,N,2) with NaN for missing views,
+    weights (ncam,) or (ncam,N). Rows are rescaled by the estimated depth
+    (niter times), so that the algebraic error approximates the image error.
+    Returns object points (N,3); NaN for points seen by fewer than 2 views.
+    """
+    Ps = np.asarray(Ps, dtype=np.float64)
+    x = np.asarray(img_points, dtype=np.float64)
+    ncam, npts = x.shape[:2]
+    valid = np.all(np.isfinite(x), axis=-1) & np.all(np.isfinite(Ps), axis=(1,2))[:,None]
+    w = np.ones(ncam) if weights is None else np.asarray(weights, dtype=np.float64)
+    w = np.broadcast_to(w.reshape((ncam,-1)), (ncam,npts)) * valid
+    x = np.where(valid[...,None], x, 0.)
+    Ps = np.where(np.isfinite(Ps), Ps, 0.)
+    # normalize so that the third row gives the depth
+    norm = np.linalg.norm(Ps[:,2,:3], axis=1)
+    Ps = Ps / np.where(norm > 0, norm, 1.)[:,None,None]
+    Au = x[...,0,None] * Ps[:,None,2,:] - Ps[:,None,0,:]    # (ncam,N,4)
+    Av = x[...,1,None] * Ps[:,None,2,:] - Ps[:,None,1,:]
+    depth = np.ones((ncam,npts))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(niter + 1):
+            scale = (w / depth)[...,None]
+            A = np.concatenate((Au * scale, Av * scale), axis=0).transpose((1,0,2))
+            X = np.linalg.svd(A)[2][:,-1,:]                 # (N,4)
+            points = X[:,:3] / X[:,3:]
+            depth = np.abs(Ps[:,2,:3] @ points.T + Ps[:,2,3:])
+            depth = np.where(depth > 0, depth, 1.)
+    points[np.sum(valid, axis=0) < 2] = np.nan
+    return points
+
+def projection_jacobians(Ps, points):
+    """
+    Project points (N,3) through cameras Ps (ncam,3,4). Returns the image
+    points (ncam,N,2) and the (ncam,N,2,3) Jacobians of the projections.
+    """
+    Ps = np.asarray(Ps, dtype=np.float64)
+    X = np.asarray(points, dtype=np.float64).reshape((-1,3))
+    xh = Ps[:,:,:3] @ X.T + Ps[:,:,3:]                   # (ncam,3,N)
+    z = xh[:,2][...,None,None]
+    x = np.swapaxes(xh[:,:2], 1, 2)[...,None]           # (ncam,N,2,1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        J = (Ps[:,None,:2,:3] * z - x * Ps[:,None,None,2,:3]) / z**2
+        proj = x[...,0] / z[...,0]
+    return proj, J
+
+def triangulation_covariance(Ps, points, sigma=1.):
+    """
+    First-order covariance of triangulated points from isotropic image noise:
+    cov = (sum_c J_c^T J_c / sigma_c^2)^-1, with J_c the (2,3) Jacobian of
+    camera c's projection at the point. Ps (ncam,3,4) map to the image units
+    of sigma (NaN for missing cameras), points (N,3), sigma scalar, (ncam,) or
+    (ncam,N) with inf for missing views. Returns (N,3,3), NaN for points
+    constrained by fewer than 2 views.
+    """
+    Ps = np.asarray(Ps, dtype=np.float64)
+    X = np.asarray(points, dtype=np.float64).reshape((-1,3))
+    ncam, npts = len(Ps), len(X)
+    s = np.asarray(sigma, dtype=np.float64)
+    if s.ndim == 1:
+        s = s[:,None]
+    w = np.broadcast_to(1. / s**2, (ncam,npts)).copy()
+    w[~np.all(np.isfinite(Ps), axis=(1,2))] = 0.
+    w[:,~np.all(np.isfinite(X), axis=1)] = 0.
+    _, J = projection_jacobians(np.where(np.isfinite(Ps), Ps, 0.),
+                                np.where(np.isfinite(X), X, 0.))
+    J = np.where((w > 0)[...,None,None], J, 0.)
+    info = np.einsum('cn,cnki,cnkj->nij', w, J, J)
+    cov = np.full((npts,3,3), np.nan)
+    ok = np.sum(w > 0, axis=0) >= 2
+    cov[ok] = np.linalg.inv(info[ok])
+    return cov
+
 def get_rt_matrix(r, t):
     R, jacobian = cv.Rodrigues(r)
     rt = np.concatenate([R,t], axis=-1) # [R|t]
@@ -92,6 +218,185 @@ def apply_rti_cv(coord, r, t):
     vec2 = np.matmul(R.T, vec - t)
     return vec2.reshape(3)
 
+def skew(v):
+    x, y, z = np.asarray(v, dtype=np.float64).reshape(3)
+    return np.array([[0, -z, y],
+                     [z, 0, -x],
+                     [-y, x, 0]])
+
+def relative_rt(r1, t1, r2, t2):
+    # pose of camera 2 relative to camera 1, given both poses in a common frame
+    R1, _ = cv.Rodrigues(r1)
+    R2, _ = cv.Rodrigues(r2)
+    R = np.matmul(R2, R1.T)
+    T = np.asarray(t2).reshape((3,1)) - np.matmul(R, np.asarray(t1).reshape((3,1)))
+    return R, T
+
+def fundamental_matrix(mtx1, mtx2, R, T):
+    # F such that x2^T F x1 = 0 (undistorted pixel coordinates)
+    E = np.matmul(skew(T), R)
+    F = np.linalg.inv(mtx2).T @ E @ np.linalg.inv(mtx1)
+    return F / np.linalg.norm(F)
+
+def epipolar_distances(F, pts1, pts2):
+    """
+    Symmetric epipolar distance (in pixels) between every point in pts1 (N,2)
+    and every point in pts2 (M,2). Returns an (N,M) array.
+    """
+    x1 = np.concatenate([np.asarray(pts1, dtype=np.float64).reshape(-1,2),
+                            np.ones((len(pts1),1))], axis=1)
+    x2 = np.concatenate([np.asarray(pts2, dtype=np.float64).reshape(-1,2),
+                            np.ones((len(pts2),1))], axis=1)
+    l2 = x1 @ F.T   # epipolar lines in image 2
+    l1 = x2 @ F     # epipolar lines in image 1
+    num = np.abs(l2 @ x2.T)
+    d2 = num / np.linalg.norm(l2[:,:2], axis=1)[:,None]
+    d1 = num / np.linalg.norm(l1[:,:2], axis=1)[None,:]
+    return (d1 + d2) / 2.
+
+def match_epipolar(dist, max_dist):
+    """
+    Pair up points across two views given their (N,M) epipolar distances,
+    minimizing the total distance and rejecting pairs farther than max_dist.
+    Returns a list of (i, j, distance) tuples.
+    """
+    if dist.size == 0:
+        return []
+    rows, cols = linear_sum_assignment(dist)
+    return [(int(i), int(j), float(dist[i,j])) for i,j in zip(rows, cols) if dist[i,j] <= max_dist]
+
+def rigid_fit(from_points, to_points):
+    """
+    Closed-form (Kabsch) least-squares rigid transform, batched over leading dims.
+    from_points and to_points have dims (..., N, 3). Returns (rot, ori) following
+    the TransformNP convention: to = (from + ori) @ rot
+    """
+    a = np.asarray(from_points, dtype=np.float64)
+    b = np.asarray(to_points, dtype=np.float64)
+    ca = a.mean(axis=-2, keepdims=True)
+    cb = b.mean(axis=-2, keepdims=True)
+    H = np.swapaxes(a - ca, -1, -2) @ (b - cb)
+    U, S, Vt = np.linalg.svd(H)
+    d = np.sign(np.linalg.det(U @ Vt))
+    D = np.zeros(H.shape)
+    D[...,0,0] = 1.
+    D[...,1,1] = 1.
+    D[...,2,2] = d
+    rot = U @ D @ Vt
+    ori = (cb - ca @ rot) @ np.swapaxes(rot, -1, -2)
+    return rot, ori[...,0,:]
+
+def _sample_subsets(npts, k, niter, rng):
+    # niter random subsets of k distinct indices, dims (niter,k)
+    return np.argsort(rng.random((niter, npts)), axis=1)[:,:k]
+
+def ransac_rigid(from_points, to_points, threshold, niter=RANSAC_ITER, seed=None):
+    """
+    RANSAC over rigid transforms: 3-point hypotheses fit with rigid_fit, scored
+    all at once. A point is an inlier if it maps within threshold of its target.
+    Returns (rot, ori, inliers), refit on the inliers of the best hypothesis.
+    """
+    a = np.asarray(from_points, dtype=np.float64)
+    b = np.asarray(to_points, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    ix = _sample_subsets(len(a), 3, niter, rng)
+    rot, ori = rigid_fit(a[ix], b[ix])
+    err = np.linalg.norm((a[None,:,:] + ori[:,None,:]) @ rot - b[None,:,:], axis=2)
+    inliers = err < threshold
+    # most inliers, ties broken by the smallest inlier error
+    score = inliers.sum(axis=1) - np.sum(np.where(inliers, err, 0.), axis=1) / \
+                (threshold * len(a) + 1.)
+    inliers = inliers[np.argmax(score)]
+    for i in range(2):
+        rot, ori = rigid_fit(a[inliers], b[inliers])
+        err = np.linalg.norm((a + ori) @ rot - b, axis=1)
+        inliers_new = err < threshold
+        if (inliers_new.sum() < 3) or np.array_equal(inliers_new, inliers):
+            break
+        inliers = inliers_new
+    return rot, ori, inliers
+
+def _normalizing_transform(pts):
+    # similarity taking pts (N,d) to zero mean and RMS distance sqrt(d)
+    pts = np.asarray(pts, dtype=np.float64)
+    d = pts.shape[1]
+    c = pts.mean(axis=0)
+    s = np.sqrt(d) / (np.sqrt(np.mean(np.sum((pts - c)**2, axis=1))) + 1e-12)
+    T = np.eye(d+1)
+    T[:d,:d] *= s
+    T[:d,d] = -s * c
+    return T
+
+def dlt_projection(obj_points, img_points):
+    """
+    Direct linear transform: camera matrices P (...,3,4) from (...,N,3) object
+    points and (...,N,2) image points, batched over leading dims (N >= 6,
+    points not coplanar). Expects normalized coordinates for good conditioning.
+    """
+    X = np.asarray(obj_points, dtype=np.float64)
+    x = np.asarray(img_points, dtype=np.float64)
+    Xh = np.concatenate((X, np.ones(X.shape[:-1] + (1,))), axis=-1)
+    zeros = np.zeros_like(Xh)
+    rows_u = np.concatenate((Xh, zeros, -x[...,0:1] * Xh), axis=-1)
+    rows_v = np.concatenate((zeros, Xh, -x[...,1:2] * Xh), axis=-1)
+    A = np.concatenate((rows_u, rows_v), axis=-2)
+    _, _, Vt = np.linalg.svd(A)
+    return Vt[...,-1,:].reshape(A.shape[:-2] + (3,4))
+
+def ransac_projection(obj_points, img_points1, img_points2, threshold, niter=RANSAC_ITER,
+                        seed=None):
+    """
+    Outlier rejection for one calibration pose: 6-point DLT hypotheses of both
+    camera matrices (homographies for a planar target), scored all at once.
+    Image points should be undistorted. A point is an inlier if its
+    reprojection error is below threshold (pixels) in both cameras.
+    Returns the inlier mask, dims (N,).
+    """
+    X = np.asarray(obj_points, dtype=np.float64).reshape((-1,3))
+    npts = len(X)
+    Xc = X - X.mean(axis=0)
+    _, S, Vt = np.linalg.svd(Xc, full_matrices=False)
+    planar = S[2] < 1e-6 * S[0]
+    inliers = np.ones(npts, dtype=bool)
+    if planar:
+        X2 = (Xc @ Vt[:2].T).astype(np.float32)
+        for img_points in (img_points1, img_points2):
+            x = np.asarray(img_points, dtype=np.float32).reshape((-1,2))
+            H, mask = cv.findHomography(X2, x, cv.RANSAC, threshold, maxIters=niter)
+            if mask is not None:
+                inliers &= mask.ravel().astype(bool)
+        return inliers
+    rng = np.random.default_rng(seed)
+    ix = _sample_subsets(npts, 6, niter, rng)
+    TX = _normalizing_transform(X)
+    Xn = X @ TX[:3,:3].T + TX[:3,3]
+    Xh = np.concatenate((X, np.ones((npts,1))), axis=1)
+    err = np.zeros((niter, npts))
+    for img_points in (img_points1, img_points2):
+        x = np.asarray(img_points, dtype=np.float64).reshape((-1,2))
+        Tx = _normalizing_transform(x)
+        xn = x @ Tx[:2,:2].T + Tx[:2,2]
+        Pn = dlt_projection(Xn[ix], xn[ix])
+        P = np.linalg.inv(Tx) @ Pn @ TX   # back to pixels / object units
+        proj = Xh @ np.swapaxes(P, 1, 2)  # (niter,N,3)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            e = np.linalg.norm(proj[...,:2] / proj[...,2:] - x, axis=2)
+        err = np.maximum(err, np.nan_to_num(e, nan=np.inf))
+    best = np.argmax((err < threshold).sum(axis=1))
+    inliers = err[best] < threshold
+    # refit on the inliers of the best hypothesis
+    if inliers.sum() >= 6:
+        e_ref = np.zeros(npts)
+        for img_points in (img_points1, img_points2):
+            x = np.asarray(img_points, dtype=np.float64).reshape((-1,2))
+            Tx = _normalizing_transform(x[inliers])
+            xn = x @ Tx[:2,:2].T + Tx[:2,2]
+            P = np.linalg.inv(Tx) @ dlt_projection(Xn[inliers], xn[inliers]) @ TX
+            proj = Xh @ P.T
+            e_ref = np.maximum(e_ref, np.linalg.norm(proj[:,:2] / proj[:,2:] - x, axis=1))
+        inliers = e_ref < threshold
+    return inliers
+
 def rot_matrix_from_euler(t1, t2, t3):
     # X(t1) Y(t2) X(t3)
     # https://en.wikipedia.org/wiki/Euler_angles#Rotation_matrix
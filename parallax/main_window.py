@@ -6,8 +6,10 @@ from PyQt5.QtGui import QIcon
 import pyqtgraph.console
 import numpy as np
 import os
+import functools
 
 from . import get_image_file, data_dir
+from . import correspondence
 from .message_log import MessageLog
 from .screen_widget import ScreenWidget
 from .control_panel import ControlPanel
@@ -33,6 +35,7 @@ from .preferences import PreferencesWindow
 from .helper import uid8, FONT_BOLD
 from .camera_to_probe_transform_tool import CameraToProbeTransformTool
 from .calibration_tester import CalibrationTester
+from .tracking import TrackingTool
 
 
 class MainWindow(QMainWindow):
@@ -92,6 +95,8 @@ class MainWindow(QMainWindow):
         self.cpt_action.triggered.connect(self.launch_cpt)
         self.ct_action = QAction("Calibration Tester")
         self.ct_action.triggered.connect(self.launch_ct)
+        self.track_action = QAction("Tip Tracking")
+        self.track_action.triggered.connect(self.launch_track)
 
         # build the menubar
         self.file_menu = self.menuBar().addMenu("File")
@@ -128,6 +133,7 @@ class MainWindow(QMainWindow):
 
         self.tools_testing_menu.addAction(self.accutest_action)
 
+        self.tools_menu.addAction(self.track_action)
         self.tools_menu.addAction(self.tt_action)
         self.tools_menu.addAction(self.pb_action)
         self.tools_menu.addAction(self.ruler_action)
@@ -247,6 +253,11 @@ class MainWindow(QMainWindow):
         self.widget.ct.msg_posted.connect(self.widget.msg_log.post)
         self.widget.ct.show()
 
+    def launch_track(self):
+        self.track = TrackingTool(self.model)
+        self.track.msg_posted.connect(self.widget.msg_log.post)
+        self.track.show()
+
     def screens(self):
         return self.widget.lscreen, self.widget.rscreen
 
@@ -326,6 +337,14 @@ class MainWidget(QWidget):
         self.lscreen.cleared.connect(self.model.clear_lcorr)
         self.rscreen.selected.connect(self.model.set_rcorr)
         self.rscreen.cleared.connect(self.model.clear_rcorr)
+        self.lscreen.tips_detected.connect(self.associate_tips)
+        self.rscreen.tips_detected.connect(self.associate_tips)
+        self.lscreen.tips_timestamped.connect(self.model.tracker.update_left)
+        self.rscreen.tips_timestamped.connect(self.model.tracker.update_right)
+        self.lscreen.tips_timestamped.connect(self.cal_panel.update_tips_left)
+        self.rscreen.tips_timestamped.connect(self.cal_panel.update_tips_right)
+        self.lscreen.clicked.connect(functools.partial(self.auto_correspond, 0))
+        self.rscreen.clicked.connect(functools.partial(self.auto_correspond, 1))
 
         main_layout = QVBoxLayout()
         main_layout.addWidget(self.screens)
@@ -342,10 +361,11 @@ class MainWidget(QWidget):
                 self.zoom_out()
                 e.accept()
         elif e.key() == Qt.Key_C:
+            times = (self.lscreen.get_selected_time(), self.rscreen.get_selected_time())
             if self.model.cal_in_progress:
-                self.cal_panel.register_corr_points_cal()
+                self.cal_panel.register_corr_points_cal(times)
             if self.model.accutest_in_progress:
-                self.model.register_corr_points_accutest()
+                self.model.register_corr_points_accutest(times)
             if self.model.prefs.train_c:
                 self.save_training_data()
             if self.cpt is not None:
@@ -357,6 +377,47 @@ class MainWidget(QWidget):
             if self.model.prefs.train_t:
                 self.save_training_data()
 
+    def associate_tips(self):
+        # pick the epipolar-consistent left/right detection pair (rather than index 0 / 0)
+        lpts, rpts = self.lscreen.tip_positions, self.rscreen.tip_positions
+        if (len(lpts) < 2) and (len(rpts) < 2):
+            return
+        if self.cal_panel.combo.currentIndex() < 0:
+            return
+        cal = self.model.calibrations[self.cal_panel.combo.currentText()]
+        matches = cal.match_stereo(lpts, rpts)
+        if matches:
+            i, j, _ = min(matches, key=lambda m: m[2])
+            self.lscreen.select(lpts[i])
+            self.rscreen.select(rpts[j])
+
+    def auto_correspond(self, src, x, y):
+        # search the other screen for the point just clicked (see Preferences)
+        if not self.model.prefs.auto_corr:
+            return
+        if self.cal_panel.combo.currentIndex() < 0:
+            return
+        cal = self.model.calibrations[self.cal_panel.combo.currentText()]
+        if not hasattr(cal, 'get_fundamental_matrix'):
+            return
+        screens = (self.lscreen, self.rscreen)
+        src_screen, dst_screen = screens[src], screens[1-src]
+        if (src_screen.camera is None) or (dst_screen.camera is None):
+            return
+        frame_src = src_screen.camera.get_last_image_data()
+        frame_dst = dst_screen.camera.get_last_image_data()
+        match, score = correspondence.search_epipolar(cal, frame_src, frame_dst, (x, y), src)
+        if match is None:
+            self.msg_log.post('Auto-match: epipolar line is outside the other frame.')
+        elif score >= correspondence.SCORE_ACCEPT:
+            dst_screen.select(match)
+            self.msg_log.post('Auto-matched correspondence point: '
+                                '[{0:.2f}, {1:.2f}] (score {2:.2f})'.format(*match, score))
+        else:
+            dst_screen.select2(match)
+            self.msg_log.post('Proposed correspondence point: [{0:.2f}, {1:.2f}] '
+                                '(score {2:.2f}, not selected)'.format(*match, score))
+
     def save_training_data(self):
         if self.model.prefs.train_left:
             if (self.lscreen.camera is not None) and (not self.lscreen.is_detecting()):
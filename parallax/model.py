@@ -1,5 +1,5 @@
 from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtCore import QObject, pyqtSignal, QThread
+from PyQt5.QtCore import QObject, pyqtSignal, QThread, Qt
 
 import numpy as np
 import serial.tools.list_ports
@@ -18,6 +18,10 @@ from .stage import Stage
 from .accuracy_test import AccuracyTestWorker
 from .elevator import list_elevators
 from .preferences import Preferences
+from .tracking import TipTracker
+from .estimation import EstimatorWorker
+from .telemetry import StageTelemetry
+from .drift import DriftMonitorWorker
 
 
 class Model(QObject):
@@ -57,6 +61,33 @@ class Model(QObject):
         self.training_thread.finished.connect(self.training_thread.deleteLater)
         self.training_thread.start()
 
+        # tracking thread
+        self.tracking_thread = QThread()
+        self.tracker = TipTracker()
+        self.tracker.moveToThread(self.tracking_thread)
+        self.tracker.msg_posted.connect(self.msg_posted)
+        self.tracking_thread.finished.connect(self.tracking_thread.deleteLater)
+        self.tracking_thread.start()
+
+        # tip estimator thread (fuses stage telemetry and tracked tips)
+        self.estimator_thread = QThread()
+        self.estimator = EstimatorWorker()
+        self.estimator.moveToThread(self.estimator_thread)
+        self.estimator_thread.started.connect(self.estimator.run)
+        self.estimator.finished.connect(self.estimator_thread.quit)
+        self.estimator.finished.connect(self.estimator.deleteLater)
+        self.estimator_thread.finished.connect(self.estimator_thread.deleteLater)
+        self.tracker.tracked.connect(self.estimator.handle_tracked, Qt.DirectConnection)
+        self.estimator_thread.start()
+
+        # drift monitor (runs in the tracker's thread)
+        self.drift = DriftMonitorWorker()
+        self.drift.alert.connect(self.msg_posted)
+        self.tracker.tracked.connect(self.drift.handle_tracked, Qt.DirectConnection)
+
+        # stage telemetry threads, started on demand (see get_telemetry)
+        self.telemetry = {}     # stage name: (thread, StageTelemetry)
+
     def save_training_data(self, ipt, frame, tag):
         self.training_worker.submit_data(ipt, frame, tag)
 
@@ -121,8 +152,29 @@ class Model(QObject):
     def add_stage(self, stage):
         self.stages[stage.name] = stage
 
+    def get_telemetry(self, stage):
+        # position history of a stage, for time-aligned point registration
+        if stage.name not in self.telemetry:
+            thread = QThread()
+            telemetry = StageTelemetry(stage)
+            telemetry.moveToThread(thread)
+            thread.started.connect(telemetry.run)
+            telemetry.finished.connect(thread.quit)
+            telemetry.finished.connect(telemetry.deleteLater)
+            thread.finished.connect(thread.deleteLater)
+            thread.start()
+            self.telemetry[stage.name] = (thread, telemetry)
+        return self.telemetry[stage.name][1]
+
     def clean(self):
         close_cameras()
+        for thread, telemetry in self.telemetry.values():
+            telemetry.stop_running()
+            thread.wait()
+        self.tracking_thread.quit()
+        self.tracking_thread.wait()
+        self.estimator.stop_running()
+        self.estimator_thread.wait()
 
     def halt_all_stages(self):
         for stage in self.stages.values():
@@ -145,10 +197,11 @@ class Model(QObject):
         self.msg_posted.emit('Highlight correspondence points and press C to continue')
         self.accutest_point_reached.emit()
 
-    def register_corr_points_accutest(self):
+    def register_corr_points_accutest(self, times=None):
+        # times: capture times of the frames the points were selected in
         lcorr, rcorr = self.lcorr, self.rcorr
         if (lcorr and rcorr):
-            self.accutest_worker.register_corr_points(lcorr, rcorr)
+            self.accutest_worker.register_corr_points(lcorr, rcorr, times)
             self.msg_posted.emit('Correspondence points registered: (%d,%d) and (%d,%d)' % \
                                     (lcorr[0],lcorr[1], rcorr[0],rcorr[1]))
             self.accutest_worker.carry_on()
@@ -160,6 +213,7 @@ class Model(QObject):
 
     def start_accuracy_test(self, params):
         self.accutest_thread = QThread()
+        params['telemetry'] = self.get_telemetry(params['stage'])
         self.accutest_worker = AccuracyTestWorker(params)
         self.accutest_worker.moveToThread(self.accutest_thread)
         self.accutest_thread.started.connect(self.accutest_worker.run)
@@ -0,0 +1,142 @@
+"""
+Pose selection for checkerboard calibration: score the grabbed poses by image
+coverage, board tilt and corner quality, and keep the smallest subset that
+covers the frame, so that near-duplicate poses don't slow down the solve
+(or bias it towards one part of the image).
+"""
+
+import numpy as np
+import cv2
+
+from .helper import WF, HF
+from .calibration import imtx
+
+
+GRID = (12, 16)             # coverage cells (rows, columns) over the frame
+COVER_DEPTH = 2             # a cell is covered once seen by this many poses
+COVERAGE_TARGET = 0.95      # of what all poses together cover
+MIN_POSES = 6
+MIN_TILTED = 3              # poses tilted by at least MIN_TILT_DEG (if available)
+MIN_TILT_DEG = 15.
+QUALITY_SIGMA = 1.          # pixels, homography residual scale for corner quality
+
+
+def hull_cells(img_points, grid=GRID):
+    # (rows*cols,) boolean mask of the cells inside the convex hull of the corners
+    rows, cols = grid
+    scale = np.array([cols / WF, rows / HF])
+    pts = np.asarray(img_points, dtype=np.float64).reshape((-1,2)) * scale
+    hull = cv2.convexHull(np.round(pts * 16).astype(np.int32))   # 4 bits subpixel
+    mask = np.zeros((rows, cols), dtype=np.uint8)
+    cv2.fillConvexPoly(mask, hull, 1, lineType=cv2.LINE_8, shift=4)
+    return mask.ravel().astype(bool)
+
+def coverage_map(img_points, grid=GRID):
+    # (rows, cols) number of poses covering each cell
+    counts = np.zeros(grid[0] * grid[1], dtype=np.int32)
+    for ipts in img_points:
+        counts += hull_cells(ipts, grid)
+    return counts.reshape(grid)
+
+def board_normal(img_points, obj_points, mtx=imtx):
+    """
+    Unit normal of the board in the camera frame (z along the optical axis),
+    from the board-to-image homography and approximate intrinsics, and the
+    RMS residual (pixels) of the homography fit (a measure of corner quality,
+    which includes lens distortion).
+    """
+    obj = np.asarray(obj_points, dtype=np.float64).reshape((-1,3))[:,:2]
+    img = np.asarray(img_points, dtype=np.float64).reshape((-1,2))
+    H, _ = cv2.findHomography(obj, img)
+    proj = cv2.perspectiveTransform(obj.reshape((-1,1,2)), H).reshape((-1,2))
+    rms = np.sqrt(np.mean(np.sum((proj - img)**2, axis=1)))
+    B = np.linalg.inv(mtx) @ H
+    r1 = B[:,0] / np.linalg.norm(B[:,0])
+    r2 = B[:,1] / np.linalg.norm(B[:,1])
+    n = np.cross(r1, r2)
+    n /= np.linalg.norm(n)
+    if n[2] < 0:
+        n = -n
+    return n, rms
+
+def pose_features(img_points, obj_points, grid=GRID, mtx=imtx):
+    """
+    Per-pose features for a list of cameras' image points (each (npose,npts,2))
+    of the same poses: covered cells (npose, ncam*ncells), board normals in the
+    first camera (npose,3), tilts (degrees) and corner quality in (0,1] (worst
+    camera).
+    """
+    npose = len(obj_points)
+    cells = np.array([np.concatenate([hull_cells(ipts[i], grid) for ipts in img_points]) \
+                        for i in range(npose)])
+    normals = np.zeros((npose,3))
+    rms = np.zeros(npose)
+    for i in range(npose):
+        normals[i], _ = board_normal(img_points[0][i], obj_points[i], mtx)
+        rms[i] = max(board_normal(ipts[i], obj_points[i], mtx)[1] for ipts in img_points)
+    tilts = np.degrees(np.arccos(np.clip(normals[:,2], -1., 1.)))
+    quality = 1. / (1. + (rms / QUALITY_SIGMA)**2)
+    return cells, normals, tilts, quality
+
+def select_poses(img_points, obj_points, coverage_target=COVERAGE_TARGET,
+                    min_poses=MIN_POSES, grid=GRID, mtx=imtx):
+    """
+    Greedy selection of poses for calibration. img_points is a list with one
+    (npose,npts,2) array per camera. Each step adds the pose with the best
+    quality-weighted gain in (depth-limited) coverage, until the coverage target
+    (relative to all poses) is met. Then, if needed, poses with the most
+    different board normals are added (tilted ones first) up to min_poses poses
+    of which MIN_TILTED are tilted (if the data allow).
+    Returns the selected indices (in grab order) and the final coverage.
+    """
+    npose = len(obj_points)
+    if npose <= min_poses:
+        return np.arange(npose), 1.
+    cells, normals, tilts, quality = pose_features(img_points, obj_points, grid, mtx)
+    total = np.minimum(np.sum(cells, axis=0), COVER_DEPTH).sum()
+    ntilted = min(MIN_TILTED, int(np.sum(tilts >= MIN_TILT_DEG)))
+    counts = np.zeros(cells.shape[1], dtype=np.int32)
+    selected = []
+    available = np.ones(npose, dtype=bool)
+    coverage = 0.
+    while np.any(available):
+        depth = np.minimum(counts, COVER_DEPTH)
+        gain = (np.minimum(counts + cells, COVER_DEPTH) - depth).sum(axis=1) / total
+        need_tilted = np.sum(tilts[selected] >= MIN_TILT_DEG) < ntilted
+        if coverage < coverage_target:
+            score = quality * gain
+        else:
+            if selected:
+                # angle to the nearest selected normal (radians)
+                cos = np.clip(normals @ normals[selected].T, -1., 1.)
+                diversity = np.min(np.arccos(cos), axis=1)
+            else:
+                diversity = np.radians(tilts)
+            score = quality * (diversity + gain)
+            if need_tilted:
+                score = np.where(tilts >= MIN_TILT_DEG, score, -np.inf)
+        score = np.where(available, score, -np.inf)
+        j = int(np.argmax(score))
+        selected.append(j)
+        available[j] = False
+        counts += cells[j]
+        coverage = np.minimum(counts, COVER_DEPTH).sum() / total
+        if (coverage >= coverage_target) and (len(selected) >= min_poses) and \
+                (np.sum(tilts[selected] >= MIN_TILT_DEG) >= ntilted):
+            break
+    return np.sort(selected), coverage
+
+def suggest_region(counts):
+    # where the board is needed most: name of the least covered ninth of the frame
+    rows, cols = counts.shape
+    names = (('top left', 'top', 'top right'),
+             ('left', 'center', 'right'),
+             ('bottom left', 'bottom', 'bottom right'))
+    best, best_count = None, np.inf
+    for i in range(3):
+        for j in range(3):
+            block = counts[i*rows//3:(i+1)*rows//3, j*cols//3:(j+1)*cols//3]
+            c = np.mean(np.minimum(block, COVER_DEPTH))
+            if c < best_count:
+                best, best_count = names[i][j], c
+    return best
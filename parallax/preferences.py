@@ -12,6 +12,7 @@ class Preferences:
         self.train_t = False
         self.train_left = True
         self.train_right = True
+        self.auto_corr = False
 
 def _b2cs(val):
     # "bool to CheckState"
@@ -41,11 +42,18 @@ class PreferencesWindow(QWidget):
         self.train_right_check.setCheckState(_b2cs(self.model.prefs.train_right))
         self.train_right_check.stateChanged.connect(self.handle_check)
 
+        self.auto_corr_check = QCheckBox('Auto-match correspondence points')
+        self.auto_corr_check.setToolTip('When a point is clicked in one screen, search for '
+                                        'it along the epipolar line in the other screen')
+        self.auto_corr_check.setCheckState(_b2cs(self.model.prefs.auto_corr))
+        self.auto_corr_check.stateChanged.connect(self.handle_check)
+
         layout = QGridLayout()
         layout.addWidget(self.train_c_check)
         layout.addWidget(self.train_t_check)
         layout.addWidget(self.train_left_check)
         layout.addWidget(self.train_right_check)
+        layout.addWidget(self.auto_corr_check)
         self.setLayout(layout)
 
         self.setWindowTitle('Preferences')
@@ -60,4 +68,6 @@ class PreferencesWindow(QWidget):
             self.model.prefs.train_left = (state == Qt.Checked)
         elif self.sender() is self.train_right_check:
             self.model.prefs.train_right = (state == Qt.Checked)
+        elif self.sender() is self.auto_corr_check:
+            self.model.prefs.auto_corr = (state == Qt.Checked)
 
@@ -253,6 +253,9 @@ class CorrespondencePointsTab(QWidget):
         self.save_button.clicked.connect(self.save)
         self.generate_button = QPushButton('Generate Transform')
         self.generate_button.clicked.connect(self.generate)
+        self.ransac_check = QCheckBox('Reject Outliers')
+        self.ransac_check.setToolTip('Exclude correspondence points inconsistent with '
+                                        'the others (RANSAC)')
         ###
         self.right_layout = QGridLayout()
         self.right_layout.addWidget(self.load_button, 0,0, 1,1)
@@ -260,6 +263,7 @@ class CorrespondencePointsTab(QWidget):
         self.right_layout.addWidget(self.list_widget, 1,0, 10,2)
         self.right_layout.addWidget(self.name_edit, 11,0, 1,1)
         self.right_layout.addWidget(self.generate_button, 11,1, 1,1)
+        self.right_layout.addWidget(self.ransac_check, 12,0, 1,2)
         self.right_widget.setLayout(self.right_layout)
 
         self.layout = QHBoxLayout()
@@ -360,7 +364,14 @@ class CorrespondencePointsTab(QWidget):
         to_cs = self.cs2_name_edit.text()
 
         transform = TransformNP(name, from_cs, to_cs)
-        transform.compute_from_correspondence(p1, p2)
+        if self.ransac_check.isChecked():
+            transform.compute_from_correspondence_ransac(p1, p2)
+            outliers = transform.get_outliers()
+            if outliers:
+                self.msg_posted.emit('Rigid Body Transform: rejected correspondence points %s' \
+                                        % ', '.join(str(i+1) for i in outliers))
+        else:
+            transform.compute_from_correspondence(p1, p2)
 
         self.model.add_transform(transform)
         self.generated.emit()
@@ -6,6 +6,7 @@ from PyQt5 import QtCore
 import pyqtgraph as pg
 import inspect
 import importlib
+import time
 
 from . import filters
 from . import detectors
@@ -14,7 +15,10 @@ from . import detectors
 class ScreenWidget(pg.GraphicsView):
 
     selected = pyqtSignal(int, int)
+    clicked = pyqtSignal(float, float)   # selection by the user (camera frame coordinates)
     cleared = pyqtSignal()
+    tips_detected = pyqtSignal(list)
+    tips_timestamped = pyqtSignal(list, float)
 
     def __init__(self, filename=None, model=None, parent=None):
         super().__init__(parent=parent)
@@ -54,6 +58,10 @@ class ScreenWidget(pg.GraphicsView):
         self.filter = filters.NoFilter()
         self.filter.frame_processed.connect(self.set_image_item_from_data)
         self.detector = detectors.NoDetector()
+        self.tip_positions = []
+        self.tip_time = None        # capture time of the frame the tips were detected in
+        self.frame_time = None      # capture time of the last frame shown
+        self.selected_time = None   # ... when the current point was selected
 
         # sub-menus
         self.parallax_menu = QMenu("Parallax", self.view_box.menu)
@@ -73,6 +81,8 @@ class ScreenWidget(pg.GraphicsView):
 
     def refresh(self):
         if self.camera:
+            # the camera stamps a frame after storing it, so read the stamp first
+            self.frame_time = getattr(self.camera, 'last_capture_time', None) or time.time()
             data = self.camera.get_last_image_data()
             self.set_data(data)
 
@@ -85,7 +95,7 @@ class ScreenWidget(pg.GraphicsView):
 
     def set_data(self, data):
         self.filter.process(data)
-        self.detector.process(data)
+        self.detector.process(data, self.frame_time)
 
     def set_image_item_from_data(self, data):
         self.image_item.setImage(data, autoLevels=False)
@@ -131,17 +141,22 @@ class ScreenWidget(pg.GraphicsView):
 
     def image_clicked(self, event):
         if event.button() == QtCore.Qt.MouseButton.LeftButton:            
-            self.select(event.pos())
+            pos = event.pos()
+            self.select(self.filter.unmap_point(pos.x(), pos.y()))
+            self.clicked.emit(*self.selected_pos)
         elif event.button() == QtCore.Qt.MouseButton.MiddleButton:            
             self.zoom_out()
 
     def select(self, pos):
-        self.click_target.setPos(pos)
+        # pos in camera frame coordinates (the filter may display a remapped image)
+        self.selected_pos = (float(pos[0]), float(pos[1]))
+        self.selected_time = self.frame_time
+        self.click_target.setPos(self.filter.map_point(*self.selected_pos))
         self.click_target.setVisible(True)
         self.selected.emit(*self.get_selected())
 
     def select2(self, pos):
-        self.click_target2.setPos(pos)
+        self.click_target2.setPos(self.filter.map_point(pos[0], pos[1]))
         self.click_target2.setVisible(True)
 
     def zoom_out(self):
@@ -157,7 +172,10 @@ class ScreenWidget(pg.GraphicsView):
     def set_filter(self, filt):
         self.filter = filt()
         self.filter.frame_processed.connect(self.set_image_item_from_data)
+        self.filter.set_model(self.model)
         self.filter.launch_control_panel()
+        if self.click_target.isVisible():
+            self.click_target.setPos(self.filter.map_point(*self.selected_pos))
 
     def set_detector(self, detector):
         self.detector = detector()
@@ -165,19 +183,29 @@ class ScreenWidget(pg.GraphicsView):
         if hasattr(self.detector, "tracked"):
             self.detector.tracked.connect(self.handle_detector_tracked)
 
-    def handle_detector_tracked(self, tip_positions):
+    def handle_detector_tracked(self, tip_positions, frame_time):
+        self.tip_positions = tip_positions
+        self.tip_time = frame_time
         if len(tip_positions) > 0:
             self.select(tip_positions[0])
         if len(tip_positions) > 1:
             self.select2(tip_positions[1])
+        self.tips_detected.emit(tip_positions)
+        self.tips_timestamped.emit(tip_positions, self.tip_time)
 
     def get_selected(self):
         if self.click_target.isVisible():
-            pos = self.click_target.pos()
-            return pos.x(), pos.y()
+            return self.selected_pos
         else:
             return None, None
 
+    def get_selected_time(self):
+        # capture time of the frame the current point was selected in
+        if self.click_target.isVisible():
+            return self.selected_time
+        else:
+            return None
+
     def wheelEvent(self, e):
         forward = bool(e.angleDelta().y() > 0)
         control = bool(e.modifiers() & Qt.ControlModifier)
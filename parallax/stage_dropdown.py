@@ -60,7 +60,37 @@ class CalibrationDropdown(QComboBox):
 
     def populate(self):
         self.clear()
-        for name in self.model.calibrations.keys():
-            self.addItem(name)
+        for name, cal in self.model.calibrations.items():
+            if hasattr(cal, 'match_stereo'):    # stereo calibrations only
+                self.addItem(name)
+
+
+
+
+class TransformDropdown(QComboBox):
 
+    def __init__(self, model, fixed_items=()):
+        # fixed_items: entries listed before the transforms (e.g. '(none)')
+        QComboBox.__init__(self)
+        self.model = model
+        self.fixed_items = list(fixed_items)
+
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setToolTip('Select a transform')
+        self.populate()
 
+    def showPopup(self):
+        self.populate()
+        QComboBox.showPopup(self)
+
+    def get_current(self):
+        return self.model.transforms[self.currentText()]
+
+    def populate(self):
+        # keep the selection if it still exists
+        current = self.currentText()
+        self.clear()
+        self.addItems(self.fixed_items)
+        for name in self.model.transforms.keys():
+            self.addItem(name)
+        self.setCurrentIndex(max(self.findText(current), 0))
@@ -0,0 +1,146 @@
+"""
+Versioned file store for calibrations, intrinsics and transforms.
+
+Objects are saved as .npz containers with a fixed schema per kind. Parameters
+are read eagerly; heavy arrays (calibration points, errors) are only read
+from disk on first access. Files hold plain arrays (no pickled objects), so
+they load regardless of how the classes change. Legacy pickle files are
+still readable, and can be converted with migrate().
+"""
+
+import numpy as np
+import pickle
+import zipfile
+import functools
+
+
+FORMAT = 'parallax'
+VERSION = 1
+
+CALIBRATION_PARAMS = ('name', 'cs', 'offset', 'intrinsics_fixed',
+                        'imtx1', 'imtx2', 'idist1', 'idist2',
+                        'mtx1', 'mtx2', 'dist1', 'dist2',
+                        'rvecs1', 'tvecs1', 'rvecs2', 'tvecs2',
+                        'rmse_reproj_1', 'rmse_reproj_2', 'npose', 'npts',
+                        'mean_error', 'std_error', 'rmse', 'inliers', 'triangulation_method')
+STEREO_PARAMS = ('R', 'T', 'E', 'F', 'rmse_reproj_stereo')
+CALIBRATION_ARRAYS = ('obj_points', 'img_points1', 'img_points2', 'err', 'obj_points_refined')
+CALIBRATION_N_PARAMS = ('name', 'cs', 'offset', 'ncam', 'intrinsics_fixed', 'imtx', 'idist',
+                        'mtx', 'dist', 'rvecs', 'tvecs', 'rmse_reproj', 'weights', 'npose',
+                        'npts', 'mean_error', 'std_error', 'rmse', 'rmse_views')
+
+# kind: (parameters, lazily loaded arrays)
+SCHEMA = {
+    'Calibration': (CALIBRATION_PARAMS, CALIBRATION_ARRAYS),
+    'CalibrationStereo': (CALIBRATION_PARAMS + STEREO_PARAMS, CALIBRATION_ARRAYS),
+    'CalibrationN': (CALIBRATION_N_PARAMS, ('obj_points', 'img_points', 'err', 'residuals')),
+    'IntrinsicParameters': (('name', 'imtx', 'idist', 'mtx', 'dist', 'rmse'),
+                            ('obj_points', 'img_points')),
+    'TransformNP': (('name', 'from_cs', 'to_cs', 'rot', 'ori', 'params', 'rmse',
+                        'mean_error', 'std_error', 'dproj', 'dparams',
+                        'from_points', 'to_points', 'inliers'), ()),
+    'TransformNPS': (('name', 'from_cs', 'to_cs', 'rot', 'ori', 's', 'params', 'rmse',
+                        'mean_error', 'std_error', 'dproj', 'dparams',
+                        'from_points', 'to_points', 'inliers'), ()),
+}
+
+# per-pose vectors, stored stacked and restored as tuples (as returned by OpenCV)
+SEQUENCE_FIELDS = ('rvecs1', 'tvecs1', 'rvecs2', 'tvecs2')
+
+# upgrades from older format versions: {version: function(fields) -> fields}
+UPGRADES = {}
+
+
+def get_class(kind):
+    if kind in ('Calibration', 'CalibrationStereo', 'CalibrationN'):
+        from . import calibration as module
+    elif kind == 'IntrinsicParameters':
+        from . import intrinsics_tool as module
+    else:
+        from . import transform as module
+    return getattr(module, kind)
+
+def is_store_file(filename):
+    return zipfile.is_zipfile(filename)
+
+def save(obj, filename):
+    kind = type(obj).__name__
+    if kind not in SCHEMA:
+        raise TypeError('cannot store objects of type %s' % kind)
+    params, arrays = SCHEMA[kind]
+    fields = {'__format__': np.array(FORMAT), '__version__': np.array(VERSION),
+                '__kind__': np.array(kind)}
+    for key in params + arrays:
+        try:
+            value = getattr(obj, key)
+        except AttributeError:
+            continue
+        if value is None:
+            continue
+        if key in SEQUENCE_FIELDS:
+            value = np.stack([np.asarray(v) for v in value])
+        fields[key] = np.asarray(value)
+    with open(filename, 'wb') as f:
+        np.savez(f, **fields)
+
+def read_array(filename, key):
+    try:
+        with np.load(filename, allow_pickle=False) as npz:
+            return npz[key]
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        raise ValueError('cannot read %s from %s (was the file moved, deleted or '
+                            'overwritten after loading?): %s' % (key, filename, e)) from e
+
+def _value(array, key):
+    if key in SEQUENCE_FIELDS:
+        return tuple(array)
+    if array.ndim == 0:
+        return array.item()
+    return array
+
+def load(filename):
+    """
+    Load a calibration, intrinsics or transform from a store file, or from a
+    legacy pickle file.
+    """
+    if not is_store_file(filename):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    with np.load(filename, allow_pickle=False) as npz:
+        if ('__format__' not in npz.files) or (npz['__format__'].item() != FORMAT):
+            raise ValueError('%s is not a Parallax file' % filename)
+        version = int(npz['__version__'])
+        if version > VERSION:
+            raise ValueError('%s was written by a newer version of Parallax (format %d)' % \
+                                (filename, version))
+        kind = npz['__kind__'].item()
+        if kind not in SCHEMA:
+            raise ValueError('%s holds an unknown kind of object (%s)' % (filename, kind))
+        params, arrays = SCHEMA[kind]
+        fields = {key: _value(npz[key], key) for key in params if key in npz.files}
+        lazy = {key: functools.partial(read_array, filename, key) for key in arrays \
+                    if key in npz.files}
+    while version < VERSION:
+        version += 1
+        if version in UPGRADES:
+            fields = UPGRADES[version](fields)
+    cls = get_class(kind)
+    obj = cls.__new__(cls)
+    for key, value in fields.items():
+        setattr(obj, key, value)
+    if lazy:
+        if hasattr(cls, 'set_lazy_arrays'):
+            obj.set_lazy_arrays(lazy)
+        else:
+            for key, loader in lazy.items():
+                setattr(obj, key, loader())
+    return obj
+
+def migrate(filename_in, filename_out):
+    """
+    Convert a legacy pickle file to the store format.
+    """
+    with open(filename_in, 'rb') as f:
+        obj = pickle.load(f)
+    save(obj, filename_out)
+    return obj
@@ -0,0 +1,127 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import numpy as np
+import threading
+import time
+from collections import deque
+
+
+POLL_INTERVAL = 0.02    # seconds
+HISTORY = 30.           # seconds of telemetry kept
+WAIT_TIMEOUT = 1.       # seconds to wait for a sample after the requested time
+MOVING_TOL_UM = 2.      # displacement around a frame that counts as moving
+
+
+class StageTelemetry(QObject):
+
+    """
+    Ring buffer of timestamped stage positions, polled in its own thread (see
+    Model.get_telemetry), so that the stage position can be looked up at the
+    capture time of a frame rather than at the time a point is registered.
+    Each sample is stamped with the midpoint of its get_position() call.
+    """
+
+    finished = pyqtSignal()
+
+    def __init__(self, stage, poll_interval=POLL_INTERVAL, history=HISTORY):
+        QObject.__init__(self)
+        self.stage = stage
+        self.poll_interval = poll_interval
+        self.samples = deque(maxlen=int(history / poll_interval))   # (t, x, y, z)
+        self.lock = threading.Lock()
+        self.running = True
+
+    def stop_running(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            t0 = time.time()
+            position = self.stage.get_position()
+            t1 = time.time()
+            with self.lock:
+                self.samples.append(((t0 + t1) / 2.,) + tuple(position))
+            time.sleep(self.poll_interval)
+        self.finished.emit()
+
+    def get_samples(self, since=None):
+        # (N,4) array of (t, x, y, z), optionally only from the last sample before since
+        with self.lock:
+            if since is None:
+                samples = list(self.samples)
+            else:
+                samples = []
+                for sample in reversed(self.samples):
+                    samples.append(sample)
+                    if sample[0] < since:
+                        break
+                samples.reverse()
+        return np.array(samples, dtype=np.float64).reshape((-1,4))
+
+    def wait_for(self, t, timeout=WAIT_TIMEOUT):
+        # wait until a sample later than t is available; returns the samples, or None
+        t_end = time.time() + timeout
+        while True:
+            samples = self.get_samples()
+            if len(samples) and (samples[-1,0] >= t):
+                return samples
+            if (time.time() > t_end) or not self.running:
+                return None
+            time.sleep(self.poll_interval / 2.)
+
+    def position_at(self, t, timeout=WAIT_TIMEOUT):
+        """
+        Stage position at time t, linearly interpolated between the samples
+        bracketing t, or None if t is not covered by the history.
+        """
+        samples = self.wait_for(t, timeout)
+        if (samples is None) or (t < samples[0,0]):
+            return None
+        return interpolate(samples, t)
+
+    def is_moving(self, t, tol=MOVING_TOL_UM, timeout=WAIT_TIMEOUT):
+        """
+        Whether the stage moved by more than tol (um) between the samples
+        bracketing t (one poll interval either side), or None if unknown.
+        """
+        samples = self.wait_for(t + self.poll_interval, timeout)
+        if (samples is None) or (t < samples[0,0]):
+            return None
+        return moved(samples, t, self.poll_interval, tol)
+
+    def lookup(self, t, tol=MOVING_TOL_UM):
+        """
+        Non-blocking (position, moving) at time t, or (None, None) if the
+        history doesn't cover t (yet).
+        """
+        samples = self.get_samples(since=t - self.poll_interval)
+        if (len(samples) == 0) or (t < samples[0,0]) or \
+                (samples[-1,0] < t + self.poll_interval):
+            return None, None
+        return interpolate(samples, t), moved(samples, t, self.poll_interval, tol)
+
+    def register(self, times, timeout=WAIT_TIMEOUT):
+        """
+        Stage position for a correspondence whose image points come from
+        frames captured at times (one per camera): the mean of the positions
+        at those times. Returns (position, moving), or (None, None) if the
+        history doesn't cover the times.
+        """
+        positions = [self.position_at(t, timeout) for t in times]
+        if any(p is None for p in positions):
+            return None, None
+        moving = any(self.is_moving(t, timeout=timeout) for t in times) or \
+                    bool(np.max(np.ptp(positions, axis=0)) > MOVING_TOL_UM)
+        return tuple(float(x) for x in np.mean(positions, axis=0)), moving
+
+
+def interpolate(samples, t):
+    # position at time t from (N,4) samples (t, x, y, z)
+    return tuple(float(np.interp(t, samples[:,0], samples[:,k])) for k in (1,2,3))
+
+def moved(samples, t, dt, tol):
+    # whether the position changed by more than tol within dt of t
+    i0 = max(np.searchsorted(samples[:,0], t - dt) - 1, 0)
+    i1 = np.searchsorted(samples[:,0], t + dt) + 1
+    window = samples[i0:i1,1:]
+    return bool(np.max(np.ptp(window, axis=0)) > tol)
@@ -0,0 +1,194 @@
+import json
+import os
+
+import numpy as np
+import cv2
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+MANIFEST = 'tip_model.json'
+PEAK_THRESHOLD = 0.2
+
+
+def _get(d, *keys, default=None):
+    for key in keys:
+        if not isinstance(d, dict) or (d.get(key) is None):
+            return default
+        d = d[key]
+    return d
+
+
+def export_model(centroid_dir, instance_dir, output_dir, opset=13):
+    """
+    Export a trained SLEAP centroid/instance model pair (as selected in the SLEAP
+    detector) to ONNX, plus a manifest with the preprocessing parameters needed to
+    run them without SLEAP. Requires tensorflow and tf2onnx (i.e. the training
+    environment); the exported model only needs OpenCV or onnxruntime.
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {'version': 1, 'peak_threshold': PEAK_THRESHOLD}
+    for key, model_dir in (('centroid', centroid_dir), ('instance', instance_dir)):
+        with open(os.path.join(model_dir, 'training_config.json'), 'r') as f:
+            cfg = json.load(f)
+        model = tf.keras.models.load_model(os.path.join(model_dir, 'best_model.h5'),
+                                            compile=False)
+        input_name = model.inputs[0].name.split(':')[0]
+        filename = key + '.onnx'
+        tf2onnx.convert.from_keras(model, opset=opset, inputs_as_nchw=[input_name],
+                                    output_path=os.path.join(output_dir, filename))
+        heads = _get(cfg, 'model', 'heads', default={})
+        head = heads.get('centroid') if key == 'centroid' else heads.get('centered_instance')
+        backbone = _get(cfg, 'model', 'backbone', default={})
+        max_stride = max([_get(b, 'max_stride', default=1) for b in backbone.values()
+                            if isinstance(b, dict)] + [1])
+        manifest[key] = {
+            'file': filename,
+            'input_shape': [d for d in model.inputs[0].shape[1:]],   # H, W, C (may be None)
+            'input_scaling': _get(cfg, 'data', 'preprocessing', 'input_scaling', default=1.),
+            'output_stride': _get(head, 'output_stride', default=1),
+            'max_stride': max_stride,
+        }
+        if key == 'instance':
+            manifest[key]['crop_size'] = _get(cfg, 'data', 'instance_cropping', 'crop_size')
+    with open(os.path.join(output_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    return output_dir
+
+
+class _Session:
+
+    """
+    Thin wrapper around an ONNX model, run with onnxruntime if available
+    and OpenCV DNN otherwise. Inputs are NCHW float32 blobs.
+    """
+
+    def __init__(self, filename, backend=None):
+        if backend is None:
+            backend = 'onnxruntime' if onnxruntime is not None else 'opencv'
+        self.backend = backend
+        if backend == 'onnxruntime':
+            self.session = onnxruntime.InferenceSession(filename,
+                                                    providers=['CPUExecutionProvider'])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            self.net = cv2.dnn.readNetFromONNX(filename)
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            self.output_names = self.net.getUnconnectedOutLayersNames()
+
+    def run(self, blob):
+        # returns the first output (confidence maps), NHWC
+        if self.backend == 'onnxruntime':
+            return self.session.run(None, {self.input_name: blob})[0]
+        else:
+            self.net.setInput(blob)
+            return self.net.forward(self.output_names)[0]
+
+
+def _find_peaks(cm, threshold):
+    # local maxima of a (h,w) confidence map, refined by a 3x3 weighted centroid
+    cm_max = cv2.dilate(cm, np.ones((3,3), dtype=np.uint8))
+    ys, xs = np.nonzero((cm >= cm_max) & (cm > threshold))
+    peaks = []
+    for y, x in zip(ys, xs):
+        peaks.append(_refine_peak(cm, x, y) + (cm[y,x],))
+    return peaks
+
+def _refine_peak(cm, x, y):
+    y0, y1 = max(y-1, 0), min(y+2, cm.shape[0])
+    x0, x1 = max(x-1, 0), min(x+2, cm.shape[1])
+    patch = np.clip(cm[y0:y1, x0:x1], 0, None)
+    total = patch.sum()
+    if total <= 0:
+        return float(x), float(y)
+    gy, gx = np.mgrid[y0:y1, x0:x1]
+    return float((gx * patch).sum() / total), float((gy * patch).sum() / total)
+
+
+class TipModel:
+
+    """
+    CPU runtime for an exported centroid/instance tip model (see export_model).
+    predict(frame) returns a list of (x, y) tip positions in full-frame pixels.
+    """
+
+    def __init__(self, model_dir, backend=None):
+        with open(os.path.join(model_dir, MANIFEST), 'r') as f:
+            self.manifest = json.load(f)
+        self.cfg_centroid = self.manifest['centroid']
+        self.cfg_instance = self.manifest['instance']
+        self.threshold = self.manifest.get('peak_threshold', PEAK_THRESHOLD)
+        # instance crops are square, of the training crop size or the fixed input size
+        self.crop_size = self.cfg_instance.get('crop_size') or self.cfg_instance['input_shape'][0]
+        if not self.crop_size:
+            raise ValueError('%s: the instance model has a dynamic input shape and no crop '
+                                'size; re-export it from a training config with '
+                                'data.instance_cropping.crop_size set' % model_dir)
+        self.centroid = _Session(os.path.join(model_dir, self.cfg_centroid['file']), backend)
+        self.instance = _Session(os.path.join(model_dir, self.cfg_instance['file']), backend)
+        self.backend = self.centroid.backend
+
+    @staticmethod
+    def _prepare(frame, cfg):
+        nchannels = cfg['input_shape'][-1] or 1
+        if (frame.ndim == 3) and (nchannels == 1):
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        elif (frame.ndim == 2) and (nchannels == 3):
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+        scale = cfg['input_scaling']
+        if scale != 1.:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        if frame.ndim == 2:
+            frame = frame[:,:,None]
+        return frame.astype(np.float32) / 255.
+
+    def predict_centroids(self, frame):
+        cfg = self.cfg_centroid
+        img = self._prepare(frame, cfg)
+        h, w = img.shape[:2]
+        hin, win = cfg['input_shape'][:2]
+        stride = cfg['max_stride']
+        hin = hin or int(np.ceil(h / stride) * stride)
+        win = win or int(np.ceil(w / stride) * stride)
+        blob = np.zeros((1, img.shape[2], hin, win), dtype=np.float32)
+        blob[0, :, :min(h,hin), :min(w,win)] = img[:hin,:win].transpose(2,0,1)
+        cm = self.centroid.run(blob)[0,:,:,0]
+        s = cfg['output_stride'] / cfg['input_scaling']
+        return [(x*s, y*s) for x, y, v in _find_peaks(cm, self.threshold)]
+
+    def predict(self, frame):
+        centroids = self.predict_centroids(frame)
+        if not centroids:
+            return []
+        cfg = self.cfg_instance
+        img = self._prepare(frame, cfg)
+        scale = cfg['input_scaling']
+        crop = self.crop_size
+        blob = np.zeros((len(centroids), img.shape[2], crop, crop), dtype=np.float32)
+        origins = []
+        for i, (cx, cy) in enumerate(centroids):
+            x0 = int(round(cx * scale - crop / 2))
+            y0 = int(round(cy * scale - crop / 2))
+            xa, ya = max(x0, 0), max(y0, 0)
+            xb, yb = min(x0 + crop, img.shape[1]), min(y0 + crop, img.shape[0])
+            if (xb > xa) and (yb > ya):
+                blob[i, :, ya-y0:yb-y0, xa-x0:xb-x0] = img[ya:yb, xa:xb].transpose(2,0,1)
+            origins.append((x0, y0))
+        cms = self.instance.run(blob)
+        tip_positions = []
+        for i, (x0, y0) in enumerate(origins):
+            cm = cms[i,:,:,0]
+            y, x = np.unravel_index(np.argmax(cm), cm.shape)
+            if cm[y,x] < self.threshold:
+                continue
+            xr, yr = _refine_peak(cm, x, y)
+            stride = cfg['output_stride']
+            tip_positions.append(((x0 + xr * stride) / scale, (y0 + yr * stride) / scale))
+        return tip_positions
@@ -0,0 +1,337 @@
+from PyQt5.QtWidgets import QWidget, QLabel, QPushButton, QComboBox, QDoubleSpinBox
+from PyQt5.QtWidgets import QGridLayout, QCheckBox
+from PyQt5.QtCore import pyqtSignal, Qt, QObject, QMimeData
+from PyQt5.QtGui import QDrag, QIcon
+
+import numpy as np
+import time
+from collections import deque
+
+from . import get_image_file
+from .helper import FONT_BOLD
+from .stage_dropdown import StageDropdown
+
+
+MAX_SKEW_DEFAULT = 0.1    # seconds between left and right detections
+LATENCY_HISTORY = 100
+
+
+class TipTracker(QObject):
+
+    """
+    Continuous 3D tip tracking: pairs left/right detections in time, associates
+    them with the epipolar constraint, triangulates with the selected calibration
+    and (optionally) maps the result through the selected transform.
+    Lives in its own thread (see Model); subscribe to the tracked signal.
+    """
+
+    tracked = pyqtSignal(dict)
+    msg_posted = pyqtSignal(str)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.cal = None
+        self.transform = None
+        self.max_skew = MAX_SKEW_DEFAULT
+        self.running = False
+        self.left = None    # (timestamp, tip positions)
+        self.right = None
+        self.last = None
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+
+    def set_calibration(self, cal):
+        self.cal = cal
+
+    def set_transform(self, transform):
+        self.transform = transform
+
+    def set_max_skew(self, max_skew):
+        self.max_skew = max_skew
+
+    def start_running(self):
+        self.left = self.right = None
+        # a new deque, not clear(): the tracker thread may be summarizing the old one
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.running = True
+
+    def stop_running(self):
+        self.running = False
+
+    def update_left(self, tip_positions, timestamp):
+        self.left = (timestamp, tip_positions)
+        self.process()
+
+    def update_right(self, tip_positions, timestamp):
+        self.right = (timestamp, tip_positions)
+        self.process()
+
+    def process(self):
+        if not (self.running and self.cal is not None):
+            return
+        if (self.left is None) or (self.right is None):
+            return
+        (tl, lpts), (tr, rpts) = self.left, self.right
+        skew = abs(tl - tr)
+        if skew > self.max_skew:
+            # wait for the lagging side to catch up
+            return
+        self.left = self.right = None
+        matches = self.cal.match_stereo(lpts, rpts)
+        if not matches:
+            return
+        i, j, epi_dist = min(matches, key=lambda m: m[2])
+        lcorr, rcorr = tuple(lpts[i]), tuple(rpts[j])
+        obj_points, obj_cov = self.cal.triangulate_many([lcorr], [rcorr], return_cov=True)
+        obj_point = obj_points[0]
+        if self.transform is not None:
+            point = self.transform.map(obj_point)
+            cs = self.transform.to_cs
+        else:
+            point = obj_point
+            cs = self.cal.cs
+        t = time.time()
+        latency = t - min(tl, tr)   # end to end: tl, tr are frame capture times
+        # summarized here, in the tracker thread (the only one appending)
+        latencies = self.latencies
+        latencies.append(latency)
+        lat = np.array(latencies)
+        self.last = {
+            'timestamp': t,
+            'timestamp_left': tl,
+            'timestamp_right': tr,
+            'skew': skew,
+            'latency': latency,
+            'latency_mean': float(np.mean(lat)),    # over the recent history
+            'latency_max': float(np.max(lat)),
+            'lcorr': lcorr,
+            'rcorr': rcorr,
+            'epipolar_distance': epi_dist,
+            'obj_point': np.array(obj_point),
+            'obj_cov': obj_cov[0],      # for 1 px image noise
+            'point': np.array(point),
+            'cs': cs,
+        }
+        self.tracked.emit(self.last)
+
+
+class TrackingTool(QWidget):
+
+    msg_posted = pyqtSignal(str)
+
+    def __init__(self, model):
+        QWidget.__init__(self)
+        self.model = model
+        self.tracker = model.tracker
+
+        self.cal_label = QLabel('Calibration:')
+        self.cal_label.setAlignment(Qt.AlignCenter)
+        self.cal_dropdown = QComboBox()
+        for name, cal in self.model.calibrations.items():
+            if hasattr(cal, 'match_stereo'):
+                self.cal_dropdown.addItem(name)
+        self.cal_dropdown.activated.connect(self.handle_cal_selected)
+
+        self.transform_label = QLabel('Transform:')
+        self.transform_label.setAlignment(Qt.AlignCenter)
+        self.transform_dropdown = QComboBox()
+        self.transform_dropdown.addItem('(none)')
+        for t in self.model.transforms.keys():
+            self.transform_dropdown.addItem(t)
+        self.transform_dropdown.activated.connect(self.handle_transform_selected)
+
+        self.skew_label = QLabel('Max Skew (ms):')
+        self.skew_label.setAlignment(Qt.AlignCenter)
+        self.skew_spin = QDoubleSpinBox()
+        self.skew_spin.setMinimum(1.)
+        self.skew_spin.setMaximum(2000.)
+        self.skew_spin.setValue(self.tracker.max_skew * 1000.)
+        self.skew_spin.valueChanged.connect(lambda v: self.tracker.set_max_skew(v / 1000.))
+
+        self.fuse_check = QCheckBox('Fuse with stage:')
+        self.fuse_check.setToolTip('Filter the tip position using stage telemetry '
+                                    '(requires a camera-to-probe transform)')
+        self.fuse_check.stateChanged.connect(self.handle_fuse)
+        self.stage_dropdown = StageDropdown(self.model)
+        self.stage_dropdown.activated.connect(self.handle_stage_selected)
+
+        self.drift_check = QCheckBox('Monitor drift')
+        self.drift_check.setToolTip('Compare the tracked tip with the stage position while '
+                                    'the stage is at rest (requires a transform and a stage)')
+        self.drift_check.stateChanged.connect(self.handle_drift)
+        self.refit_check = QCheckBox('Refit transform')
+        self.refit_check.setToolTip('Estimate a correction of the transform online '
+                                    '(recursive least squares)')
+        self.refit_check.stateChanged.connect(self.handle_refit)
+        self.refit_button = QPushButton('Save Refit')
+        self.refit_button.setEnabled(False)
+        self.refit_button.clicked.connect(self.save_refit)
+
+        self.start_stop_button = QPushButton('Start')
+        self.start_stop_button.clicked.connect(self.start_stop)
+
+        self.point_label = QLabel('(tip position)')
+        self.point_label.setAlignment(Qt.AlignCenter)
+        self.point_label.setFont(FONT_BOLD)
+        self.point_label.setToolTip('Drag to copy the current tip position')
+        self.info_label = QLabel('')
+        self.info_label.setAlignment(Qt.AlignCenter)
+        self.estimate_label = QLabel('')
+        self.estimate_label.setAlignment(Qt.AlignCenter)
+        self.drift_label = QLabel('')
+        self.drift_label.setAlignment(Qt.AlignCenter)
+
+        layout = QGridLayout()
+        layout.addWidget(self.cal_label, 0,0, 1,1)
+        layout.addWidget(self.cal_dropdown, 0,1, 1,1)
+        layout.addWidget(self.transform_label, 1,0, 1,1)
+        layout.addWidget(self.transform_dropdown, 1,1, 1,1)
+        layout.addWidget(self.skew_label, 2,0, 1,1)
+        layout.addWidget(self.skew_spin, 2,1, 1,1)
+        layout.addWidget(self.fuse_check, 3,0, 1,1)
+        layout.addWidget(self.stage_dropdown, 3,1, 1,1)
+        layout.addWidget(self.drift_check, 4,0, 1,1)
+        layout.addWidget(self.refit_check, 4,1, 1,1)
+        layout.addWidget(self.start_stop_button, 5,0, 1,2)
+        layout.addWidget(self.point_label, 6,0, 1,2)
+        layout.addWidget(self.info_label, 7,0, 1,2)
+        layout.addWidget(self.estimate_label, 8,0, 1,2)
+        layout.addWidget(self.drift_label, 9,0, 1,2)
+        layout.addWidget(self.refit_button, 10,0, 1,2)
+        self.setLayout(layout)
+        self.setWindowTitle('Tip Tracking')
+        self.setWindowIcon(QIcon(get_image_file('sextant.png')))
+        self.setMinimumWidth(400)
+
+        self.tracker.tracked.connect(self.handle_tracked)
+        self.model.estimator.estimated.connect(self.handle_estimated)
+        self.model.drift.updated.connect(self.handle_drift_updated)
+        self.dragHold = False
+        self.point = None
+
+        if self.tracker.running:
+            self.start_stop_button.setText('Stop')
+
+    def handle_cal_selected(self):
+        cal_name = self.cal_dropdown.currentText()
+        if cal_name:
+            self.tracker.set_calibration(self.model.calibrations[cal_name])
+
+    def handle_transform_selected(self):
+        if self.transform_dropdown.currentIndex() > 0:
+            transform_name = self.transform_dropdown.currentText()
+            transform = self.model.transforms[transform_name]
+        else:
+            transform = None
+        self.tracker.set_transform(transform)
+        self.model.estimator.set_transform(transform)
+        self.model.drift.set_transform(transform)
+
+    def handle_stage_selected(self):
+        if self.stage_dropdown.is_selected():
+            telemetry = self.model.get_telemetry(self.stage_dropdown.get_current_stage())
+            self.model.estimator.set_telemetry(telemetry)
+            self.model.drift.set_telemetry(telemetry)
+
+    def handle_drift(self):
+        if self.drift_check.isChecked() and self.tracker.running:
+            if self.tracker.transform is None:
+                self.msg_posted.emit('Tracking: drift monitoring requires a transform.')
+            if not self.stage_dropdown.is_selected():
+                self.msg_posted.emit('Tracking: drift monitoring requires a stage.')
+            self.handle_stage_selected()
+            self.model.drift.start_monitoring()
+        else:
+            self.model.drift.stop_monitoring()
+            self.drift_label.setText('')
+
+    def handle_refit(self):
+        self.model.drift.set_refit(self.refit_check.isChecked())
+        self.refit_button.setEnabled(self.refit_check.isChecked())
+
+    def save_refit(self):
+        transform = self.model.drift.get_refit_transform()
+        if transform is None:
+            self.msg_posted.emit('Tracking: no refit available (needs a rigid transform, '
+                                    'and samples spread over the workspace).')
+            return
+        self.model.add_transform(transform)
+        self.msg_posted.emit('Refit transform added: %s' % transform.name)
+
+    def handle_fuse(self):
+        if self.fuse_check.isChecked() and self.tracker.running:
+            if self.tracker.transform is None:
+                self.msg_posted.emit('Tracking: stage fusion requires a transform.')
+            self.handle_stage_selected()
+            self.model.estimator.start_estimating()
+        else:
+            self.model.estimator.stop_estimating()
+            self.estimate_label.setText('')
+
+    def start_stop(self):
+        if self.start_stop_button.text() == 'Start':
+            if self.cal_dropdown.currentIndex() < 0:
+                self.msg_posted.emit('Tracking: no calibration selected.')
+                return
+            self.handle_cal_selected()
+            self.handle_transform_selected()
+            self.tracker.start_running()
+            self.handle_fuse()
+            self.handle_drift()
+            self.start_stop_button.setText('Stop')
+            self.msg_posted.emit('Tip tracking started.')
+        else:
+            self.tracker.stop_running()
+            self.model.estimator.stop_estimating()
+            self.model.drift.stop_monitoring()
+            self.start_stop_button.setText('Start')
+            self.msg_posted.emit('Tip tracking stopped.')
+
+    def handle_tracked(self, record):
+        if not self.fuse_check.isChecked():
+            self.point = record['point']
+        x, y, z = record['point']
+        self.point_label.setText('[{0:.2f}, {1:.2f}, {2:.2f}] ({3})'.format(x, y, z, record['cs']))
+        self.info_label.setText('latency %.0f ms (mean %.0f, max %.0f), skew %.0f ms, '
+                                'epipolar %.1f px' % (record['latency']*1000,
+                                record['latency_mean']*1000, record['latency_max']*1000,
+                                record['skew']*1000, record['epipolar_distance']))
+
+    def handle_estimated(self, estimate):
+        if not self.fuse_check.isChecked():
+            return
+        self.point = estimate['point']
+        x, y, z = self.point
+        sx, sy, sz = estimate['sigma']
+        self.estimate_label.setText('filtered: [{0:.2f}, {1:.2f}, {2:.2f}] '
+                                    '+/- [{3:.1f}, {4:.1f}, {5:.1f}] ({6} rejected)'.format(
+                                    x, y, z, sx, sy, sz, estimate['nrejected']))
+
+    def handle_drift_updated(self, state):
+        if not self.drift_check.isChecked():
+            return
+        bx, by, bz = state['bias']
+        self.drift_label.setText('drift: bias [{0:.1f}, {1:.1f}, {2:.1f}], RMS {3:.1f} um '
+                                    '({4} samples)'.format(bx, by, bz, state['rms'], state['n']))
+
+    def mousePressEvent(self, e):
+        self.dragHold = True
+
+    def mouseReleaseEvent(self, e):
+        self.dragHold = False
+
+    def mouseMoveEvent(self, e):
+        if self.dragHold:
+            self.dragHold = False
+            if self.point is not None:
+                x, y, z = self.point
+                md = QMimeData()
+                md.setText('%.6f,%.6f,%.6f' % (x, y, z))
+                drag = QDrag(self)
+                drag.setMimeData(md)
+                drag.exec()
+
+    def closeEvent(self, ev):
+        self.tracker.tracked.disconnect(self.handle_tracked)
+        self.model.estimator.estimated.disconnect(self.handle_estimated)
+        self.model.drift.updated.disconnect(self.handle_drift_updated)
+        super().closeEvent(ev)
@@ -11,7 +11,6 @@ import os
 import csv
 import re
 import cv2
-import sleap
 import time
 import datetime
 
@@ -19,8 +18,15 @@ from .screen_widget import ScreenWidget
 from . import get_image_file, training_dir
 from .helper import WF, HF, FONT_BOLD
 
-SKELETON = sleap.skeleton.Skeleton('probeTip')
-SKELETON.add_node('tip')
+
+def get_skeleton():
+    # sleap (and tensorflow) are imported on demand; they are heavy and
+    # not needed unless we're generating labels or training
+    import sleap
+    skeleton = sleap.skeleton.Skeleton('probeTip')
+    skeleton.add_node('tip')
+    return skeleton
+
 
 class TrainingTool(QWidget):
 
@@ -254,6 +260,8 @@ class LabelsTab(QWidget):
         codec = cv2.VideoWriter.fourcc('X','V','I','D')
         writer = cv2.VideoWriter(filename_vid, codec, 20, (WF,HF))
         # label stuff
+        import sleap
+        skeleton = get_skeleton()
         labeled_frames = []
         frame_idx = 0
         video = sleap.io.video.Video(sleap.io.video.MediaVideo(filename_vid))
@@ -273,7 +281,7 @@ class LabelsTab(QWidget):
                 writer.write(frame)
                 # collect labeled frame
                 points = {'tip' : sleap.instance.Point(x=item.ipt[0], y=item.ipt[1])}
-                instance = sleap.instance.Instance(skeleton=SKELETON, points=points)
+                instance = sleap.instance.Instance(skeleton=skeleton, points=points)
                 labeled_frames.append(sleap.instance.LabeledFrame(video, frame_idx, [instance]))
                 frame_idx += 1
         progress.setValue(count)
@@ -388,6 +396,7 @@ class TrainingTab(QWidget):
             self.filename_lab = filename_lab
 
     def start(self):
+        import sleap
         if self.centroid_check.isChecked():
             cfg_centroid = self.get_config_centroid()
             trainer_centroid = sleap.nn.training.Trainer.from_config(cfg_centroid)
@@ -402,10 +411,11 @@ class TrainingTab(QWidget):
             trainer_instance.train()
 
     def get_config_centroid(self):
+        import sleap
         cfg = sleap.nn.config.TrainingJobConfig()
         # data
         cfg.data.labels.training_labels = self.filename_lab
-        cfg.data.labels.skeletons = [SKELETON]
+        cfg.data.labels.skeletons = [get_skeleton()]
         cfg.data.preprocessing.ensure_rbg = True
         #cfg.data.preprocessing.input_scaling = 0.01
         cfg.data.preprocessing.input_scaling = 0.25
@@ -453,11 +463,12 @@ class TrainingTab(QWidget):
         return cfg
 
     def get_config_instance(self):
+        import sleap
         cfg = sleap.nn.config.TrainingJobConfig()
         # data
         cfg.data.labels.training_labels = self.filename_lab
         cfg.data.labels.validation_fraction = 0.2
-        cfg.data.labels.skeletons = [SKELETON]
+        cfg.data.labels.skeletons = [get_skeleton()]
         cfg.data.preprocessing.ensure_rbg = True
         cfg.data.preprocessing.input_scaling = 1.0
         cfg.data.preprocessing.pad_to_stride = 1
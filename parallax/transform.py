@@ -2,12 +2,20 @@ import coorx
 import numpy as np
 from scipy.optimize import leastsq
 
+from . import lib
+
+
+RANSAC_THRESHOLD = 25.  # um
+
+
 class Transform:
 
     """
     Base case for coordinate transforms
     """
 
+    inliers = None  # set by compute_from_correspondence_ransac
+
     def __init__(self, name, from_cs, to_cs):
         self.name = name
         self.from_cs = from_cs
@@ -20,6 +28,27 @@ class Transform:
     def compute_from_correspondence(self, from_points, to_points):
         raise NotImplementedError
 
+    def compute_from_correspondence_ransac(self, from_points, to_points,
+                                            threshold=RANSAC_THRESHOLD, recurse=True):
+        """
+        Reject outlier correspondences (RANSAC over rigid hypotheses), then fit
+        on the inliers. self.inliers flags each input point.
+        """
+        from_points = np.asarray(from_points)
+        to_points = np.asarray(to_points)
+        if len(from_points) > 3:
+            _, _, self.inliers = lib.ransac_rigid(from_points, to_points, threshold)
+        else:
+            self.inliers = np.ones(len(from_points), dtype=bool)
+        self.compute_from_correspondence(from_points[self.inliers], to_points[self.inliers],
+                                            recurse=recurse)
+
+    def get_outliers(self):
+        # indices of the rejected correspondences
+        if self.inliers is None:
+            return []
+        return [int(i) for i in np.flatnonzero(~self.inliers)]
+
     def compute_rmse(self):
         if all(a is not None for a in (self.from_points, self.to_points)):
             npts = self.from_points.shape[0]
@@ -15,6 +15,7 @@ from .helper import FONT_BOLD
 from .rigid_body_transform_tool import RigidBodyTransformTool, PointTransformWidget
 from .calibration import Calibration
 from .calibration_worker import CalibrationWorker
+from . import store
 
 
 class TransformPanel(QFrame):
@@ -75,22 +76,25 @@ class TransformPanel(QFrame):
             name_selected = self.combo.currentText()
             tf_selected = self.model.transforms[name_selected]
 
-        suggested_filename = os.path.join(data_dir, 'transform_' + name_selected + '.pkl')
+        suggested_filename = os.path.join(data_dir, 'transform_' + name_selected + '.npz')
         filename = QFileDialog.getSaveFileName(self, 'Save transform file',
                                                 suggested_filename,
-                                                'Pickle files (*.pkl)')[0]
+                                                'Transform files (*.npz)')[0]
         if filename:
-            with open(filename, 'wb') as f:
-                pickle.dump(tf_selected, f)
+            try:
+                store.save(tf_selected, filename)
+            except TypeError:
+                # coorx-based transforms have no store schema; store.load reads pickles too
+                with open(filename, 'wb') as f:
+                    pickle.dump(tf_selected, f)
             self.msg_posted.emit('Saved transform %s to: %s' % (name_selected, filename))
 
     def load_transform(self):
         filenames = QFileDialog.getOpenFileNames(self, 'Load transform file', data_dir,
-                                                    'Pickle files (*.pkl)')[0]
+                                                    'Transform files (*.npz *.pkl)')[0]
         for filename in filenames:
-            with open(filename, 'rb') as f:
-                transform = pickle.load(f)
-                self.model.add_transform(transform)
+            transform = store.load(filename)
+            self.model.add_transform(transform)
         self.update_transforms()
 
     def update_transforms(self):
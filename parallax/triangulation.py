@@ -0,0 +1,101 @@
+"""
+Two-view triangulation methods, vectorized over N points.
+
+All methods take projection matrices P1, P2 (3,4) and undistorted image
+points (N,2) in the same units, and return object points (N,3).
+
+    linear      DLT (cv2.triangulatePoints); fastest for single points
+    midpoint    midpoint of the closest approach of the two rays; fastest
+                for large batches
+    optimal     Hartley-Sturm: correct the matches to satisfy the epipolar
+                constraint (minimal image displacement), then triangulate
+    iterative   Gauss-Newton minimization of the reprojection error,
+                starting from the linear solution; most accurate
+"""
+
+import numpy as np
+import cv2
+
+from . import lib
+
+
+NITER = 3   # Gauss-Newton iterations for the iterative method
+
+
+def linear(P1, P2, pts1, pts2):
+    return lib.triangulate_points(P1, P2, pts1, pts2)
+
+def camera_center(P):
+    return -np.linalg.solve(P[:,:3], P[:,3])
+
+def midpoint(P1, P2, pts1, pts2):
+    P1 = np.asarray(P1, dtype=np.float64)
+    P2 = np.asarray(P2, dtype=np.float64)
+    pts1 = np.asarray(pts1, dtype=np.float64).reshape((-1,2))
+    pts2 = np.asarray(pts2, dtype=np.float64).reshape((-1,2))
+    C1, C2 = camera_center(P1), camera_center(P2)
+    # ray directions
+    d1 = np.linalg.solve(P1[:,:3], np.concatenate((pts1, np.ones((len(pts1),1))), axis=1).T).T
+    d2 = np.linalg.solve(P2[:,:3], np.concatenate((pts2, np.ones((len(pts2),1))), axis=1).T).T
+    w0 = C1 - C2
+    a = np.sum(d1*d1, axis=1)
+    b = np.sum(d1*d2, axis=1)
+    c = np.sum(d2*d2, axis=1)
+    d = d1 @ w0
+    e = d2 @ w0
+    denom = a*c - b*b
+    s = (b*e - c*d) / denom
+    t = (a*e - b*d) / denom
+    return (C1 + s[:,None]*d1 + C2 + t[:,None]*d2) / 2.
+
+def fundamental_matrix(P1, P2):
+    # F such that x2^T F x1 = 0, from the projection matrices
+    C1 = np.append(camera_center(np.asarray(P1, dtype=np.float64)), 1.)
+    e2 = np.asarray(P2, dtype=np.float64) @ C1
+    F = lib.skew(e2) @ P2 @ np.linalg.pinv(P1)
+    return F / np.linalg.norm(F)
+
+def optimal(P1, P2, pts1, pts2):
+    pts1 = np.asarray(pts1, dtype=np.float64).reshape((1,-1,2))
+    pts2 = np.asarray(pts2, dtype=np.float64).reshape((1,-1,2))
+    pts1, pts2 = cv2.correctMatches(fundamental_matrix(P1, P2), pts1, pts2)
+    return lib.triangulate_points(P1, P2, pts1, pts2)
+
+def refine(Ps, img_points, points, niter=NITER):
+    """
+    Gauss-Newton refinement of object points (N,3) to minimize the
+    reprojection error in any number of views: Ps (ncam,3,4), img_points
+    (ncam,N,2), NaN for missing views.
+    """
+    x = np.asarray(img_points, dtype=np.float64)
+    valid = np.all(np.isfinite(x), axis=-1)[...,None]
+    x = np.where(valid, x, 0.)
+    X = np.array(points, dtype=np.float64).reshape((-1,3))
+    for i in range(niter):
+        proj, J = lib.projection_jacobians(Ps, X)
+        r = np.where(valid, proj - x, 0.)
+        J = np.where(valid[...,None], J, 0.)
+        H = np.einsum('cnki,cnkj->nij', J, J)
+        g = np.einsum('cnki,cnk->ni', J, r)
+        ok = np.all(np.isfinite(g), axis=1) & (np.abs(np.linalg.det(H)) > 0)
+        X[ok] -= np.linalg.solve(H[ok], g[ok][...,None])[...,0]
+    return X
+
+def iterative(P1, P2, pts1, pts2, niter=NITER):
+    pts1 = np.asarray(pts1, dtype=np.float64).reshape((-1,2))
+    pts2 = np.asarray(pts2, dtype=np.float64).reshape((-1,2))
+    X = linear(P1, P2, pts1, pts2)
+    return refine(np.stack((P1, P2)), np.stack((pts1, pts2)), X, niter)
+
+
+METHODS = {
+    'linear': linear,
+    'midpoint': midpoint,
+    'optimal': optimal,
+    'iterative': iterative,
+}
+
+def triangulate(P1, P2, pts1, pts2, method='linear'):
+    if method not in METHODS:
+        raise ValueError('unknown triangulation method: %s' % method)
+    return METHODS[method](P1, P2, pts1, pts2)
@@ -0,0 +1,152 @@
+"""
+Waypoint planning: order a set of stage positions to minimize total travel time.
+
+Travel time between two positions follows how Stage.move_absolute_3d moves:
+all three axes at once (time set by the slowest axis), or, for safe moves
+above z_safe, retract z, move x, move y and descend z one after another.
+Regular grids are visited in serpentine order (the slowest axis changes
+least often); other point sets are ordered nearest-neighbor first, then
+improved with 2-opt.
+"""
+
+import numpy as np
+
+
+DEFAULT_SPEEDS = (1., 1., 1.)   # only the ratios matter for ordering
+MAX_PASSES_2OPT = 50
+
+
+def get_speeds(stage):
+    # per-axis speeds (x, y, z) of a stage, or the default if not available
+    speeds = np.asarray(stage.get_speed(), dtype=np.float64)
+    if (speeds.shape != (3,)) or np.any(~(speeds > 0)):
+        return np.array(DEFAULT_SPEEDS)
+    return speeds
+
+def travel_times(points1, points2, speeds=DEFAULT_SPEEDS, z_safe=None):
+    """
+    Matrix (N1,N2) of move times between positions (same units as the speeds).
+    If z_safe is given, moves starting or ending above it are safe moves.
+    """
+    p1 = np.asarray(points1, dtype=np.float64).reshape((-1,1,3))
+    p2 = np.asarray(points2, dtype=np.float64).reshape((1,-1,3))
+    v = np.asarray(speeds, dtype=np.float64)
+    t = np.abs(p2 - p1) / v
+    times = np.max(t, axis=2)
+    if z_safe is not None:
+        safe = (p1[...,2] > z_safe) | (p2[...,2] > z_safe)
+        t_safe = (np.abs(p1[...,2] - z_safe) + np.abs(p2[...,2] - z_safe)) / v[2] + \
+                    t[...,0] + t[...,1]
+        times = np.where(safe, t_safe, times)
+    return times
+
+def route_time(points, order, start=None, speeds=DEFAULT_SPEEDS, z_safe=None):
+    # total travel time visiting points in order (from start, if given)
+    route = np.asarray(points, dtype=np.float64)[order]
+    if start is not None:
+        route = np.concatenate((np.reshape(start, (1,3)), route))
+    p1, p2 = route[:-1], route[1:]
+    return float(np.sum(np.diagonal(travel_times(p1, p2, speeds, z_safe))))
+
+def lattice_indices(points):
+    # per-axis indices (N,3) and sizes if the points form a full regular grid, else None
+    points = np.asarray(points, dtype=np.float64)
+    values, indices = [], []
+    for k in range(3):
+        u, inv = np.unique(points[:,k], return_inverse=True)
+        values.append(u)
+        indices.append(inv)
+    sizes = [len(u) for u in values]
+    indices = np.stack(indices, axis=1)
+    if (np.prod(sizes) != len(points)) or \
+            (len(np.unique(indices, axis=0)) != len(points)):
+        return None, None
+    return indices, sizes
+
+def serpentine_order(points, start=None, speeds=DEFAULT_SPEEDS, z_safe=None):
+    """
+    Boustrophedon order for a full regular grid: the slowest axis is the outer
+    loop and each inner pass reverses direction, so consecutive points differ
+    along one axis only. Of the 8 possible starting corners, the one giving
+    the shortest route from start is used. Returns None if not a grid.
+    """
+    indices, sizes = lattice_indices(points)
+    if indices is None:
+        return None
+    axes = np.argsort(speeds, kind='stable')    # outer (slowest) to inner
+    best, best_time = None, np.inf
+    for flips in range(8):
+        idx = indices.copy()
+        for k in range(3):
+            if flips & (1 << k):
+                idx[:,k] = sizes[k] - 1 - idx[:,k]
+        # reflected mixed-radix Gray code: reverse a level when the sum of
+        # the outer digits is odd
+        keys = []
+        outer = np.zeros(len(points), dtype=int)
+        for k in axes:
+            keys.append(np.where(outer % 2, sizes[k] - 1 - idx[:,k], idx[:,k]))
+            outer += idx[:,k]
+        order = np.lexsort(keys[::-1])
+        t = route_time(points, order, start, speeds, z_safe)
+        if t < best_time:
+            best, best_time = order, t
+    return best
+
+def nearest_neighbor_order(times, first=0):
+    # greedy open route through a (N,N) time matrix, starting at first
+    n = len(times)
+    visited = np.zeros(n, dtype=bool)
+    order = [first]
+    visited[first] = True
+    for i in range(1, n):
+        t = np.where(visited, np.inf, times[order[-1]])
+        j = int(np.argmin(t))
+        order.append(j)
+        visited[j] = True
+    return np.array(order)
+
+def two_opt(order, times, max_passes=MAX_PASSES_2OPT):
+    """
+    2-opt improvement of an open route (the first node stays first): reverse
+    segments while that shortens the route. times must be symmetric.
+    """
+    route = np.array(order)
+    n = len(route)
+    for npass in range(max_passes):
+        improved = False
+        for i in range(1, n-1):
+            a, b = route[i-1], route[i]
+            c = route[i+1:]     # candidate segment ends, j = i+1..n-1
+            e = np.append(route[i+2:], -1)
+            d_ce = np.where(e >= 0, times[c, e], 0.)
+            d_be = np.where(e >= 0, times[b, e], 0.)
+            delta = times[a, c] + d_be - times[a, b] - d_ce
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                j += i + 1
+                route[i:j+1] = route[i:j+1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route
+
+def plan_order(points, start=None, speeds=DEFAULT_SPEEDS, z_safe=None):
+    """
+    Visiting order (indices) of points (N,3) minimizing total travel time,
+    optionally from a start position (e.g. the current stage position).
+    """
+    points = np.asarray(points, dtype=np.float64).reshape((-1,3))
+    if len(points) < 2:
+        return np.arange(len(points))
+    order = serpentine_order(points, start, speeds, z_safe)
+    if order is not None:
+        return order
+    nodes = points if start is None else np.concatenate((np.reshape(start, (1,3)), points))
+    times = travel_times(nodes, nodes, speeds, z_safe)
+    if start is None:
+        # open route: start from the point nearest a corner of the set
+        first = int(np.argmin(np.sum((points - points.min(axis=0))**2, axis=1)))
+        return two_opt(nearest_neighbor_order(times, first), times)
+    route = two_opt(nearest_neighbor_order(times, 0), times)
+    return route[1:] - 1
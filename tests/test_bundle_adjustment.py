@@ -0,0 +1,78 @@
+import numpy as np
+import cv2
+
+from parallax import bundle_adjustment as ba
+
+
+MTX1 = np.array([[15000., 0., 2000.], [0., 15000., 1500.], [0., 0., 1.]])
+MTX2 = np.array([[15200., 0., 1980.], [0., 15100., 1520.], [0., 0., 1.]])
+DIST1 = np.array([[-0.05, 0.1, 0., 0., 0.]])
+DIST2 = np.array([[0.03, -0.05, 0., 0., 0.]])
+
+
+def checkerboard_stereo(npose=3, grid=9, noise=0.2, seed=0):
+    # synthetic checkerboard seen by a stereo pair ~10 cm away
+    rng = np.random.default_rng(seed)
+    g = (np.arange(grid) - (grid - 1) / 2.) * 500.
+    X, Y = np.meshgrid(g, g)
+    obj = np.stack((X.ravel(), Y.ravel(), np.zeros(X.size)), axis=1)
+    R12 = cv2.Rodrigues(np.array([0., 0.35, 0.02]))[0]
+    T12 = np.array([-40000., 0., 5000.])
+    rvecs, tvecs, img1, img2 = [], [], [], []
+    for i in range(npose):
+        r = rng.normal(0, 0.3, 3)
+        t = np.array([rng.normal(0, 1000), rng.normal(0, 1000), 100000 + rng.normal(0, 5000)])
+        R2 = R12 @ cv2.Rodrigues(r)[0]
+        p1 = cv2.projectPoints(obj, r, t, MTX1, DIST1)[0][:,0]
+        p2 = cv2.projectPoints(obj, cv2.Rodrigues(R2)[0], R12 @ t + T12, MTX2, DIST2)[0][:,0]
+        rvecs.append(r)
+        tvecs.append(t)
+        img1.append(p1 + rng.normal(0, noise, p1.shape))
+        img2.append(p2 + rng.normal(0, noise, p2.shape))
+    objs = np.repeat(obj[None], npose, axis=0)
+    return objs, np.array(img1), np.array(img2), np.array(rvecs), np.array(tvecs), (R12, T12)
+
+def test_rotation_vectors_round_trip():
+    rng = np.random.default_rng(0)
+    axes = rng.normal(0, 1, (6,3))
+    axes /= np.linalg.norm(axes, axis=1)[:,None]
+    # small, generic, and close to (and at) pi, where the antisymmetric part vanishes
+    angles = np.array([1e-9, 0.5, 2.0, np.pi - 1e-6, np.pi - 1e-9, np.pi])
+    rvecs = axes * angles[:,None]
+    R = ba.rodrigues(rvecs)
+    np.testing.assert_allclose(ba.rodrigues(ba.rotation_vectors(R)), R, atol=1e-9)
+    np.testing.assert_allclose(ba.rotation_vectors(R)[:4], rvecs[:4], atol=1e-8)
+    for r, r0 in zip(ba.rotation_vectors(R), rvecs):
+        np.testing.assert_allclose(cv2.Rodrigues(r)[0], cv2.Rodrigues(r0)[0], atol=1e-8)
+
+def test_project_matches_opencv():
+    objs, img1, img2, rvecs, tvecs, rig = checkerboard_stereo(noise=0.)
+    intr = ba.intrinsics_vector(MTX1, DIST1)
+    proj = ba.project(objs, ba.rodrigues(rvecs), tvecs, intr)
+    np.testing.assert_allclose(proj, img1, atol=1e-6)
+
+def test_solve_reaches_noise_level():
+    objs, img1, img2, rvecs, tvecs, (R12, T12) = checkerboard_stereo(noise=0.2)
+    # start from perturbed intrinsics (no distortion) and rig
+    intr1 = ba.intrinsics_vector(MTX1 * [[1.02], [1.02], [1]], np.zeros(5))
+    intr2 = ba.intrinsics_vector(MTX2 * [[0.98], [0.98], [1]], np.zeros(5))
+    R0 = cv2.Rodrigues(np.array([0., 0.34, 0.025]))[0]
+    adjust = ba.BundleAdjustment(objs, img1, img2, intr1, intr2, rvecs, tvecs,
+                                    rig=(R0, T12 + [300., -200., 100.]))
+    refined = adjust.solve()
+    assert refined['success']
+    assert refined['cost'] < 1e-3 * refined['initial_cost']
+    # 0.2 px per coordinate
+    assert refined['rmse_reproj_1'] < 0.35 and refined['rmse_reproj_2'] < 0.35
+
+def test_solve_recovers_rig():
+    objs, img1, img2, rvecs, tvecs, (R12, T12) = checkerboard_stereo(noise=0.2)
+    intr1 = ba.intrinsics_vector(MTX1, DIST1)
+    intr2 = ba.intrinsics_vector(MTX2, DIST2)
+    R0 = cv2.Rodrigues(np.array([0., 0.34, 0.025]))[0]
+    adjust = ba.BundleAdjustment(objs, img1, img2, intr1, intr2, rvecs, tvecs,
+                                    rig=(R0, T12 + [300., -200., 100.]), fix_intrinsics=True)
+    refined = adjust.solve()
+    assert refined['success']
+    np.testing.assert_allclose(refined['R'], R12, atol=1e-3)
+    np.testing.assert_allclose(refined['T'].ravel(), T12, atol=100.)
@@ -0,0 +1,103 @@
+import numpy as np
+import cv2
+
+from parallax import drift
+from parallax.drift import DriftMonitor, DriftMonitorWorker
+from parallax.transform import TransformNP
+
+
+def rigid(name, rvec, ori):
+    transform = TransformNP(name, 'cal', 'stage')
+    transform.set_from_rot_ori(cv2.Rodrigues(np.array(rvec, dtype=np.float64))[0],
+                                np.array(ori, dtype=np.float64))
+    return transform
+
+def test_bias_and_rms():
+    rng = np.random.default_rng(0)
+    monitor = DriftMonitor()
+    offset = np.array([5., -3., 0.])
+    for i in range(2000):
+        point = rng.uniform(0, 15000, 3)
+        noise = rng.normal(0, 2., 3)
+        r = monitor.update(point, point + offset + noise)
+        np.testing.assert_allclose(r, offset + noise)
+    np.testing.assert_allclose(monitor.get_bias(), offset, atol=1.)
+    assert abs(monitor.get_rms() - np.sqrt(34. + 12.)) < 1.
+
+def test_forgetting():
+    # the statistics follow a step in the offset within a few half lives
+    monitor = DriftMonitor(half_life=50)
+    for i in range(500):
+        monitor.update(np.zeros(3), np.zeros(3))
+    for i in range(250):
+        monitor.update(np.zeros(3), [30., 0., 0.])
+    assert monitor.n == 750
+    np.testing.assert_allclose(monitor.get_bias(), [30., 0., 0.], atol=1.)
+    monitor.reset()
+    assert monitor.n == 0 and monitor.get_rms() == 0.
+
+def test_refit_recovers_correction():
+    rng = np.random.default_rng(1)
+    true = rigid('true', [0.1, -0.2, 0.3], [100., 200., -300.])
+    # calibrated transform, off by a small rotation and translation
+    cal = rigid('cal', [0.1, -0.2, 0.302], [120., 190., -300.])
+    monitor = DriftMonitor(refit=True)
+    for i in range(300):
+        obj = rng.uniform(-2000, 2000, 3)
+        monitor.update(cal.map(obj), true.map(obj) + rng.normal(0, 1., 3))
+    assert monitor.is_excited()
+    refit = monitor.get_refit_transform(cal)
+    assert isinstance(refit, TransformNP) and refit.name == 'cal-refit'
+    obj = rng.uniform(-2000, 2000, (20,3))
+    before = np.linalg.norm(cal.map(obj) - true.map(obj), axis=1)
+    after = np.linalg.norm(refit.map(obj) - true.map(obj), axis=1)
+    assert before.max() > 20.
+    assert after.max() < 2.
+
+def test_parked_probe_does_not_refit():
+    # samples at one position don't determine the rotation
+    cal = rigid('cal', [0., 0., 0.], [0., 0., 0.])
+    monitor = DriftMonitor(refit=True)
+    for i in range(300):
+        monitor.update([7500., 7500., 7500.], [7510., 7500., 7500.])
+    assert not monitor.is_excited()
+    assert monitor.get_refit_transform(cal) is None
+    assert DriftMonitor().get_refit_transform(cal) is None
+
+class Telemetry:
+    # stage at rest at a fixed position, known up to time t_max
+    def __init__(self, position, t_max):
+        self.position = np.asarray(position, dtype=np.float64)
+        self.t_max = t_max
+    def lookup(self, t):
+        if t > self.t_max:
+            return None, False
+        return self.position, False
+
+def test_worker_alerts():
+    worker = DriftMonitorWorker()
+    identity = rigid('cal', [0., 0., 0.], [0., 0., 0.])
+    telemetry = Telemetry([7500., 7500., 7500.], t_max=1000.)
+    worker.set_transform(identity)
+    worker.set_telemetry(telemetry)
+    alerts, updates = [], []
+    worker.alert.connect(alerts.append)
+    worker.updated.connect(updates.append)
+    worker.start_monitoring()
+    def track(t, point):
+        worker.handle_tracked({'timestamp_left': t, 'timestamp_right': t,
+                                'obj_point': np.asarray(point, dtype=np.float64)})
+    # the tip is 50 um off: an alert once there are enough samples
+    for i in range(drift.MIN_SAMPLES):
+        track(i, [7550., 7500., 7500.])
+    assert len(updates) == drift.MIN_SAMPLES
+    assert len(alerts) == 1 and alerts[0].startswith('Drift alert:')
+    # records wait for the telemetry to cover them
+    track(2000., [7550., 7500., 7500.])
+    assert len(updates) == drift.MIN_SAMPLES
+    assert len(worker.pending) == 1
+    # back on target: the alert clears once
+    telemetry.t_max = np.inf
+    for i in range(1000):
+        track(3000. + i, [7500., 7500., 7500.])
+    assert len(alerts) == 2 and 'cleared' in alerts[1]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from parallax import formations
+
+
+@pytest.fixture(autouse=True)
+def formations_dir(tmp_path, monkeypatch):
+    # don't read or write the user's cached formations
+    monkeypatch.setattr(formations, 'FORMATIONS_DIR', str(tmp_path))
+    return tmp_path
+
+def test_generate_on_sphere():
+    origin = np.array([7500., 7500., 7500.])
+    points = formations.generate(10, radius=1000., origin=origin)
+    assert points.shape == (10,3)
+    np.testing.assert_allclose(np.linalg.norm(points - origin, axis=1), 1000.)
+
+def test_generate_is_isotropic():
+    # evenly spread points constrain all rotations (and translations) equally
+    unit = formations.generate(10)
+    std = formations.parameter_std(unit)
+    np.testing.assert_allclose(std[:3], std[0], rtol=0.05)
+    np.testing.assert_allclose(std[3:], std[3], rtol=0.05)
+    assert formations.d_criterion(unit) >= \
+                formations.d_criterion(formations.fibonacci_sphere(10)) - 1e-9
+
+def test_generate_cached(formations_dir):
+    points = formations.generate(9)
+    assert len(list(formations_dir.iterdir())) == 1
+    np.testing.assert_array_equal(formations.generate(9, radius=2., origin=(1,1,1)),
+                                    1. + 2. * points)
+
+def test_generate_within_view(formations_dir):
+    origin = np.array([0., 0., 0.])
+    def visible(points):
+        # a slab narrower than the formation
+        return np.abs(np.asarray(points)[:,2]) < 400.
+    points = formations.generate(12, radius=1000., origin=origin, visible=visible)
+    assert points.shape == (12,3)
+    assert np.all(visible(points))
+    assert np.all(np.linalg.norm(points, axis=1) <= 1000. + 1e-6)
+    # the constrained formation still determines all six parameters
+    assert np.all(np.isfinite(formations.parameter_std(points)))
+    # not cached without a cache_key
+    assert not list(formations_dir.iterdir())
+
+def test_generate_errors():
+    with pytest.raises(ValueError):
+        formations.generate(3)
+    with pytest.raises(ValueError, match='outside the field of view'):
+        formations.generate(8, visible=lambda points: np.zeros(len(points), dtype=bool))
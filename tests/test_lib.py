@@ -0,0 +1,91 @@
+import numpy as np
+import cv2
+
+from parallax import lib
+
+
+def random_rigid(rng):
+    rot = cv2.Rodrigues(rng.normal(0, 1, 3))[0]
+    ori = rng.normal(0, 1000, 3)
+    return rot, ori
+
+def test_rigid_fit_recovers_transform():
+    rng = np.random.default_rng(0)
+    rot, ori = random_rigid(rng)
+    a = rng.uniform(-2000, 2000, (20,3))
+    b = (a + ori) @ rot
+    rot_fit, ori_fit = lib.rigid_fit(a, b)
+    np.testing.assert_allclose(rot_fit, rot, atol=1e-9)
+    np.testing.assert_allclose(ori_fit, ori, atol=1e-6)
+
+def test_rigid_fit_batched():
+    rng = np.random.default_rng(1)
+    a = rng.uniform(-2000, 2000, (5,10,3))
+    transforms = [random_rigid(rng) for i in range(5)]
+    b = np.array([(a[i] + ori) @ rot for i, (rot, ori) in enumerate(transforms)])
+    rot_fit, ori_fit = lib.rigid_fit(a, b)
+    assert rot_fit.shape == (5,3,3) and ori_fit.shape == (5,3)
+    for i, (rot, ori) in enumerate(transforms):
+        np.testing.assert_allclose(rot_fit[i], rot, atol=1e-9)
+        np.testing.assert_allclose(ori_fit[i], ori, atol=1e-6)
+
+def test_rigid_fit_is_a_rotation():
+    # noisy, nearly planar points: the fit must not be a reflection
+    rng = np.random.default_rng(2)
+    a = rng.uniform(-1000, 1000, (8,3))
+    a[:,2] *= 1e-3
+    b = a @ np.diag([1., 1., -1.]) + rng.normal(0, 1, (8,3))
+    rot, ori = lib.rigid_fit(a, b)
+    np.testing.assert_allclose(rot @ rot.T, np.eye(3), atol=1e-9)
+    assert np.linalg.det(rot) > 0
+
+def test_ransac_rigid_rejects_outliers():
+    rng = np.random.default_rng(3)
+    rot, ori = random_rigid(rng)
+    a = rng.uniform(-2000, 2000, (40,3))
+    b = (a + ori) @ rot + rng.normal(0, 1, (40,3))
+    outliers = np.zeros(40, dtype=bool)
+    outliers[rng.choice(40, 10, replace=False)] = True
+    b[outliers] += rng.uniform(100, 500, (10,3)) * rng.choice((-1, 1), (10,3))
+    rot_fit, ori_fit, inliers = lib.ransac_rigid(a, b, threshold=10., seed=0)
+    np.testing.assert_array_equal(inliers, ~outliers)
+    np.testing.assert_allclose(rot_fit, rot, atol=1e-3)
+    np.testing.assert_allclose(ori_fit, ori, atol=2.)
+
+def stereo_projection(obj, rng, noise=0.1):
+    # undistorted image points of obj in two cameras ~10 cm away
+    mtx = np.array([[15000., 0., 2000.], [0., 15000., 1500.], [0., 0., 1.]])
+    img = []
+    for r, t in (((0.1, -0.2, 0.05), (0., 0., 100000.)),
+                    ((0.1, 0.2, 0.05), (-40000., 0., 100000.))):
+        p = cv2.projectPoints(obj, np.array(r), np.array(t), mtx, None)[0][:,0]
+        img.append(p + rng.normal(0, noise, p.shape))
+    return img
+
+def corrupt(img, rng, n):
+    # move n points of the second camera by 20-50 pixels
+    img = img.copy()
+    ix = rng.choice(len(img), n, replace=False)
+    img[ix] += rng.uniform(20, 50, (n,2)) * rng.choice((-1, 1), (n,2))
+    outliers = np.zeros(len(img), dtype=bool)
+    outliers[ix] = True
+    return img, outliers
+
+def test_ransac_projection_stage_grid():
+    rng = np.random.default_rng(4)
+    g = np.linspace(-1000, 1000, 4)
+    obj = np.stack(np.meshgrid(g, g, g, indexing='ij'), axis=-1).reshape((-1,3)) + 7500.
+    img1, img2 = stereo_projection(obj, rng)
+    img2, outliers = corrupt(img2, rng, 8)
+    inliers = lib.ransac_projection(obj, img1, img2, threshold=3., seed=0)
+    np.testing.assert_array_equal(inliers, ~outliers)
+
+def test_ransac_projection_checkerboard():
+    rng = np.random.default_rng(5)
+    g = (np.arange(9) - 4) * 500.
+    X, Y = np.meshgrid(g, g)
+    obj = np.stack((X.ravel(), Y.ravel(), np.zeros(X.size)), axis=1)
+    img1, img2 = stereo_projection(obj, rng)
+    img2, outliers = corrupt(img2, rng, 8)
+    inliers = lib.ransac_projection(obj, img1, img2, threshold=3., seed=0)
+    np.testing.assert_array_equal(inliers, ~outliers)
@@ -0,0 +1,83 @@
+import numpy as np
+import cv2
+
+from parallax import pose_selection
+from parallax.calibration import imtx
+
+
+def checkerboard(grid=9, spacing=500.):
+    g = (np.arange(grid) - (grid - 1) / 2.) * spacing
+    X, Y = np.meshgrid(g, g)
+    return np.stack((X.ravel(), Y.ravel(), np.zeros(X.size)), axis=1)
+
+def grab(poses, noise=0.1, seed=0):
+    """
+    Image points of a checkerboard in two cameras for poses given as (rvec,
+    position (pixels) of the board center in camera 1).
+    """
+    rng = np.random.default_rng(seed)
+    obj = checkerboard()
+    mtx = np.float64(imtx)
+    z = 100000.
+    img1, img2 = [], []
+    for rvec, (u, v) in poses:
+        t = np.array([(u - mtx[0,2]) * z / mtx[0,0], (v - mtx[1,2]) * z / mtx[1,1], z])
+        for img, shift in ((img1, 0.), (img2, 5000.)):
+            p = cv2.projectPoints(obj, np.array(rvec, dtype=np.float64), t + [shift, 0., 0.],
+                                    mtx, None)[0][:,0]
+            img.append(p + rng.normal(0, noise, p.shape))
+    objs = np.repeat(obj[None], len(poses), axis=0).astype(np.float32)
+    return [np.float32(img1), np.float32(img2)], objs
+
+def spread_poses(tilt=0.4):
+    # a 3x3 layout over the frame, every other pose tilted
+    poses = []
+    for i, v in enumerate((600., 1500., 2400.)):
+        for j, u in enumerate((700., 1800., 2900.)):
+            rvec = (tilt, 0., 0.) if (i + j) % 2 else (0., 0., 0.)
+            poses.append((rvec, (u, v)))
+    return poses
+
+def test_board_normal():
+    img_points, obj_points = grab([((0.3, 0., 0.), (2000., 1500.))], noise=0.)
+    n, rms = pose_selection.board_normal(img_points[0][0], obj_points[0])
+    np.testing.assert_allclose(n, [0., -np.sin(0.3), np.cos(0.3)], atol=1e-3)
+    assert rms < 1e-2
+
+def test_few_poses_all_kept():
+    img_points, obj_points = grab(spread_poses()[:4])
+    selected, coverage = pose_selection.select_poses(img_points, obj_points)
+    np.testing.assert_array_equal(selected, np.arange(4))
+    assert coverage == 1.
+
+def test_duplicates_dropped():
+    # the spread poses, then many near-duplicates of the center one
+    poses = spread_poses()
+    rng = np.random.default_rng(1)
+    poses += [((0., 0., 0.), (1800. + rng.normal(0, 5), 1500. + rng.normal(0, 5))) \
+                for i in range(15)]
+    img_points, obj_points = grab(poses)
+    selected, coverage = pose_selection.select_poses(img_points, obj_points)
+    assert np.all(np.diff(selected) > 0)
+    assert coverage >= pose_selection.COVERAGE_TARGET
+    assert pose_selection.MIN_POSES <= len(selected) <= 12
+    # the center is covered COVER_DEPTH deep, not by every duplicate
+    assert np.sum((selected == 4) | (selected >= 9)) <= pose_selection.COVER_DEPTH
+    tilts = pose_selection.pose_features([ipts[selected] for ipts in img_points],
+                                            obj_points[selected])[2]
+    assert np.sum(tilts >= pose_selection.MIN_TILT_DEG) >= pose_selection.MIN_TILTED
+
+def test_noisy_corners_avoided():
+    # three equivalent poses (covering COVER_DEPTH deep takes two): the ones
+    # with clean corners are preferred
+    poses = spread_poses() + [spread_poses()[0]] * 2
+    img_points, obj_points = grab(poses)
+    img_points[0][0] += np.random.default_rng(2).normal(0, 3., img_points[0][0].shape)
+    selected, coverage = pose_selection.select_poses(img_points, obj_points)
+    assert (9 in selected) and (10 in selected) and (0 not in selected)
+
+def test_suggest_region():
+    img_points, obj_points = grab(spread_poses()[:3])   # top row only
+    counts = pose_selection.coverage_map(img_points[0])
+    assert counts.shape == pose_selection.GRID
+    assert pose_selection.suggest_region(counts).startswith('bottom')
@@ -0,0 +1,74 @@
+import numpy as np
+import cv2
+import pytest
+
+from parallax import store
+from parallax.calibration import Calibration
+from parallax.transform import TransformNP
+
+
+def stage_grid_calibration():
+    # single-pose stage grid seen by two cameras ~10 cm away
+    g = np.linspace(-1000, 1000, 3)
+    obj = np.stack(np.meshgrid(g, g, g, indexing='ij'), axis=-1).reshape((-1,3)) + 7500.
+    mtx = np.array([[15500., 0., 2000.], [0., 15500., 1500.], [0., 0., 1.]])
+    img = []
+    for r, t in (((0.3, -0.2, 0.05), (0., 0., 100000.)),
+                    ((0.3, 0.2, 0.05), (-40000., 0., 100000.))):
+        t = np.array(t) - cv2.Rodrigues(np.array(r))[0] @ obj.mean(axis=0)
+        img.append(cv2.projectPoints(obj, np.array(r), t, mtx, None)[0][:,0])
+    cal = Calibration('cal', 'stage')
+    cal.calibrate(np.float32(img[0])[None], np.float32(img[1])[None], np.float32(obj)[None])
+    return cal
+
+def test_calibration_round_trip(tmp_path):
+    cal = stage_grid_calibration()
+    filename = tmp_path / 'cal.npz'
+    store.save(cal, filename)
+    loaded = store.load(filename)
+    assert type(loaded) is Calibration
+    assert (loaded.name, loaded.cs) == ('cal', 'stage')
+    for key in ('mtx1', 'mtx2', 'dist1', 'dist2', 'offset', 'obj_points', 'img_points1'):
+        np.testing.assert_array_equal(getattr(loaded, key), getattr(cal, key))
+    assert isinstance(loaded.rvecs1, tuple) and len(loaded.rvecs1) == cal.npose
+    np.testing.assert_array_equal(loaded.rvecs1[0], cal.rvecs1[0])
+    assert loaded.rmse == cal.rmse
+    # the loaded calibration triangulates like the original
+    pts = cal.img_points1[0,:5], cal.img_points2[0,:5]
+    np.testing.assert_allclose(loaded.triangulate_many(*pts), cal.triangulate_many(*pts))
+
+def test_lazy_array_of_deleted_file(tmp_path):
+    filename = tmp_path / 'cal.npz'
+    store.save(stage_grid_calibration(), filename)
+    loaded = store.load(filename)
+    filename.unlink()
+    with pytest.raises(AttributeError, match='obj_points'):
+        loaded.obj_points
+    assert getattr(loaded, 'img_points1', None) is None
+    assert loaded.mtx1.shape == (3,3)
+
+def test_transform_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    rot = cv2.Rodrigues(np.array([0.1, -0.2, 0.3]))[0]
+    ori = np.array([100., -200., 300.])
+    from_points = rng.uniform(-2000, 2000, (10,3))
+    transform = TransformNP('t', 'stage', 'cal')
+    transform.compute_from_correspondence(from_points, (from_points + ori) @ rot)
+    filename = tmp_path / 't.npz'
+    store.save(transform, filename)
+    loaded = store.load(filename)
+    assert type(loaded) is TransformNP
+    assert (loaded.from_cs, loaded.to_cs) == ('stage', 'cal')
+    np.testing.assert_array_equal(loaded.rot, transform.rot)
+    np.testing.assert_array_equal(loaded.map(from_points), transform.map(from_points))
+
+def test_unknown_kind(tmp_path):
+    filename = tmp_path / 'x.npz'
+    np.savez(filename, __format__=np.array(store.FORMAT), __version__=np.array(store.VERSION),
+                __kind__=np.array('Probe'))
+    with pytest.raises(ValueError, match='unknown kind'):
+        store.load(filename)
+
+def test_unsupported_type(tmp_path):
+    with pytest.raises(TypeError):
+        store.save(object(), tmp_path / 'x.npz')
@@ -0,0 +1,72 @@
+import numpy as np
+import cv2
+import pytest
+
+from parallax import triangulation
+
+
+def stereo_pair():
+    # projection matrices of two cameras ~10 cm from a 2 mm volume
+    mtx = np.array([[15000., 0., 2000.], [0., 15000., 1500.], [0., 0., 1.]])
+    Ps = []
+    for r, t in (((0., -0.2, 0.), (0., 0., 100000.)), ((0., 0.2, 0.), (0., 0., 100000.))):
+        R = cv2.Rodrigues(np.array(r))[0]
+        Ps.append(mtx @ np.concatenate((R, np.array(t)[:,None]), axis=1))
+    return Ps
+
+def project(P, X):
+    x = np.concatenate((X, np.ones((len(X),1))), axis=1) @ P.T
+    return x[:,:2] / x[:,2:]
+
+@pytest.mark.parametrize('method', sorted(triangulation.METHODS))
+def test_exact_points(method):
+    P1, P2 = stereo_pair()
+    X = np.random.default_rng(0).uniform(-1000, 1000, (50,3))
+    Y = triangulation.triangulate(P1, P2, project(P1, X), project(P2, X), method)
+    assert Y.shape == X.shape
+    np.testing.assert_allclose(Y, X, atol=1e-3)
+
+@pytest.mark.parametrize('method', sorted(triangulation.METHODS))
+def test_noisy_points(method):
+    rng = np.random.default_rng(1)
+    P1, P2 = stereo_pair()
+    X = rng.uniform(-1000, 1000, (200,3))
+    x1 = project(P1, X) + rng.normal(0, 0.5, (200,2))
+    x2 = project(P2, X) + rng.normal(0, 0.5, (200,2))
+    Y = triangulation.triangulate(P1, P2, x1, x2, method)
+    # ~7 um per pixel at this distance, worse along the optical axes
+    assert np.sqrt(np.mean(np.sum((Y - X)**2, axis=1))) < 30.
+
+def test_iterative_minimizes_reprojection():
+    rng = np.random.default_rng(2)
+    P1, P2 = stereo_pair()
+    X = rng.uniform(-1000, 1000, (100,3))
+    x1 = project(P1, X) + rng.normal(0, 0.5, (100,2))
+    x2 = project(P2, X) + rng.normal(0, 0.5, (100,2))
+    def reprojection(Y):
+        return np.sum((project(P1, Y) - x1)**2 + (project(P2, Y) - x2)**2, axis=1)
+    e_linear = reprojection(triangulation.linear(P1, P2, x1, x2))
+    e_iterative = reprojection(triangulation.iterative(P1, P2, x1, x2))
+    assert np.all(e_iterative <= e_linear + 1e-9)
+
+def test_refine_missing_views():
+    # a point seen by only two of three cameras is still refined
+    P1, P2 = stereo_pair()
+    X = np.array([[100., -200., 300.]])
+    Ps = np.stack((P1, P2, P1))
+    img = np.stack((project(P1, X), project(P2, X), np.full((1,2), np.nan)))
+    Y = triangulation.refine(Ps, img, X + 50.)
+    np.testing.assert_allclose(Y, X, atol=1e-3)
+
+def test_fundamental_matrix():
+    P1, P2 = stereo_pair()
+    X = np.random.default_rng(3).uniform(-1000, 1000, (20,3))
+    x1 = np.concatenate((project(P1, X), np.ones((20,1))), axis=1)
+    x2 = np.concatenate((project(P2, X), np.ones((20,1))), axis=1)
+    F = triangulation.fundamental_matrix(P1, P2)
+    np.testing.assert_allclose(np.sum((x2 @ F) * x1, axis=1), 0., atol=1e-6)
+
+def test_unknown_method():
+    P1, P2 = stereo_pair()
+    with pytest.raises(ValueError):
+        triangulation.triangulate(P1, P2, np.zeros((1,2)), np.zeros((1,2)), 'nearest')
@@ -0,0 +1,56 @@
+import numpy as np
+
+from parallax import waypoints
+
+
+def grid(n=4, step=1000., origin=(7500., 7500., 7500.)):
+    g = np.arange(n) * step
+    return np.stack(np.meshgrid(g, g, g, indexing='ij'), axis=-1).reshape((-1,3)) + origin
+
+def is_permutation(order, n):
+    return np.array_equal(np.sort(order), np.arange(n))
+
+def test_grid_is_serpentine():
+    rng = np.random.default_rng(0)
+    points = rng.permutation(grid())
+    order = waypoints.plan_order(points)
+    assert is_permutation(order, len(points))
+    # consecutive points differ along one axis, by one grid step
+    steps = np.abs(np.diff(points[order], axis=0))
+    assert np.all(np.count_nonzero(steps, axis=1) == 1)
+    assert np.all(steps.max(axis=1) == 1000.)
+
+def test_slowest_axis_changes_least():
+    points = grid(3)
+    order = waypoints.plan_order(points, speeds=(2., 2., 0.5))
+    changes = np.count_nonzero(np.diff(points[order], axis=0), axis=0)
+    assert changes[2] == 2
+
+def test_random_points_shorter_than_naive():
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 15000, (60,3))
+    start = np.array([0., 0., 0.])
+    order = waypoints.plan_order(points, start=start)
+    assert is_permutation(order, len(points))
+    naive = waypoints.route_time(points, np.arange(len(points)), start)
+    assert waypoints.route_time(points, order, start) < 0.5 * naive
+
+def test_two_opt_never_longer():
+    rng = np.random.default_rng(2)
+    points = rng.uniform(0, 15000, (40,3))
+    times = waypoints.travel_times(points, points)
+    greedy = waypoints.nearest_neighbor_order(times)
+    improved = waypoints.two_opt(greedy, times)
+    assert improved[0] == greedy[0]
+    assert waypoints.route_time(points, improved) <= waypoints.route_time(points, greedy)
+
+def test_safe_moves():
+    # moves ending above z_safe retract and move one axis at a time
+    times = waypoints.travel_times([[0., 0., 0.]], [[100., 200., 1000.]], z_safe=500.)
+    assert times[0,0] == 500. + 500. + 100. + 200.
+    times = waypoints.travel_times([[0., 0., 0.]], [[100., 200., 300.]], z_safe=500.)
+    assert times[0,0] == 300.
+
+def test_small_sets():
+    assert len(waypoints.plan_order(np.zeros((0,3)))) == 0
+    np.testing.assert_array_equal(waypoints.plan_order([[1., 2., 3.]]), [0])
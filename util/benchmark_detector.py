@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import csv
+import json
+import time
+import inspect
+import platform
+import argparse
+from time import perf_counter
+
+import numpy as np
+import cv2
+
+# import parallax from local path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_labels_csv(filename):
+    # metadata.csv as written by TrainingWorker: basename, x, y (images alongside)
+    dirname = os.path.dirname(os.path.abspath(filename))
+    labels = []
+    with open(filename, 'r') as f:
+        reader = csv.reader(f, delimiter=',')
+        for row in reader:
+            basename_img, ix, iy = row
+            filename_img = os.path.join(dirname, basename_img)
+            if os.path.exists(filename_img):
+                labels.append((filename_img, [(float(ix), float(iy))]))
+    return labels
+
+
+def load_labels_slp(filename):
+    import sleap
+    labels = []
+    for i, lf in enumerate(sleap.load_file(filename).labeled_frames):
+        instances = lf.user_instances if lf.user_instances else lf.instances
+        tips = [(inst.points[0].x, inst.points[0].y) for inst in instances]
+        labels.append((lambda lf=lf: lf.image, tips))
+    return labels
+
+
+def load_frame(source):
+    if callable(source):
+        return np.asarray(source())
+    return cv2.imread(source)
+
+
+def match_tips(tips_true, tips_detected, max_dist):
+    # greedy nearest-neighbor assignment of detections to ground truth tips
+    errors = []
+    nmiss = 0
+    available = [np.array(t, dtype=np.float64) for t in tips_detected]
+    for tip in tips_true:
+        if not available:
+            nmiss += 1
+            continue
+        d = [np.linalg.norm(np.array(tip) - t) for t in available]
+        k = int(np.argmin(d))
+        if d[k] <= max_dist:
+            errors.append(d[k])
+            available.pop(k)
+        else:
+            nmiss += 1
+    return errors, nmiss, len(available)
+
+
+def percentiles(values, qs=(50, 90, 95, 99)):
+    if len(values) == 0:
+        return {('p%d' % q): None for q in qs}
+    return {('p%d' % q): float(np.percentile(values, q)) for q in qs}
+
+
+def get_detector_class(name):
+    from parallax import detectors
+    for _, obj in inspect.getmembers(detectors):
+        if inspect.isclass(obj) and (obj.__module__ == 'parallax.detectors'):
+            if name in (obj.__name__, getattr(obj, 'name', None)):
+                return obj
+    raise ValueError('unknown detector: %s' % name)
+
+
+def run_benchmark(detector, labels, max_dist, warmup=0):
+    if warmup and labels:
+        frame = load_frame(labels[0][0])
+        for i in range(warmup):
+            detector.detect(frame)
+    latencies = []
+    errors = []
+    ntips = nmiss = nfalse = 0
+    records = []
+    for source, tips_true in labels:
+        frame = load_frame(source)
+        t0 = perf_counter()
+        tips_detected = detector.detect(frame)
+        dt = perf_counter() - t0
+        latencies.append(dt)
+        errs, m, fp = match_tips(tips_true, tips_detected, max_dist)
+        errors.extend(errs)
+        ntips += len(tips_true)
+        nmiss += m
+        nfalse += fp
+        records.append({
+            'source': source if isinstance(source, str) else None,
+            'latency_ms': dt * 1e3,
+            'ndetected': len(tips_detected),
+            'errors_px': errs,
+            'nmiss': m,
+        })
+    latencies_ms = np.array(latencies) * 1e3
+    errors = np.array(errors)
+    summary = {
+        'nframes': len(labels),
+        'ntips': ntips,
+        'throughput_fps': len(labels) / float(np.sum(latencies)) if latencies else None,
+        'latency_ms': dict(mean=float(np.mean(latencies_ms)) if len(latencies_ms) else None,
+                            max=float(np.max(latencies_ms)) if len(latencies_ms) else None,
+                            **percentiles(latencies_ms)),
+        'error_px': dict(mean=float(np.mean(errors)) if len(errors) else None,
+                            rms=float(np.sqrt(np.mean(errors**2))) if len(errors) else None,
+                            max=float(np.max(errors)) if len(errors) else None,
+                            **percentiles(errors)),
+        'miss_rate': nmiss / ntips if ntips else None,
+        'false_positives_per_frame': nfalse / len(labels) if labels else None,
+    }
+    return summary, records
+
+
+def get_environment():
+    import parallax
+    return {
+        'parallax_version': parallax.__version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy_version': np.__version__,
+        'opencv_version': cv2.__version__,
+    }
+
+
+if __name__ == '__main__':
+
+    # parse args
+    parser = argparse.ArgumentParser(prog='benchmark_detector.py',
+                                description='benchmark a Parallax detector against labeled frames')
+    parser.add_argument('labels', help='labeled frames: training metadata file (.csv) '
+                                        'or SLEAP labels file (.slp)')
+    parser.add_argument('-d', '--detector', default='SLEAP',
+                        help='detector class or display name (default: SLEAP)')
+    parser.add_argument('-m', '--model', nargs='+', default=[],
+                        help='model path(s) passed to the detector\'s load_model()')
+    parser.add_argument('--max-dist', type=float, default=20.,
+                        help='max distance (px) for a detection to count as a hit')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed warmup iterations')
+    parser.add_argument('-n', '--nframes', type=int, default=None,
+                        help='only use the first N labeled frames')
+    parser.add_argument('-o', '--output', help='write results to this file (.json)')
+    parser.add_argument('--per-frame', action='store_true',
+                        help='include per-frame records in the output file')
+
+    args = parser.parse_args()
+
+    if args.labels.endswith('.slp'):
+        labels = load_labels_slp(args.labels)
+    else:
+        labels = load_labels_csv(args.labels)
+    if args.nframes is not None:
+        labels = labels[:args.nframes]
+
+    # detectors build Qt widgets, so we need an application (but no display)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication([])
+
+    cls = get_detector_class(args.detector)
+    detector = cls()
+    if args.model:
+        detector.load_model(*args.model)
+
+    summary, records = run_benchmark(detector, labels, args.max_dist, warmup=args.warmup)
+    detector.clean()
+
+    results = {
+        'detector': cls.name,
+        'labels': os.path.abspath(args.labels),
+        'model': args.model,
+        'max_dist_px': args.max_dist,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': get_environment(),
+        'summary': summary,
+    }
+    if args.per_frame:
+        results['frames'] = records
+
+    lat = summary['latency_ms']
+    err = summary['error_px']
+    fmt = lambda v: 'n/a' if v is None else '%.2f' % v
+    print('Detector: %s (%d frames, %d tips)' % (cls.name, summary['nframes'], summary['ntips']))
+    print('---------------------')
+    print('\tthroughput (fps): ', fmt(summary['throughput_fps']))
+    print('\tlatency (ms):      mean %s, p50 %s, p90 %s, p99 %s' % \
+            (fmt(lat['mean']), fmt(lat['p50']), fmt(lat['p90']), fmt(lat['p99'])))
+    print('\terror (px):        mean %s, p50 %s, p90 %s, p95 %s, max %s' % \
+            (fmt(err['mean']), fmt(err['p50']), fmt(err['p90']), fmt(err['p95']), fmt(err['max'])))
+    print('\tmiss rate:        ', fmt(summary['miss_rate']))
+    print('\tfalse pos/frame:  ', fmt(summary['false_positives_per_frame']))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        print('Results written to: %s' % args.output)
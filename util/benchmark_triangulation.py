@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+# import parallax from local path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallax import store
+from parallax import lib
+from parallax import triangulation
+
+
+def load_accutest(filenames):
+    # accuracy test files (.npy) as written by AccuracyTestWorker: rows of
+    # stage x, y, z, left x, y, right x, y
+    data = np.concatenate([np.load(f).reshape((-1,7)) for f in filenames], axis=0)
+    return data[:,:3], data[:,3:5], data[:,5:7]
+
+
+def reprojection_rms(cal, points, lpts, rpts):
+    # RMS reprojection error (pixels, undistorted) over both views
+    lpts_ud, rpts_ud = cal.undistort(lpts, rpts)
+    proj, _ = lib.projection_jacobians(np.stack(cal.get_projection_matrices()),
+                                        points - cal.offset)
+    res = proj - np.stack((lpts_ud, rpts_ud))
+    return float(np.sqrt(np.mean(np.sum(res*res, axis=-1))))
+
+
+def run_benchmark(cal, coords_stage, lpts, rpts, transform=None, fit=False, repeat=5):
+    results = {}
+    for method in triangulation.METHODS:
+        cal.set_triangulation_method(method)
+        cal.triangulate_many(lpts[:1], rpts[:1])    # warmup
+        times = []
+        for i in range(repeat):
+            t0 = perf_counter()
+            coords_recon = cal.triangulate_many(lpts, rpts)
+            times.append(perf_counter() - t0)
+        rms_reproj = reprojection_rms(cal, coords_recon, lpts, rpts)
+        if transform is not None:
+            coords_recon = np.array([transform.map(c) for c in coords_recon])
+        elif fit:
+            # best rigid fit, to compare methods independent of a transform
+            rot, ori = lib.rigid_fit(coords_recon, coords_stage)
+            coords_recon = (coords_recon + ori) @ rot
+        ds = np.linalg.norm(coords_recon - coords_stage, axis=1)
+        times_ms = np.array(times) * 1e3
+        results[method] = {
+            'time_ms': dict(mean=float(np.mean(times_ms)), min=float(np.min(times_ms))),
+            'time_per_point_us': float(np.min(times_ms)) * 1e3 / len(lpts),
+            'error_um': dict(rms=float(np.sqrt(np.mean(ds**2))), mean=float(np.mean(ds)),
+                                p90=float(np.percentile(ds, 90)), max=float(np.max(ds))),
+            'reprojection_rms_px': rms_reproj,
+        }
+    return results
+
+
+if __name__ == '__main__':
+
+    # parse args
+    parser = argparse.ArgumentParser(prog='benchmark_triangulation.py',
+                                description='compare the speed and accuracy of the triangulation '
+                                            'methods on accuracy test data')
+    parser.add_argument('calibration', help='calibration file (.npz or .pkl)')
+    parser.add_argument('accutest', nargs='+', help='accuracy test file(s) (.npy)')
+    parser.add_argument('-t', '--transform',
+                        help='transform from the calibration to stage coordinates (.npz or .pkl)')
+    parser.add_argument('--fit', action='store_true',
+                        help='without a transform, rigidly fit the reconstruction to the stage')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='timed repetitions per method')
+    parser.add_argument('-o', '--output', help='write results to this file (.json)')
+
+    args = parser.parse_args()
+
+    cal = store.load(args.calibration)
+    transform = store.load(args.transform) if args.transform else None
+    coords_stage, lpts, rpts = load_accutest(args.accutest)
+
+    results = run_benchmark(cal, coords_stage, lpts, rpts, transform=transform, fit=args.fit,
+                            repeat=args.repeat)
+
+    print('Triangulation: %s (%d points)' % (cal.name, len(lpts)))
+    print('---------------------')
+    print('\t%-10s %12s %12s %12s %12s' % ('method', 'time (ms)', 'rms (um)', 'max (um)',
+                                            'reproj (px)'))
+    for method, r in results.items():
+        print('\t%-10s %12.3f %12.2f %12.2f %12.3f' % (method, r['time_ms']['min'],
+                r['error_um']['rms'], r['error_um']['max'], r['reprojection_rms_px']))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'calibration': os.path.abspath(args.calibration),
+                'accutest': [os.path.abspath(f) for f in args.accutest],
+                'transform': os.path.abspath(args.transform) if args.transform else None,
+                'npoints': len(lpts),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=4)
+        print('Results written to: %s' % args.output)
@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+
+# import parallax from local path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallax.tip_model import export_model
+
+
+if __name__ == '__main__':
+
+    # parse args
+    parser = argparse.ArgumentParser(prog='export_tip_model.py',
+                                description='export a trained SLEAP model for CPU inference '
+                                            '(requires tensorflow and tf2onnx)')
+    parser.add_argument('centroid', help='centroid model directory')
+    parser.add_argument('instance', help='instance model directory')
+    parser.add_argument('output', help='output directory')
+    parser.add_argument('--opset', type=int, default=13, help='ONNX opset (default: 13)')
+    args = parser.parse_args()
+
+    export_model(args.centroid, args.instance, args.output, opset=args.opset)
+    print('Model exported to: %s' % args.output)
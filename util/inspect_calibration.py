@@ -1,20 +1,40 @@
 #!/usr/bin/python3
 
-import pickle
+import os
+import sys
 import argparse
 
+# import parallax from local path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallax import store
+
 
 if __name__ == '__main__':
 
     # parse args
     parser = argparse.ArgumentParser(prog='inspect_calibration.py',
                                 description='print the parameters from a Parallax calibation file')
-    parser.add_argument('filename', help='the filename of the calibration file (.pkl)')
+    parser.add_argument('filename', help='the filename of the calibration file (.npz or .pkl)')
 
     args = parser.parse_args()
 
-    with open(args.filename, 'rb') as f:
-        cal = pickle.load(f)
+    cal = store.load(args.filename)
+
+    if hasattr(cal, 'ncam'):
+        # N-camera calibration
+        for c in range(cal.ncam):
+            print('Camera %d' % (c+1))
+            print('---------------------')
+            print('\tIntrinsics:')
+            print('\t\t', cal.mtx[c])
+            print('\t\t', cal.dist[c])
+            print('\tExtrinsics:')
+            print('\t\t', cal.rvecs[c,-1].ravel(), cal.tvecs[c,-1].ravel())
+            print('\tReprojection RMSE (pixels):')
+            print('\t\t', cal.rmse_reproj[c])
+            print()
+        sys.exit(0)
 
     print('Intrinsic Parameters')
     print('---------------------')
@@ -29,8 +49,25 @@ if __name__ == '__main__':
     print('Extrinsic Parameters')
     print('---------------------')
     print('\tCamera 1:')
-    print('\t\t', cal.projs1[0])
+    print('\t\t', cal.rvecs1[-1].ravel(), cal.tvecs1[-1].ravel())
+    print()
+    print('\tCamera 2:')
+    print('\t\t', cal.rvecs2[-1].ravel(), cal.tvecs2[-1].ravel())
+    print()
+    if hasattr(cal, 'R'):
+        print('Stereo Parameters')
+        print('---------------------')
+        print('\tR:')
+        print('\t\t', cal.R)
+        print('\tT:')
+        print('\t\t', cal.T.ravel())
+        print()
+    P1, P2 = cal.get_projection_matrices()
+    print('Projection Matrices')
+    print('---------------------')
+    print('\tCamera 1:')
+    print('\t\t', P1)
     print()
     print('\tCamera 2:')
-    print('\t\t', cal.projs2[0])
+    print('\t\t', P2)
     print()
@@ -1,20 +1,25 @@
 #!/usr/bin/python3
 
-import pickle
+import os
+import sys
 import argparse
 
+# import parallax from local path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallax import store
+
 
 if __name__ == '__main__':
 
     # parse args
     parser = argparse.ArgumentParser(prog='inspect_intrinsics.py',
                                 description='print the parameters from a Parallax intrinsics file')
-    parser.add_argument('filename', help='the filename of the intrinsics file (.pkl)')
+    parser.add_argument('filename', help='the filename of the intrinsics file (.npz or .pkl)')
 
     args = parser.parse_args()
 
-    with open(args.filename, 'rb') as f:
-        cal = pickle.load(f)
+    cal = store.load(args.filename)
 
     print('Intrinsic Parameters')
     print('---------------------')
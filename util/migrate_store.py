@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+
+# import parallax from local path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallax import store
+
+
+if __name__ == '__main__':
+
+    # parse args
+    parser = argparse.ArgumentParser(prog='migrate_store.py',
+                                description='convert pickled Parallax calibrations, intrinsics '
+                                            'and transforms to the .npz store format')
+    parser.add_argument('filenames', nargs='+', help='pickle files (.pkl)')
+    args = parser.parse_args()
+
+    for filename in args.filenames:
+        filename_out = os.path.splitext(filename)[0] + '.npz'
+        try:
+            obj = store.migrate(filename, filename_out)
+        except (TypeError, AttributeError) as e:
+            print('Skipped %s: %s' % (filename, e))
+            continue
+        print('%s (%s) -> %s' % (filename, type(obj).__name__, filename_out))